@@ -31,5 +31,5 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 from .exceptions import *
-from .requester import Requester
+from .requester import Requester, RequesterPool
 from .scheduler import Scheduler
@@ -0,0 +1,232 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (C) 2014, Jack O'Quin
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the author nor of other contributors may be
+#    used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+.. module:: async_requester
+
+Asyncio interface for ROCON services making scheduler requests.
+
+An :class:`.AsyncRequester` wraps a normal :class:`.Requester`, so
+each resource request can be awaited from an :mod:`asyncio` event
+loop, instead of polling the request set from another thread::
+
+    rqr = AsyncRequester()
+    try:
+        rid = await rqr.request([bot])
+    except RequestLostError:
+        # ... preempted or closed before it was granted ...
+    else:
+        # ... use the robot ...
+        rqr.release(rid)
+
+Scheduler feedback still arrives in a ROS thread, holding the
+:ref:`Big Requester Lock <Big_Requester_Lock>`.  The outcome of each
+request is handed over to the event loop, and every future is
+completed in the loop's own thread.  One loop can drive many
+concurrent request workflows, without a thread for each one.
+
+This module requires :mod:`asyncio` (Python 3.4 or later), or the
+trollius_ backport.
+
+.. _trollius: https://pypi.python.org/pypi/trollius
+
+"""
+
+# enable some python3 compatibility options:
+from __future__ import absolute_import, print_function, unicode_literals
+
+try:
+    import asyncio
+except ImportError:                     # Python 2
+    import trollius as asyncio
+
+# ROS messages
+from scheduler_msgs.msg import Request
+
+# internal modules
+from . import RequestLostError
+from .requester import Requester
+
+
+def _running_loop():
+    """ :returns: event loop running in the current thread. """
+    get_running_loop = getattr(asyncio, 'get_running_loop', None)
+    if get_running_loop is None:        # before Python 3.7, or trollius
+        return asyncio.get_event_loop()
+    return get_running_loop()
+
+
+class AsyncRequester:
+    """
+    This class provides awaitable scheduler requests for an
+    :mod:`asyncio` event loop.
+
+    :param loop: Event loop for completing request futures, or
+                 ``None`` for the loop running the first
+                 :py:meth:`request` call.
+
+    All other keyword arguments are passed to the underlying
+    :class:`.Requester`, except its *feedback* function, which this
+    class supplies.  That function cancels any pending request the
+    scheduler starts preempting, as described for :py:meth:`request`.
+
+    """
+
+    def __init__(self, loop=None, **kwargs):
+        """ Constructor. """
+        self.loop = loop
+        """ :mod:`asyncio` event loop completing request futures, or
+        ``None`` until the first :py:meth:`request`. """
+        self._futures = {}      # pending futures, by request UUID
+        self._closed = False
+        self.requester = Requester(self._feedback, **kwargs)
+        """ Underlying :class:`.Requester` object. """
+        self.lock = self.requester.lock
+        """ :ref:`Big Requester Lock <Big_Requester_Lock>`. """
+
+    def _feedback(self, rset):
+        """ Scheduler feedback function, holding the Big Requester Lock.
+
+        Decides the outcome of every pending request, passing the
+        results to the event loop.
+        """
+        for rid in list(self._futures.keys()):
+            rq = rset.get(rid)
+            if rq is None:              # vanished: treat it as CLOSED
+                status = Request.CLOSED
+            else:
+                status = rq.msg.status
+            if status == Request.GRANTED:
+                self.loop.call_soon_threadsafe(
+                    self._settle, self._futures.pop(rid), rid, None)
+            elif status in (Request.PREEMPTING, Request.CLOSED):
+                if status == Request.PREEMPTING:
+                    rq.cancel()         # release it immediately
+                error = RequestLostError(
+                    'request ' + str(rid) + ' lost, status: ' + str(status))
+                self.loop.call_soon_threadsafe(
+                    self._settle, self._futures.pop(rid), rid, error)
+
+    def _settle(self, future, rid, error):
+        """ Complete a request future, in the event loop thread. """
+        if future.done():               # already cancelled?
+            return
+        if error is None:
+            future.set_result(rid)
+        else:
+            future.set_exception(error)
+
+    def _cancelled(self, rid, future):
+        """ Future done callback, in the event loop thread. """
+        if future.cancelled():
+            self.release(rid)
+
+    def close(self):
+        """ Cancel every pending request future, and stop sending
+        heartbeat messages to the scheduler.
+
+        Later :py:meth:`release` calls, including those from the
+        cancelled futures, do nothing, so no messages are sent after
+        closing.  Closing again does nothing.
+        """
+        with self.lock:
+            if self._closed:
+                return
+            self._closed = True
+            futures = list(self._futures.values())
+            self._futures.clear()
+            self.requester.cancel_all()
+            self.requester.send_requests()
+            self.requester._unregister()
+        for future in futures:
+            self.loop.call_soon_threadsafe(future.cancel)
+
+    def release(self, uuid):
+        """ Cancel a request, whether or not it was granted.
+
+        :param uuid: UUID_ of the request.
+        :type uuid: :class:`uuid.UUID`
+
+        Any pending future for this request is abandoned.  Releasing a
+        request no longer known, or after :py:meth:`close`, does
+        nothing.
+
+        .. _UUID: http://en.wikipedia.org/wiki/Uuid
+        """
+        with self.lock:
+            if self._closed:            # already canceled and sent
+                return
+            self._futures.pop(uuid, None)
+            rq = self.requester.rset.get(uuid)
+            if rq is not None:
+                rq.cancel()
+                self.requester.send_requests()
+
+    def request(self, resources, **kwargs):
+        """ Make a new scheduler request, and wait for it.
+
+        :param resources: ROCON resources requested
+        :type resources: list of scheduler_msgs/Resource
+
+        Other keyword arguments, such as *uuid* or *priority*, are
+        passed to :py:meth:`.Requester.new_request`.
+
+        :returns: :class:`asyncio.Future` resolving to the request's
+            UUID (:class:`uuid.UUID`) when it is GRANTED.  The granted
+            resources are then available from :py:attr:`.requester`
+            ``.rset``.
+        :raises: :exc:`.RequestLostError` (via the future) if the
+            request is preempted or closed first.
+        :raises: :exc:`.WrongRequestError` if request already exists.
+
+        The new request is sent to the scheduler immediately.
+        Cancelling the future also cancels the request.
+
+        If the scheduler starts preempting the request before granting
+        it, the request is canceled right away, releasing it, and the
+        future raises :exc:`.RequestLostError`.  Once the future has
+        resolved, the caller must watch for preemption itself.
+
+        Unless an event loop was passed to the constructor, the first
+        call must come from a coroutine or callback running in the
+        loop, which then completes every request future.
+
+        """
+        with self.lock:
+            if self.loop is None:
+                self.loop = _running_loop()
+            future = asyncio.Future(loop=self.loop)
+            uuid = self.requester.new_request(resources, **kwargs)
+            self._futures[uuid] = future
+            self.requester.send_requests()
+        future.add_done_callback(lambda f: self._cancelled(uuid, f))
+        return future
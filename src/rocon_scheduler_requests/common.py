@@ -47,6 +47,18 @@ from __future__ import absolute_import, print_function
 HEARTBEAT_HZ = 1.0 / 4.0
 """ Default requester heartbeat frequency (Hz)."""
 
+IDLE_HEARTBEAT_FACTOR = 1.0 / 4.0
+""" Heartbeat frequency multiplier for idle requesters, when the
+scheduler supports adaptive heartbeats. """
+
+MISSED_HEARTBEATS = 4.0
+""" Number of heartbeat periods without any message, after which the
+scheduler assumes a requester has gone away. """
+
+HEARTBEAT_JITTER = 0.1
+""" Maximum fraction of the heartbeat period randomly removed from
+each one, so requesters do not stay synchronized. """
+
 SCHEDULER_TOPIC = 'rocon_scheduler'
 """ Default ROCON scheduler topic name. """
 
@@ -64,3 +76,50 @@ def feedback_topic(uuid, scheduler_topic=SCHEDULER_TOPIC):
 
     """
     return scheduler_topic + '_' + uuid.hex
+
+
+def shared_feedback_topic(scheduler_topic=SCHEDULER_TOPIC):
+    """ Construct shared scheduler feedback topic name.
+
+    :param topic: Topic name for the corresponding scheduler. If
+                  missing, the usual scheduler topic name is assumed.
+    :type topic: str
+    :returns: Topic name string for replying to all requesters using
+              shared feedback.
+
+    """
+    return scheduler_topic + '_feedback'
+
+
+def decode_frame(frame_id):
+    """ Decode protocol options from a message header ``frame_id``.
+
+    Plain ``scheduler_msgs/SchedulerRequests`` messages leave the
+    header ``frame_id`` empty.  Optional protocol extensions store a
+    space-separated list of ``name=value`` options there, which older
+    requesters and schedulers ignore.
+
+    :param frame_id: Header ``frame_id`` string of a message.
+    :type frame_id: str
+    :returns: Dictionary of option value strings, indexed by name.
+        Empty for a plain message.
+
+    """
+    options = {}
+    for token in frame_id.split():
+        name, _, value = token.partition('=')
+        options[name] = value
+    return options
+
+
+def encode_frame(options):
+    """ Encode protocol options as a message header ``frame_id``.
+
+    :param options: Dictionary of option value strings, indexed by
+        name.  Names and values must not contain white space.
+    :type options: dict
+    :returns: Header ``frame_id`` string for those options.
+
+    """
+    return ' '.join([name + '=' + options[name]
+                     for name in sorted(options)])
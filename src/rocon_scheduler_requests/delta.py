@@ -0,0 +1,258 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (C) 2014, Jack O'Quin
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the author nor of other contributors may be
+#    used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+.. module:: delta
+
+This module implements the optional delta protocol for sending
+`scheduler_msgs/SchedulerRequests`_ messages between a requester and
+the scheduler.
+
+Normally, every message contains the complete set of requests, even
+when nothing has changed.  With the delta protocol, each side sends a
+complete snapshot first, then only the requests added or changed since
+its previous message, plus the UUIDs of any that were removed.  Every
+message carries a sequence number.  When the receiver detects a gap,
+it asks the sender for a new snapshot.
+
+The protocol options are stored in the header ``frame_id`` of each
+message (see :py:func:`.common.encode_frame`):
+
+ * ``seq``: message sequence number.
+ * ``mode``: either ``full`` for a complete snapshot, or ``delta``
+   for changes only.
+ * ``removed``: comma-separated hexadecimal UUIDs of deleted requests
+   (``delta`` mode only).
+ * ``resync``: present when the sender wants a complete snapshot.
+
+A requester only sends deltas after it has received feedback from a
+scheduler supporting this protocol.  The scheduler only sends deltas to
+requesters that sent them, so both sides interoperate with peers that
+do not support it.
+
+Changes are detected using the :py:attr:`.RequestBase.generation`
+counter of each request.  Any code modifying request message fields
+directly, rather than via the transition methods, must call
+:py:meth:`.RequestBase.touch` so the change will be sent.
+
+.. _`scheduler_msgs/SchedulerRequests`:
+    http://docs.ros.org/api/scheduler_msgs/html/msg/SchedulerRequests.html
+
+"""
+
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+import uuid
+
+from . import common
+from .transitions import RequestSet, ResourceRequest
+
+
+class DeltaChannel:
+    """
+    This class tracks the delta protocol state for messages flowing
+    in both directions between one requester and the scheduler.
+
+    *Not for general use.*
+
+    :param enabled: ``True`` if this side may send deltas to a peer
+        that supports them, ``False`` for plain messages only.
+    :type enabled: bool
+
+    """
+
+    def __init__(self, enabled=True):
+        """ Constructor. """
+        self.enabled = enabled
+        """ ``True`` if this side uses the delta protocol. """
+        self.peer = False
+        """ ``True`` if the peer sent delta protocol messages. """
+        self.full_next = True
+        """ ``True`` if the next message must be a complete snapshot. """
+        self.resync_wanted = False
+        """ ``True`` if a complete snapshot is needed from the peer. """
+        self.in_seq = None
+        """ Sequence number of last message received, or ``None``. """
+        self.out_seq = 0
+        """ Sequence number of last message sent. """
+        self.sent = {}
+        """ Generation of each request, as last sent to the peer. """
+
+    def outgoing(self, rset, stamp=None, options=None):
+        """ Construct next message for the peer.
+
+        :param rset: Current requests.
+        :type rset: :class:`.RequestSet`
+        :param stamp: Time stamp for message header. If ``None``, use
+            current time.
+        :type stamp: rospy.Time
+        :param options: Other protocol options to send, if any.
+        :type options: dict
+
+        :returns: corresponding ``scheduler_msgs/SchedulerRequests``
+
+        """
+        options = dict(options or {})
+        if not self.enabled:
+            msg = rset.to_msg(stamp)
+            msg.header.frame_id = common.encode_frame(options)
+            return msg
+        self.out_seq += 1
+        options['seq'] = str(self.out_seq)
+        if self.resync_wanted:
+            options['resync'] = '1'
+            self.resync_wanted = False
+        if self.full_next or not self.peer:
+            msg = rset.to_msg(stamp)
+            options['mode'] = 'full'
+            self.sent = {}
+            for rid, rq in rset.items():
+                self.sent[rid] = rq.generation
+            self.full_next = False
+        else:
+            changed = []
+            for rid, rq in rset.items():
+                if self.sent.get(rid) != rq.generation:
+                    changed.append(rq.msg)
+                    self.sent[rid] = rq.generation
+            removed = [rid for rid in self.sent if rid not in rset]
+            for rid in removed:
+                del self.sent[rid]
+            msg = RequestSet([], rset.requester_id).to_msg(stamp)
+            msg.requests = changed
+            options['mode'] = 'delta'
+            if removed:
+                options['removed'] = ','.join([rid.hex for rid in removed])
+        msg.header.frame_id = common.encode_frame(options)
+        return msg
+
+    def pending(self, rset):
+        """ Check for changes not yet sent to the peer.
+
+        :param rset: Current requests.
+        :type rset: :class:`.RequestSet`
+        :returns: ``True`` if *rset* has changed since the last
+            message sent.
+        """
+        if self.full_next or not self.enabled:
+            return True
+        for rid, rq in rset.items():
+            if self.sent.get(rid) != rq.generation:
+                return True
+        for rid in self.sent:
+            if rid not in rset:
+                return True
+        return False
+
+    def receive(self, msg, contents=ResourceRequest, current=None):
+        """ Decode a message from the peer.
+
+        :param msg: Message received.
+        :type msg: scheduler_msgs/SchedulerRequests
+        :param contents: Class from which to instantiate set members.
+        :param current: Current requests, or ``None``.
+        :type current: :class:`.RequestSet`
+
+        :returns: tuple of *(updates, removed)*, suitable for
+            :py:meth:`.RequestSet.merge`.  If *msg* is out of
+            sequence, *updates* is ``None``.  If it is a complete
+            request set, *removed* is ``None``, unless *current* was
+            provided.  Then, a complete set is compared with
+            *current*, returning only its differences, as if they
+            had been sent as a delta.
+
+        """
+        options = common.decode_frame(msg.header.frame_id)
+        if not self.enabled or 'seq' not in options:
+            self.peer = False
+            return self._snapshot(msg, contents, current)
+        self.peer = True
+        seq = int(options['seq'])
+        if 'resync' in options:
+            self.full_next = True
+        if options.get('mode') != 'delta':      # complete snapshot?
+            self.in_seq = seq
+            self.resync_wanted = False
+            return self._snapshot(msg, contents, current)
+        if self.in_seq is not None and seq <= self.in_seq:
+            return None, None   # duplicate: already seen
+        if self.in_seq is None or seq != self.in_seq + 1:
+            self.resync_wanted = True   # gap: missed some changes
+            return None, None
+        self.in_seq = seq
+        removed = []
+        if options.get('removed'):
+            removed = [uuid.UUID(hex=rid)
+                       for rid in options['removed'].split(',')]
+        return RequestSet(msg, contents=contents), removed
+
+    def _snapshot(self, msg, contents, current):
+        """ Decode a complete snapshot from the peer.
+
+        :returns: tuple of *(updates, removed)*, as for
+            :py:meth:`.receive`.
+        """
+        if current is None:
+            return RequestSet(msg, contents=contents), None
+        updates, removed = current.diff(msg.requests)
+        # The peer has the current version of every other request.
+        self.sent = dict([(rid, rq.generation)
+                          for rid, rq in current.items()])
+        for rid in updates.keys():
+            self.sent[rid] = None
+        for rid in removed:
+            del self.sent[rid]
+        return updates, removed
+
+    def sync(self, rset, updates):
+        """ Account for requests the peer just sent.
+
+        :param rset: Current requests, after merging the *updates*.
+        :type rset: :class:`.RequestSet`
+        :param updates: Requests most recently received from the peer.
+        :type updates: :class:`.RequestSet`
+
+        Requests matching the peer's version need not be sent back to
+        it.  Those differing must be sent again, or removed.
+        """
+        diffs = set(rset.differences(updates))
+        for rid in updates.keys():
+            if rid in diffs:
+                self.sent[rid] = None   # send it again, or remove it
+            else:
+                self.sent[rid] = rset[rid].generation
+
+    def urgent(self):
+        """ :returns: ``True`` if the peer needs a message right away. """
+        return (self.enabled and self.peer
+                and (self.full_next or self.resync_wanted))
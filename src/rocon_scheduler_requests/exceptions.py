@@ -53,3 +53,8 @@ class TransitionError(Exception):
 class WrongRequestError(Exception):
     """ Error exception: request update for the wrong UUID. """
     pass
+
+
+class RequestLostError(Exception):
+    """ Error exception: request preempted or closed before granted. """
+    pass
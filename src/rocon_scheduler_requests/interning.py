@@ -0,0 +1,138 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (C) 2014, Jack O'Quin
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the author nor of other contributors may be
+#    used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+.. module:: interning
+
+This module provides canonical shared instances of the UUIDs and
+resources found in scheduler messages.
+
+Every message received contains the same request UUIDs and resource
+descriptions over and over again.  Mapping each one to a single
+shared object means the copies just decoded can be freed right away,
+reducing the number of objects kept alive and the work done by the
+garbage collector.
+
+UUIDs are cached using weak references, so they are kept only while
+some request refers to them.  Resources are kept in a bounded cache
+of the most recently used ones.
+
+Shared resource messages must be treated as immutable.
+
+"""
+
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+
+RESOURCE_CACHE_SIZE = 1024
+""" Maximum number of resources kept in the cache. """
+
+_lock = threading.Lock()
+_uuids = weakref.WeakValueDictionary()
+_resources = OrderedDict()
+
+
+def uuid_from_bytes(raw):
+    """ Canonical UUID for some raw bytes.
+
+    :param raw: 16-byte binary representation of the UUID.
+    :type raw: str (Python2) or bytes (Python3)
+    :returns: shared :class:`uuid.UUID` instance.
+    """
+    with _lock:
+        uid = _uuids.get(raw)
+        if uid is None:
+            uid = uuid.UUID(bytes=raw)
+            _uuids[raw] = uid
+        return uid
+
+
+def known_uuid(raw):
+    """ Existing canonical UUID for some raw bytes.
+
+    :param raw: 16-byte binary representation of the UUID.
+    :type raw: str (Python2) or bytes (Python3)
+    :returns: shared :class:`uuid.UUID` instance, or ``None`` if no
+        request currently refers to it.
+    """
+    with _lock:
+        return _uuids.get(raw)
+
+
+def uuid_from_msg(msg):
+    """ Canonical UUID for a message.
+
+    :param msg: ID message.
+    :type msg: uuid_msgs/UniqueID
+    :returns: shared :class:`uuid.UUID` instance, like
+        :py:func:`unique_id.fromMsg` would create.
+    """
+    return uuid_from_bytes(bytes(bytearray(msg.uuid)))
+
+
+def resource(res):
+    """ Canonical instance of a resource.
+
+    :param res: Resource description.
+    :type res: scheduler_msgs/Resource
+    :returns: shared message with the same contents as *res*, or
+        *res* itself if it has no shared instance.
+    """
+    try:
+        key = (type(res), tuple([getattr(res, name)
+                                 for name in res.__slots__]))
+        hash(key)
+    except TypeError:           # some field not hashable?
+        return res
+    with _lock:
+        shared = _resources.pop(key, None)
+        if shared is None:
+            shared = res
+            if len(_resources) >= RESOURCE_CACHE_SIZE:
+                _resources.popitem(last=False)  # least recently used
+        _resources[key] = shared
+        return shared
+
+
+def resources(resource_list):
+    """ Canonical instances of a list of resources.
+
+    :param resource_list: Resource descriptions.
+    :type resource_list: list of scheduler_msgs/Resource
+    :returns: new list of shared messages.
+    """
+    return [resource(res) for res in resource_list]
@@ -0,0 +1,290 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (C) 2014, Jack O'Quin
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the author nor of other contributors may be
+#    used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+.. module:: request_index
+
+This module provides an index of the active requests for every
+requester known to a scheduler, so it can make global decisions
+without examining each requester's :class:`.RequestSet`.
+
+The index is updated incrementally, as each request is added,
+modified or removed.  It supports these queries:
+
+ * all requests with a given status, in O(result) time,
+ * the *k* highest-priority requests with a given status, in
+   O(k log n) time,
+ * all requests holding a given resource, in O(result) time.
+
+Each update takes O(log n) amortized time.  The priority order is
+kept in a heap for each status.  Entries for requests that changed
+status or priority are not removed from the heap right away, but
+discarded when they reach the top, or when stale entries make up
+more than half of the heap.
+
+"""
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+import heapq
+import itertools
+
+from scheduler_msgs.msg import Request
+
+## Request states considered to be holding their resources.
+HOLDING_STATES = frozenset([Request.GRANTED, Request.PREEMPTING])
+
+
+def resource_key(resource):
+    """ Index key for a resource.
+
+    :param resource: Resource description.
+    :type resource: scheduler_msgs/Resource
+    :returns: (platform_info, name) tuple.
+    """
+    return (resource.platform_info, resource.name)
+
+
+def _holdings(rq):
+    """ Resource keys held by a request.
+
+    :returns: frozenset of keys, empty unless *rq* is holding its
+        resources.
+    """
+    if rq.msg.status not in HOLDING_STATES:
+        return frozenset()
+    return frozenset([resource_key(res) for res in rq.msg.resources])
+
+
+class _Entry:
+    """ Indexed information about a single request.
+
+    *Not for general use.*
+    """
+    def __init__(self, rq, key):
+        self.rq = rq
+        self.status = rq.msg.status
+        self.key = key
+        self.holds = _holdings(rq)
+        self.item = None        # current priority heap item
+
+
+class RequestIndex:
+    """
+    This class indexes the active requests of every requester using a
+    scheduler.
+
+    An instance acts as the observer for each :class:`.RequestSet`
+    attached to it (see :py:meth:`.RequestSet.attach`), which reports
+    every change.  Its query methods return :class:`.ActiveRequest`
+    objects; the ``owner`` of each gives the request set, including its
+    ``requester_id``.
+
+    Like the request sets themselves, an index may only be accessed
+    while holding the scheduler's lock.
+
+    .. describe:: len(index)
+
+       :returns: The number of requests in the index.
+
+    .. describe:: uuid in index
+
+       :returns: ``True`` if the index contains request *uuid*.
+
+    """
+    def __init__(self):
+        """ Constructor. """
+        self._entries = {}
+        """ :class:`._Entry` for each request, indexed by UUID. """
+        self._by_status = {}
+        """ Dictionary of requests for each status, indexed by UUID. """
+        self._by_priority = {}
+        """ Heap of (-priority, order, push, UUID) items for each
+        status, including stale ones. """
+        self._stale = {}
+        """ Number of stale items in each priority heap. """
+        self._holders = {}
+        """ Dictionary of holding requests for each resource key,
+        indexed by UUID. """
+        self._order = itertools.count()
+        self._pushes = itertools.count()
+
+    def __contains__(self, uuid):
+        """ Index membership. """
+        return uuid in self._entries
+
+    def __len__(self):
+        """ Number of requests. """
+        return len(self._entries)
+
+    def added(self, rq):
+        """ Add a new request to the index.
+
+        :param rq: Request being added.
+        :type rq: :class:`.ActiveRequest`
+        """
+        if rq.uuid in self._entries:
+            self.removed(rq)
+        entry = _Entry(rq, (-rq.msg.priority, next(self._order), rq.uuid))
+        self._entries[rq.uuid] = entry
+        self._insert(entry)
+
+    def changed(self, rq):
+        """ Update the index after a request changed.
+
+        :param rq: Request that changed.
+        :type rq: :class:`.ActiveRequest`
+        """
+        entry = self._entries.get(rq.uuid)
+        if entry is None:
+            self.added(rq)
+            return
+        priority = -entry.key[0]
+        if rq.msg.status == entry.status and rq.msg.priority == priority:
+            holds = _holdings(rq)
+            if holds != entry.holds:    # only the holdings changed?
+                self._unhold(entry)
+                entry.holds = holds
+                self._hold(entry)
+            return
+        self._delete(entry)
+        key = entry.key
+        if rq.msg.priority != priority:         # keep original order
+            key = (-rq.msg.priority, key[1], key[2])
+        entry = _Entry(rq, key)
+        self._entries[rq.uuid] = entry
+        self._insert(entry)
+
+    def removed(self, rq):
+        """ Remove a request from the index.
+
+        :param rq: Request being removed.
+        :type rq: :class:`.ActiveRequest`
+        """
+        entry = self._entries.pop(rq.uuid, None)
+        if entry is not None:
+            self._delete(entry)
+
+    def by_status(self, status):
+        """ Find requests with a given status.
+
+        :param status: Desired *scheduler_msgs/Request* status.
+        :returns: list of matching requests, in no particular order.
+        """
+        bucket = self._by_status.get(status)
+        if not bucket:
+            return []
+        return list(bucket.values())
+
+    def holders(self, resource):
+        """ Find requests holding some resource.
+
+        :param resource: Resource description.
+        :type resource: scheduler_msgs/Resource
+        :returns: list of GRANTED or PREEMPTING requests that were
+            allocated *resource*.
+        """
+        bucket = self._holders.get(resource_key(resource))
+        if not bucket:
+            return []
+        return list(bucket.values())
+
+    def top(self, status=Request.WAITING, k=1):
+        """ Find the highest-priority requests with a given status.
+
+        :param status: Desired *scheduler_msgs/Request* status.
+        :param k: Maximum number of requests to return.
+        :type k: int
+        :returns: list of up to *k* requests, highest priority first.
+            Requests with equal priority are listed in the order they
+            were indexed.
+        """
+        heap = self._by_priority.get(status)
+        found = []
+        while heap and len(found) < k:
+            item = heapq.heappop(heap)
+            if self._live(item):
+                found.append(item)
+            else:               # discard stale item
+                self._stale[status] -= 1
+        for item in found:
+            heapq.heappush(heap, item)
+        return [self._entries[item[3]].rq for item in found]
+
+    def _delete(self, entry):
+        """ Remove an entry from the secondary indexes. """
+        status = entry.status
+        del self._by_status[status][entry.rq.uuid]
+        entry.item = None       # its heap item is now stale
+        stale = self._stale.get(status, 0) + 1
+        self._stale[status] = stale
+        if 2 * stale > len(self._by_priority[status]):
+            self._compact(status)
+        self._unhold(entry)
+
+    def _compact(self, status):
+        """ Remove all stale items from a priority heap. """
+        heap = [item for item in self._by_priority[status]
+                if self._live(item)]
+        heapq.heapify(heap)
+        self._by_priority[status] = heap
+        self._stale[status] = 0
+
+    def _hold(self, entry):
+        """ Add an entry to the resource holders index. """
+        for res in entry.holds:
+            self._holders.setdefault(res, {})[entry.rq.uuid] = entry.rq
+
+    def _insert(self, entry):
+        """ Add an entry to the secondary indexes. """
+        uuid = entry.rq.uuid
+        self._by_status.setdefault(entry.status, {})[uuid] = entry.rq
+        entry.item = entry.key[:2] + (next(self._pushes), uuid)
+        heapq.heappush(self._by_priority.setdefault(entry.status, []),
+                       entry.item)
+        self._hold(entry)
+
+    def _live(self, item):
+        """ :returns: ``True`` unless a priority heap *item* is stale. """
+        entry = self._entries.get(item[3])
+        return entry is not None and entry.item is item
+
+    def _unhold(self, entry):
+        """ Remove an entry from the resource holders index. """
+        uuid = entry.rq.uuid
+        for res in entry.holds:
+            bucket = self._holders[res]
+            del bucket[uuid]
+            if not bucket:
+                del self._holders[res]
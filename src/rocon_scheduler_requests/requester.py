@@ -42,12 +42,13 @@ Python interface for ROCON services making scheduler requests.
 # enable some python3 compatibility options:
 from __future__ import absolute_import, print_function, unicode_literals
 
-import copy
-
 # ROS dependencies
+import random
 import rospy
 import threading
+import time
 import unique_id
+from collections import OrderedDict
 
 # ROS messages
 from scheduler_msgs.msg import Request, SchedulerRequests
@@ -55,7 +56,27 @@ from scheduler_msgs.msg import Request, SchedulerRequests
 # internal modules
 from . import common
 from . import TransitionError, WrongRequestError
+from .delta import DeltaChannel
 from .transitions import RequestSet
+from .transport import RosTransport, copy_message
+
+SEND_DELAY = 0.005
+""" Delay (in seconds) for merging nearby :py:meth:`.send_requests`
+calls into a single message. """
+POOL_TICKS = 10
+""" Number of :class:`.RequesterPool` timer ticks per heartbeat
+period, for spreading pooled requesters' heartbeats over it. """
+
+# Clock for timeouts and delays, unaffected by system clock changes
+# (Python 2 has no monotonic clock, so use the wall clock there).
+_monotonic = getattr(time, 'monotonic', time.time)
+
+
+def _jitter():
+    """ :returns: random fraction of a heartbeat period to wait, at
+        most :py:const:`.common.HEARTBEAT_JITTER` short of a full
+        one, so requesters do not stay in step with each other. """
+    return 1.0 - common.HEARTBEAT_JITTER * random.random()
 
 
 class Requester:
@@ -79,9 +100,34 @@ class Requester:
 
     :param frequency: requester heartbeat frequency in Hz.  Use the
                       default, except in exceptional situations or for
-                      testing.
+                      testing.  If the scheduler supports adaptive
+                      heartbeats, they may be sent less often, see
+                      :ref:`Adaptive_Heartbeats`.
     :type frequency: float
 
+    :param delta: ``True`` to send only changed requests, once the
+                  scheduler supports the :mod:`.delta` protocol.
+    :type delta: bool
+
+    :param shared_feedback: ``True`` if the scheduler sends feedback
+                  for all requesters on one shared topic.
+    :type shared_feedback: bool
+
+    :param transport: Message :mod:`.transport`, the same one used by
+                  the scheduler, or ``None`` for the usual ROS topics.
+
+    :param pool: :class:`.RequesterPool` hosting this requester, or
+                  ``None``.  A pooled requester uses the pool's
+                  publisher, heartbeat timer and shared feedback
+                  subscriber, ignoring the *topic*, *frequency*,
+                  *shared_feedback*, *transport* and *send_delay*
+                  arguments.
+    :type pool: :class:`.RequesterPool`
+
+    :param send_delay: seconds to wait for more :py:meth:`.send_requests`
+                  calls before sending them all in a single message.
+    :type send_delay: float
+
     As long as the :class:`.Requester` object remains, it will
     periodically send request messages to the scheduler, even when no
     requests are outstanding.  The scheduler will provide feedback for
@@ -104,6 +150,11 @@ class Requester:
     appropriately, then return without waiting. If any changes occur,
     the scheduler will be notified after this callback returns.
 
+    With the *delta* option, each request modified by changing its
+    message fields directly must be marked by calling its
+    :py:meth:`.touch` method.  Otherwise, the scheduler may never see
+    those changes.
+
     Usage example:
 
     .. literalinclude:: ../tests/example_requester.py
@@ -113,7 +164,12 @@ class Requester:
     def __init__(self, feedback, uuid=None,
                  priority=0,
                  topic=common.SCHEDULER_TOPIC,
-                 frequency=common.HEARTBEAT_HZ):
+                 frequency=common.HEARTBEAT_HZ,
+                 delta=False,
+                 shared_feedback=False,
+                 transport=None,
+                 pool=None,
+                 send_delay=SEND_DELAY):
         """ Constructor. """
         self.lock = threading.RLock()
         """
@@ -129,6 +185,8 @@ class Requester:
         In any other thread, acquire it when updating shared request
         set objects.  Never hold it when sleeping or waiting for I/O.
         """
+        self._changed = threading.Condition(self.lock)
+        self._watched = {}              # waiter count, by request UUID
         if uuid is None:
             uuid = unique_id.fromRandom()
         self.requester_id = uuid
@@ -142,18 +200,62 @@ class Requester:
         """
         self.priority = priority
         """ Default for new requests' priorities if none specified. """
+        self._delta = DeltaChannel(enabled=delta)
 
         self.feedback = feedback        # requester feedback
+        self.heartbeat_hz = frequency
+        """ Current heartbeat frequency (Hz), announced to the
+        scheduler with every message. """
+        self.scheduler_hz = None
+        """ Maximum heartbeat frequency (Hz) advertised by the
+        scheduler, or ``None`` if it does not support adaptive
+        heartbeats. """
+        self._beat_generation = None    # rset generation at last heartbeat
+        self._next_beat = rospy.Time()  # pooled requesters only
+        self.pool = pool
+        """ :class:`.RequesterPool` hosting this requester, or ``None``. """
+        if pool is not None:            # share the pool's connections
+            self.frequency = pool.frequency
+            self.heartbeat_hz = pool.frequency
+            self.transport = pool.transport
+            self.pub_topic = pool.topic
+            self.sub_topic = pool.sub_topic
+            self.sub = None
+            self.pub = pool.pub
+            self.time_delay = pool.time_delay
+            self.timer = None
+            self._sender = pool._sender
+            pool._add(self)
+            return
+        self.frequency = frequency
+        """ Heartbeat frequency (Hz) while any requests are pending. """
+        if transport is None:
+            transport = RosTransport()
+        self.transport = transport
+        """ :mod:`.transport` for scheduler messages. """
         self.pub_topic = topic
-        self.sub_topic = common.feedback_topic(uuid, topic)
-        rospy.loginfo('ROCON requester feedback topic: ' + self.sub_topic)
-        self.sub = rospy.Subscriber(self.sub_topic, SchedulerRequests,
-                                    self._feedback,
-                                    queue_size=1, tcp_nodelay=True)
-        self.pub = rospy.Publisher(self.pub_topic, SchedulerRequests,
-                                   latch=True)
+        if shared_feedback:
+            # Feedback for other requesters arrives on the same topic,
+            # so do not limit the queue size.
+            self.sub_topic = common.shared_feedback_topic(topic)
+            rospy.loginfo('ROCON requester shared feedback topic: '
+                          + self.sub_topic)
+            self.sub = transport.subscriber(self.sub_topic,
+                                            SchedulerRequests,
+                                            self._shared_feedback)
+        else:
+            self.sub_topic = common.feedback_topic(uuid, topic)
+            rospy.loginfo('ROCON requester feedback topic: '
+                          + self.sub_topic)
+            self.sub = transport.subscriber(self.sub_topic,
+                                            SchedulerRequests,
+                                            self._feedback, queue_size=1)
+        self.pub = transport.publisher(self.pub_topic, SchedulerRequests,
+                                       latch=True)
         self.time_delay = rospy.Duration(1.0 / frequency)
-        self._set_timer()
+        self._send_delay = send_delay
+        self._sender = _SendQueue(send_delay)
+        self._set_timer(self._phase())
 
     def cancel_all(self):
         """ Cancel all current requests to the scheduler.
@@ -168,26 +270,95 @@ class Requester:
     def _feedback(self, msg):
         """ Scheduler feedback message handler. """
         with self.lock:
-            prev_rset = copy.deepcopy(self.rset)
-            self.rset.merge(RequestSet(msg))
-            if self.rset != prev_rset:  # anything changed?
+            options = common.decode_frame(msg.header.frame_id)
+            if 'hz' in options:         # adaptive heartbeats supported?
+                self.scheduler_hz = float(options['hz'])
+            updates, removed = self._delta.receive(msg)
+            changed = None
+            if updates is not None:
+                changed = self.rset.merge(updates, removed)
+            if changed:
                 # invoke user-defined callback function
                 self.feedback(self.rset)
-                if self.rset != prev_rset:
+                if any(rid in self._watched for rid in changed):
+                    self._changed.notify_all()  # wake wait_for() callers
+                self._delta.sync(self.rset, updates)
+                if self._delta.pending(self.rset):
                     # msg or callback changed something, so send
                     # updated requests immediately
                     self.send_requests()
+            elif self._delta.urgent():  # scheduler needs a snapshot?
+                self.send_requests()
+
+    def _shared_feedback(self, msg):
+        """ Shared scheduler feedback message handler. """
+        if bytes(bytearray(msg.requester.uuid)) == self.requester_id.bytes:
+            self._feedback(msg)
+
+    def _beat(self):
+        """ Send a heartbeat message to the scheduler.
+
+        Also chooses the heartbeat frequency until the next one,
+        holding the Big Requester Lock.  If the scheduler supports
+        adaptive heartbeats, that is never more than it advertised.
+        A requester whose requests have all been granted, with no
+        changes since the previous heartbeat, slows down by
+        :py:const:`.common.IDLE_HEARTBEAT_FACTOR`.
+        """
+        with self.lock:
+            hz = self._full_hz()
+            if (self.scheduler_hz is not None
+                    and self.rset.generation == self._beat_generation
+                    and len(self.rset.by_status(Request.GRANTED))
+                    == len(self.rset)):
+                hz *= common.IDLE_HEARTBEAT_FACTOR
+            self.heartbeat_hz = hz
+            self.time_delay = rospy.Duration(1.0 / hz)
+            self._beat_generation = self.rset.generation
+            self.send_requests()
+
+    def _full_hz(self):
+        """ :returns: heartbeat frequency (Hz) while requests are
+            pending, never more than the scheduler advertised. """
+        if self.scheduler_hz is None:
+            return self.frequency
+        return min(self.frequency, self.scheduler_hz)
+
+    def _speed_up(self):
+        """ Return to the full heartbeat frequency, holding the Big
+        Requester Lock, if the requests changed since an idle
+        heartbeat slowed it down.
+
+        The next heartbeat is rescheduled a full-speed period from
+        now, instead of waiting out the slow one.
+        """
+        if self.rset.generation == self._beat_generation:
+            return                      # nothing changed
+        hz = self._full_hz()
+        if self.heartbeat_hz >= hz:     # not slowed down
+            return
+        self.heartbeat_hz = hz
+        self.time_delay = rospy.Duration(1.0 / hz)
+        if self.pool is not None:
+            self._next_beat = min(self._next_beat,
+                                  rospy.Time.now() + self.time_delay)
+        elif self.timer:
+            self.timer.shutdown()
+            self._set_timer()
 
     def _heartbeat(self, event):
         """ Scheduler request heartbeat timer handler.
 
         Triggered after nothing has been sent to the scheduler within
         the previous time_delay duration.  Sends another copy of the
-        current request set to the scheduler.
+        current request set to the scheduler, then re-arms the timer
+        for the next heartbeat, which may be sooner or later.
 
         """
-        if self.timer:
-            self.send_requests()
+        with self.lock:
+            if self.timer:
+                self._beat()
+                self._set_timer()
 
     def new_request(self, resources, priority=None, uuid=None,
                     reservation=rospy.Time(),
@@ -219,6 +390,57 @@ class Requester:
         :returns: UUID (:class:`uuid.UUID`) assigned.
         :raises: :exc:`.WrongRequestError` if request already exists.
         """
+        return self.new_requests([{'resources': resources,
+                                   'priority': priority,
+                                   'uuid': uuid,
+                                   'reservation': reservation,
+                                   'hold_time': hold_time}])[0]
+
+    def new_requests(self, specs, send=False):
+        """ Add a batch of new scheduler requests.
+
+        :param specs: One dictionary for each new request, containing
+            keyword arguments for :py:meth:`.new_request`, at least
+            ``resources``.
+        :type specs: list of dict
+
+        :param send: ``True`` to send the requests immediately, like
+            :py:meth:`.send_requests`.
+        :type send: bool
+
+        :returns: list of UUIDs (:class:`uuid.UUID`) assigned, in the
+            order of *specs*.
+        :raises: :exc:`.WrongRequestError` if any request already
+            exists, or the batch uses the same UUID twice.  Then none
+            of the requests are added.
+
+        The whole batch is added at once, so no heartbeat message can
+        contain only some of it.
+
+        """
+        batch = [self._request_msg(**spec) for spec in specs]
+        with self.lock:
+            uuids = set()
+            for uuid, msg in batch:
+                if uuid in self.rset or uuid in uuids:
+                    raise WrongRequestError('UUID already in use.')
+                uuids.add(uuid)
+            for uuid, msg in batch:
+                self.rset[uuid] = msg
+            self._speed_up()
+        if send:
+            self.send_requests()
+        return [uuid for uuid, msg in batch]
+
+    def _request_msg(self, resources, priority=None, uuid=None,
+                     reservation=rospy.Time(),
+                     hold_time=rospy.Duration()):
+        """ Construct a new request message.
+
+        Takes the same arguments as :py:meth:`.new_request`.
+
+        :returns: (UUID, scheduler_msgs/Request) pair.
+        """
         if priority is None:
             priority = self.priority
         status = Request.NEW
@@ -226,17 +448,13 @@ class Requester:
             status = Request.RESERVED
         if uuid is None:
             uuid = unique_id.fromRandom()
-        if uuid in self.rset:
-            raise WrongRequestError('UUID already in use.')
         msg = Request(id=unique_id.toMsg(uuid),
                       priority=priority,
                       resources=resources,
                       status=status,
                       availability=reservation,
                       hold_time=hold_time)
-        with self.lock:
-            self.rset[uuid] = msg
-        return uuid
+        return uuid, msg
 
     def send_requests(self):
         """ Send all current requests to the scheduler.
@@ -252,19 +470,321 @@ class Requester:
            requests.  This method just ensures they are all sent
            without further delay.
 
+        If an idle period had slowed down the heartbeats, they return
+        to full speed right away.
+
+        The message actually goes out from a separate I/O thread,
+        after the *send_delay*, so several calls made close together
+        only send it once.  Never waits for the message to be
+        serialized or written.
+
         """
         with self.lock:
-            self.pub.publish(self.rset.to_msg())
+            self._speed_up()
+            if self._sender is None:    # reconnecting after unregister
+                self._sender = _SendQueue(self._send_delay)
+            sender = self._sender
+        sender.put(self)
+
+    def _publish(self):
+        """ Publish the current requests, in the I/O thread.
 
-    def _set_timer(self):
-        """ Schedule heartbeat timer callback. """
+        The message is constructed from a snapshot taken holding the
+        Big Requester Lock, then serialized and written without it.
+        """
+        with self.lock:
+            msg = copy_message(self._delta.outgoing(
+                self.rset, options={'hz': str(self.heartbeat_hz)}))
+        self.pub.publish(msg)
+
+    def wait_for(self, uuid, statuses, timeout=None):
+        """ Wait for a request to reach one of several statuses.
+
+        :param uuid: UUID_ of the request.
+        :type uuid: :class:`uuid.UUID`
+
+        :param statuses: Desired ``status`` values.
+        :type statuses: collection of int
+
+        :param timeout: Maximum seconds to wait, or ``None`` to wait
+            as long as necessary.
+        :type timeout: float
+
+        :returns: The request's current status, if one of *statuses*
+            or CLOSED, otherwise ``None`` after *timeout*.
+
+        A request no longer present in :py:attr:`.rset` is considered
+        CLOSED.  Since a closed request can never change again, that
+        status is returned even when not one of *statuses*.
+
+        The caller wakes up as soon as scheduler feedback changes the
+        request, without polling.  Do not call this method from the
+        requester *feedback* function, which would never return until
+        the *timeout*, because no feedback is processed while waiting.
+
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = _monotonic() + timeout
+        with self.lock:
+            self._watched[uuid] = self._watched.get(uuid, 0) + 1
+            try:
+                while True:
+                    rq = self.rset.get(uuid)
+                    if rq is None:      # request no longer present
+                        return Request.CLOSED
+                    status = rq.msg.status
+                    if status in statuses or status == Request.CLOSED:
+                        return status
+                    if deadline is None:
+                        self._changed.wait()
+                    else:
+                        remaining = deadline - _monotonic()
+                        if remaining <= 0.0:
+                            return None
+                        self._changed.wait(remaining)
+            finally:
+                self._watched[uuid] -= 1
+                if self._watched[uuid] == 0:
+                    del self._watched[uuid]
+
+    def _phase(self):
+        """ :returns: heartbeat phase, as a fraction of the period.
+
+        Derived from the requester UUID, so requesters started at the
+        same time spread their heartbeats over the whole period,
+        instead of all sending them at once.
+        """
+        return 1.0 - (self.requester_id.int & 0xffffffff) / float(1 << 32)
+
+    def _set_timer(self, phase=None):
+        """ Schedule next heartbeat timer callback.
+
+        :param phase: Fraction of the heartbeat period to wait, or
+            ``None`` for a full period, shortened by a random jitter
+            of at most :py:const:`.common.HEARTBEAT_JITTER`.
+        :type phase: float
+        """
+        if phase is None:
+            phase = _jitter()
         if not rospy.is_shutdown():
-            self.timer = rospy.Timer(self.time_delay, self._heartbeat)
+            self.timer = rospy.Timer(self.time_delay * phase,
+                                     self._heartbeat, oneshot=True)
 
     def _unregister(self):
         """ Stop sending heartbeat messages to scheduler.
 
         Mainly for testing, *not for normal use.*
+
+        Also stops this requester's I/O thread, after it sends any
+        pending requests.  A pooled requester leaves the pool's
+        running.
         """
+        if self.pool is not None:
+            self.pool._remove(self)
+            return
+        with self.lock:
+            self.timer.shutdown()
+            self.timer = None
+            # The caller may hold this lock, which the I/O thread needs
+            # for sending, so do not wait for it.
+            self._sender.shutdown(wait=False)
+            self._sender = None
+
+
+class RequesterPool:
+    """
+    This class hosts many :class:`.Requester` objects in one process,
+    multiplexing them over a single scheduler topic publisher, one
+    heartbeat timer and one feedback subscriber.  Each requester
+    keeps its own UUID, :class:`.RequestSet`, lock and *feedback*
+    function.  The number of threads and connections does not grow
+    as more requesters are added.
+
+    :param topic: Topic name for allocating resources.
+    :type topic: str
+
+    :param frequency: heartbeat frequency in Hz for every requester
+                      in the pool.  Requesters only send heartbeats
+                      less often, when adapting to the scheduler.
+    :type frequency: float
+
+    :param transport: Message :mod:`.transport`, the same one used by
+                  the scheduler, or ``None`` for the usual ROS topics.
+
+    :param send_delay: seconds to wait for more
+                  :py:meth:`.Requester.send_requests` calls before
+                  sending them all in a single message.
+    :type send_delay: float
+
+    The scheduler must be using the *shared_feedback* option, because
+    feedback for all the pooled requesters arrives on that one topic.
+
+    Usage example::
+
+        pool = RequesterPool()
+        rqr = pool.requester(feedback)
+        rqr.new_request([bot])
+        rqr.send_requests()
+
+    """
+
+    def __init__(self, topic=common.SCHEDULER_TOPIC,
+                 frequency=common.HEARTBEAT_HZ,
+                 transport=None,
+                 send_delay=SEND_DELAY):
+        """ Constructor. """
+        self.lock = threading.Lock()
+        """ Lock serializing changes to the pool membership. """
+        self._requesters = {}           # by raw requester UUID bytes
+        if transport is None:
+            transport = RosTransport()
+        self.transport = transport
+        """ :mod:`.transport` for scheduler messages. """
+        self.topic = topic
+        """ Scheduler topic name. """
+        self.sub_topic = common.shared_feedback_topic(topic)
+        """ Shared feedback topic name. """
+        rospy.loginfo('ROCON requester pool shared feedback topic: '
+                      + self.sub_topic)
+        self.sub = transport.subscriber(self.sub_topic, SchedulerRequests,
+                                        self._dispatch)
+        self.pub = transport.publisher(self.topic, SchedulerRequests,
+                                       latch=True)
+        self.frequency = frequency
+        """ Heartbeat frequency (Hz) of the pool's timer. """
+        self.time_delay = rospy.Duration(1.0 / frequency)
+        self._tick = self.time_delay * (1.0 / POOL_TICKS)
+        self._sender = _SendQueue(send_delay)
+        self.timer = rospy.Timer(self._tick, self._heartbeat)
+
+    def __len__(self):
+        """ Number of requesters in the pool. """
+        return len(self._requesters)
+
+    def _add(self, rqr):
+        """ Add a new requester to the pool.
+
+        Its first heartbeat is due after its :py:meth:`.Requester._phase`
+        of the period, like a requester with its own timer.
+        """
+        rqr._next_beat = rospy.Time.now() + self.time_delay * rqr._phase()
+        with self.lock:
+            self._requesters[rqr.requester_id.bytes] = rqr
+
+    def _dispatch(self, msg):
+        """ Shared feedback message handler. """
+        rqr = self._requesters.get(bytes(bytearray(msg.requester.uuid)))
+        if rqr is not None:             # one of ours?
+            rqr._feedback(msg)
+
+    def _heartbeat(self, event):
+        """ Heartbeat timer handler, sending the current requests of
+        every requester whose next heartbeat is due.
+
+        The timer ticks :py:const:`POOL_TICKS` times per period, so
+        requesters due at different times beat on different ticks.
+        Each next heartbeat gets the same random jitter as for a
+        requester with its own timer.
+        """
+        with self.lock:
+            requesters = list(self._requesters.values())
+        # allow for timer jitter, half a tick early
+        now = event.current_real + self._tick * 0.5
+        for rqr in requesters:
+            if rqr._next_beat <= now:
+                rqr._beat()
+                rqr._next_beat = (event.current_real
+                                  + rqr.time_delay * _jitter())
+
+    def _remove(self, rqr):
+        """ Remove a requester from the pool. """
+        with self.lock:
+            self._requesters.pop(rqr.requester_id.bytes, None)
+
+    def requester(self, feedback, **kwargs):
+        """ Create a new requester hosted by this pool.
+
+        :param feedback: Callback function invoked with the current
+                         :class:`.RequestSet` when feedback arrives.
+
+        Other keyword arguments, such as *uuid*, *priority* or
+        *delta*, are passed to the :class:`.Requester` constructor.
+
+        :returns: new :class:`.Requester`.
+        """
+        return Requester(feedback, pool=self, **kwargs)
+
+    def shutdown(self):
+        """ Stop the heartbeat timer and release the pool's
+        connections.  Its requesters can no longer be used. """
         self.timer.shutdown()
-        self.timer = None
+        self._sender.shutdown()
+        self.sub.unregister()
+        self.pub.unregister()
+
+
+class _SendQueue:
+    """
+    Requesters waiting for their requests to be sent, served by one
+    I/O thread.
+
+    :param delay: seconds to wait after the first request to send,
+                  merging any more made in the meantime.
+    :type delay: float
+
+    Pending requesters are kept in order of their first request.  All
+    have the same *delay*, so they also become due in that order.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._cond = threading.Condition()
+        self._due = OrderedDict()       # deadline, by requester
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, rqr):
+        """ Ask for a requester's requests to be sent. """
+        with self._cond:
+            if rqr not in self._due:    # not already pending?
+                self._due[rqr] = _monotonic() + self.delay
+                self._cond.notify()
+
+    def shutdown(self, wait=True):
+        """ Stop the I/O thread, after sending anything pending.
+
+        :param wait: ``False`` to return without waiting for the
+            thread to finish.
+        :type wait: bool
+
+        Never wait holding the lock of a pending requester.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if wait and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        """ I/O thread main loop. """
+        while True:
+            with self._cond:
+                if not self._due:
+                    if self._stopping:
+                        return
+                    self._cond.wait()
+                    continue
+                rqr, deadline = next(iter(self._due.items()))
+                remaining = deadline - _monotonic()
+                if remaining > 0.0 and not self._stopping:
+                    self._cond.wait(remaining)
+                    continue
+                del self._due[rqr]
+            try:
+                rqr._publish()
+            except Exception as e:      # keep serving other requesters
+                rospy.logerr('failed to send scheduler requests: '
+                             + str(e))
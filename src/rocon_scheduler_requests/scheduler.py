@@ -42,27 +42,92 @@ Python interface for ROCON schedulers handling resource requests.
 # enable some python3 compatibility options:
 from __future__ import absolute_import, print_function, unicode_literals
 
+import bisect
+import heapq
 import rospy
+import struct
 import threading
-import unique_id
+import time
+from collections import deque
 
 # ROS messages
 from scheduler_msgs.msg import Request, SchedulerRequests
 
 # internal modules
 from . import common
+from . import interning
+from .delta import DeltaChannel
+from .request_index import RequestIndex
+from .timing_wheel import TimingWheel
 from .transitions import ActiveRequest, RequestSet
+from .transport import RosTransport, copy_message
+
+COALESCE_DELAY = 0.01
+""" Delay (in seconds) before sending coalesced notifications made
+outside the scheduler *callback*. """
+ALARM_RESOLUTION = 0.1
+""" Resolution (in seconds) of scheduler *alarm* times. """
+
+
+def _peek(buff):
+    """ Decode the beginning of a serialized request message.
+
+    :param buff: Serialized ``scheduler_msgs/SchedulerRequests``
+        message.
+    :returns: tuple of *(stamp, frame_length, offset)*: the header
+        time stamp, the length of its ``frame_id`` and the offset of
+        the requester ID, which is followed by the requests.
+    """
+    # header: uint32 seq, uint32 secs, uint32 nsecs, string frame_id
+    secs, nsecs, frame_length = struct.unpack_from('<3I', buff, 4)
+    return rospy.Time(secs, nsecs), frame_length, 16 + frame_length
+
+
+def _decode(msg):
+    """ :returns: decoded *msg*, which may be a :class:`rospy.AnyMsg`. """
+    buff = getattr(msg, '_buff', None)
+    if buff is None:            # already decoded?
+        return msg
+    return SchedulerRequests().deserialize(buff)
+
+
+def _requester_id(msg):
+    """ :returns: requester :class:`uuid.UUID` of *msg*, which may be
+        a :class:`rospy.AnyMsg`. """
+    buff = getattr(msg, '_buff', None)
+    if buff is None:            # already decoded?
+        return interning.uuid_from_msg(msg.requester)
+    offset = _peek(buff)[2]
+    return interning.uuid_from_bytes(bytes(buff[offset:offset + 16]))
+
+
+def _wrong_type(msg):
+    """ :returns: ``True`` if *msg* was published as some other type
+        than ``scheduler_msgs/SchedulerRequests``.
+
+    Subscribing as :class:`rospy.AnyMsg` disables the usual type
+    check, so compare the MD5 sum in the publisher's connection header.
+    """
+    header = getattr(msg, '_connection_header', None)
+    if not header:              # not received from a ROS connection
+        return False
+    return header.get('md5sum', '*') not in ('*', SchedulerRequests._md5sum)
 
 
 class _RequesterStatus:
     """
     This class tracks the status of all resource requests made by a
-    single requester.  It subscribes to the requester feedback topic,
+    single requester.  It publishes to the requester feedback topic,
     and provides updated information when appropriate.
 
     Being internal to the :class:`.Scheduler`, methods of this class
-    are invoked already holding the :ref:`Big Scheduler Lock
-    <Big_Scheduler_Lock>`.
+    are invoked already holding this requester's :py:attr:`lock`.
+    Unless the scheduler uses *concurrent* mode, that is the
+    :ref:`Big Scheduler Lock <Big_Scheduler_Lock>`.  Otherwise, the
+    constructor is invoked holding the Big Scheduler Lock, and other
+    methods acquire it when needed, after this requester's lock.  The
+    constructor sends no feedback: the caller answers the initial
+    message after releasing the Big Scheduler Lock.
 
     :param sched: (:class:`.Scheduler`) Scheduler object with which
         this requester is connected.
@@ -77,41 +142,168 @@ class _RequesterStatus:
         self.last_msg_time = msg.header.stamp
         self.sched = sched
         """ Scheduler serving this requester. """
-        self.requester_id = unique_id.fromMsg(msg.requester)
+        self.requester_id = interning.uuid_from_msg(msg.requester)
         """ :class:`uuid.UUID` of this requester. """
-        self.rset = RequestSet(msg, contents=ActiveRequest)
+        self.lock = sched.lock
+        """ Lock serializing message handling for this requester. """
+        if sched.concurrent:
+            self.lock = threading.RLock()
+        self.delta = DeltaChannel()
+        """ :mod:`.delta` protocol state for this requester. """
+        new_rset, removed = self.delta.receive(msg, contents=ActiveRequest)
+        if new_rset is None:    # only changes, from a previous session?
+            # Start empty, asking the requester for a complete snapshot.
+            new_rset = RequestSet([], self.requester_id,
+                                  contents=ActiveRequest)
+        self.rset = new_rset
         """ All active requests for this requester. """
-
-        feedback_topic = common.feedback_topic(self.requester_id,
-                                               self.sched.topic)
-        rospy.loginfo('requester feedback topic: ' + feedback_topic)
-        self.pub = rospy.Publisher(feedback_topic, SchedulerRequests,
-                                   latch=True)
+        self.rset.attach(sched._observer)
+        self.body = None
+        """ Serialized requests of the last unframed message matching
+        :py:attr:`rset`, or ``None``. """
+        self.body_generation = None
+        """ :py:attr:`rset` generation when :py:attr:`body` was saved. """
+        self.skipped = 0
+        """ Number of repeated messages skipped without decoding. """
+        self.heartbeat_hz = None
+        """ Heartbeat frequency (Hz) announced by the requester, or
+        ``None`` if it does not support adaptive heartbeats. """
+        self.time_limit = sched.time_limit
+        """ Time limit (:class:`rospy.Duration`) since the last message
+        received, before this requester is considered lost. """
+        self.deadline = None
+        """ Latest deadline pushed on the scheduler's heap, or ``None``. """
+        self._negotiate(msg)
+
+        self.pub = self.sched.feedback_pub
+        """ Feedback topic publisher. """
+        if self.pub is None:    # requester has its own feedback topic?
+            feedback_topic = common.feedback_topic(self.requester_id,
+                                                   self.sched.topic)
+            rospy.loginfo('requester feedback topic: ' + feedback_topic)
+            self.pub = sched.transport.publisher(feedback_topic,
+                                                 SchedulerRequests,
+                                                 latch=True)
 
         # Cancel any out-of-date requests the requester had lying around.
         self.rset.cancel_out_of_date(reason=Request.TIMEOUT)
         self.sched.callback(self.rset)  # handle initial message
-        self.send_feedback()
+
+    def close(self):
+        """ Release resources after the requester is gone. """
+        self.rset.attach(None)
+        if self.pub is not self.sched.feedback_pub:
+            self.pub.unregister()
+
+    def _negotiate(self, msg):
+        """ Derive the time limit from the requester's heartbeat
+        frequency.
+
+        :param msg: Latest decoded message from the requester.
+        :type msg: scheduler_msgs/SchedulerRequests
+        """
+        hz = common.decode_frame(msg.header.frame_id).get('hz')
+        if hz is None:                  # not an adaptive requester?
+            self.heartbeat_hz = None
+            self.time_limit = self.sched.time_limit
+            return
+        # Never wait longer than for the slowest idle requester.
+        self.heartbeat_hz = max(float(hz), (self.sched.heartbeat_hz
+                                            * common.IDLE_HEARTBEAT_FACTOR))
+        self.time_limit = rospy.Duration(common.MISSED_HEARTBEATS
+                                         / self.heartbeat_hz)
+        if (self.deadline is not None
+                and self.last_msg_time + self.time_limit < self.deadline):
+            # The requester sped up, so check for it sooner.
+            with self.sched.lock:
+                self._schedule()
+
+    def _schedule(self):
+        """ Push a new deadline on the scheduler's heap.
+
+        Must be called holding the Big Scheduler Lock.
+        """
+        self.deadline = self.last_msg_time + self.time_limit
+        heapq.heappush(self.sched._deadlines,
+                       (self.deadline, self.requester_id))
+
+    def _throttle(self):
+        """ Tell a requester sending heartbeats faster than the
+        scheduler currently allows, so it can slow down. """
+        if (self.heartbeat_hz is not None
+                and self.heartbeat_hz > self.sched.heartbeat_hz):
+            self.sched._request_feedback(self)
 
     def send_feedback(self):
-        """ Send feedback message to requester. """
-        self.pub.publish(self.rset.to_msg())
+        """ Send feedback message to requester.
+
+        The message is constructed holding the Big Scheduler Lock,
+        because the *callback* for some other requester may be
+        modifying these requests.  It is published without that lock.
+        """
+        with self.sched.lock:
+            msg = copy_message(self.delta.outgoing(
+                self.rset, options={'hz': str(self.sched.heartbeat_hz)}))
+        self.pub.publish(msg)
 
     def update(self, msg):
         """ Update requester status.
 
-        :param msg: Latest resource allocation request.
-        :type msg: scheduler_msgs/SchedulerRequests
+        :param msg: Latest resource allocation request, either decoded
+            or serialized.
+        :type msg: scheduler_msgs/SchedulerRequests or
+            :class:`rospy.AnyMsg`
 
+        Most messages are heartbeats, repeating the previous requests.
+        If nothing has changed on either side since the last serialized
+        message matching :py:attr:`rset`, the message is not even
+        decoded.
+
+        In *concurrent* mode, any message is decoded without holding
+        the Big Scheduler Lock.  It is only acquired for comparing the
+        requests with :py:attr:`rset`, which the *callback* for some
+        other requester may be modifying.
         """
-        self.last_msg_time = msg.header.stamp
-        # Make a new RequestSet from this message
-        new_rset = RequestSet(msg, contents=ActiveRequest)
-        if self.rset != new_rset:       # something new?
-            self.rset.merge(new_rset)
-            self.sched.callback(self.rset)
-            if self.rset != new_rset:   # still different?
-                self.send_feedback()
+        buff = getattr(msg, '_buff', None)
+        body = None
+        if buff is None:                # already decoded?
+            self.last_msg_time = msg.header.stamp
+        else:
+            self.last_msg_time = _peek(buff)[0]
+            # Compare the protocol options and requests, skipping the
+            # header seq and stamp.  Delta protocol messages always
+            # differ, because each has a new sequence number.  Reading
+            # the generation counter needs no lock.
+            body = buff[12:]
+            if (body == self.body
+                    and self.rset.generation == self.body_generation):
+                self.skipped += 1
+                self._throttle()
+                return                  # same as last time
+            msg = SchedulerRequests().deserialize(buff)
+        self.body = None
+        self._negotiate(msg)
+        self._throttle()
+        pending = False
+        with self.sched.lock:
+            # Only the requests differing from self.rset are decoded.
+            new_rset, removed = self.delta.receive(msg,
+                                                   contents=ActiveRequest,
+                                                   current=self.rset)
+            if new_rset is None:        # duplicate or out of sequence?
+                pass                    # ignore it
+            elif not new_rset and not removed and body is not None:
+                self.body = body        # requester is up to date
+                self.body_generation = self.rset.generation
+            elif self.rset.differences(new_rset) or removed:  # changes?
+                self.rset.merge(new_rset, removed)
+                self.sched.callback(self.rset)
+                self.delta.sync(self.rset, new_rset)
+                pending = self.delta.pending(self.rset)
+        if pending:
+            self.sched._request_feedback(self)
+        if self.delta.urgent():         # requester needs a snapshot?
+            self.sched._request_feedback(self)
 
     def timeout(self, limit, event):
         """ Check for requester timeout.
@@ -126,12 +318,212 @@ class _RequesterStatus:
         if lost:                # lost contact with this requester?
             # Cancel every active request, so the callback will
             # recover everything it had allocated.
-            self.rset.cancel_all(reason=Request.TIMEOUT)
-            self.sched.callback(self.rset)
+            with self.sched.lock:
+                self.rset.cancel_all(reason=Request.TIMEOUT)
+                self.sched.callback(self.rset)
             # No one left to notify.
         return lost
 
 
+class Mailbox:
+    """
+    This class holds the newest message received from each requester,
+    until a worker thread is ready to handle it.  Older messages from
+    the same requester are dropped, because each one supersedes the
+    previous ones.
+
+    *Not for general use.*
+
+    Messages from one requester are never handled by two workers at
+    once, so they are always handled in the order received.
+    """
+
+    def __init__(self):
+        """ Constructor. """
+        self.cond = threading.Condition(threading.Lock())
+        """ Condition variable for waiting workers. """
+        self.messages = {}
+        """ Newest unhandled message, indexed by requester ID. """
+        self.ready = deque()
+        """ FIFO queue of requester IDs ready for handling. """
+        self.busy = set()
+        """ IDs of requesters currently being handled. """
+        self.dropped = 0
+        """ Number of stale messages dropped. """
+
+    def done(self, rqr_id):
+        """ Finish handling a requester's message.
+
+        :param rqr_id: Requester ID returned by :py:meth:`get`.
+        """
+        with self.cond:
+            self.busy.discard(rqr_id)
+            if rqr_id in self.messages:     # newer message arrived?
+                self.ready.append(rqr_id)
+                self.cond.notify()
+
+    def get(self, timeout=None):
+        """ Get next message to handle.
+
+        :param timeout: Seconds to wait for a message, or ``None``.
+        :returns: tuple of *(requester ID, message)*, or ``None`` if
+            no message arrived before the *timeout*.
+
+        Call :py:meth:`done` after handling the message.
+        """
+        with self.cond:
+            if not self.ready:
+                self.cond.wait(timeout)
+                if not self.ready:
+                    return None
+            rqr_id = self.ready.popleft()
+            self.busy.add(rqr_id)
+            return rqr_id, self.messages.pop(rqr_id)
+
+    def put(self, rqr_id, msg):
+        """ Add a message, replacing any unhandled one from the same
+        requester.
+
+        :param rqr_id: Requester ID.
+        :type rqr_id: :class:`uuid.UUID`
+        :param msg: Message received.
+        """
+        with self.cond:
+            if rqr_id in self.messages:
+                self.dropped += 1
+            elif rqr_id not in self.busy:
+                self.ready.append(rqr_id)
+                self.cond.notify()
+            self.messages[rqr_id] = msg
+
+
+class _Alarms:
+    """
+    Request set observer, updating the scheduler's
+    :class:`.RequestIndex` and scheduling *alarm* times in a
+    :class:`.TimingWheel`.
+
+    *Not for general use.*
+
+    A GRANTED request with a ``hold_time`` is due that long after it
+    was granted.  A RESERVED request with an ``availability`` time is
+    due then.  Any other status change cancels the alarm.
+    """
+
+    def __init__(self, index, wheel):
+        self.index = index
+        """ :class:`.RequestIndex` to keep up to date. """
+        self.wheel = wheel
+        """ :class:`.TimingWheel` of pending alarms. """
+        self.timers = {}
+        """ (status, :class:`.WheelTimer`) of each pending alarm,
+        indexed by request UUID. """
+
+    def added(self, rq):
+        """ Index a new request, and schedule its alarm, if any.
+
+        :param rq: Request being added.
+        :type rq: :class:`.ActiveRequest`
+        """
+        self.index.added(rq)
+        self._update(rq)
+
+    def changed(self, rq):
+        """ Update the index and the alarm after a request changed.
+
+        :param rq: Request that changed.
+        :type rq: :class:`.ActiveRequest`
+        """
+        self.index.changed(rq)
+        self._update(rq)
+
+    def removed(self, rq):
+        """ Remove a request from the index, cancelling its alarm.
+
+        :param rq: Request being removed.
+        :type rq: :class:`.ActiveRequest`
+        """
+        self.index.removed(rq)
+        timer = self.timers.pop(rq.uuid, None)
+        if timer is not None:
+            self.wheel.cancel(timer[1])
+
+    def _update(self, rq):
+        """ Schedule, keep or cancel the alarm for a request. """
+        msg = rq.msg
+        when = None
+        if (msg.status == Request.GRANTED
+                and msg.hold_time != rospy.Duration()):
+            timer = self.timers.get(rq.uuid)
+            if timer is not None and timer[0] == Request.GRANTED:
+                return                  # still holding
+            when = (rospy.Time.now() + msg.hold_time).to_sec()
+        elif (msg.status == Request.RESERVED
+                and msg.availability != rospy.Time()):
+            when = msg.availability.to_sec()
+        timer = self.timers.pop(rq.uuid, None)
+        if timer is not None:
+            self.wheel.cancel(timer[1])
+        if when is not None:
+            self.timers[rq.uuid] = (msg.status,
+                                    self.wheel.schedule(when, rq))
+
+
+class IntervalHistogram:
+    """
+    This class counts the intervals between successive events, such
+    as messages arriving, in buckets of increasing size.
+
+    :param bounds: Upper bound (in seconds) of each bucket, in
+        increasing order.  A final bucket counts the longer intervals.
+    :type bounds: sequence of float
+
+    A steady flow of messages fills the buckets near its average
+    interval.  Synchronized bursts show up as many very short
+    intervals, and some long ones.
+    """
+
+    def __init__(self, bounds=(0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+                               0.1, 0.2, 0.5, 1.0, 2.0, 5.0)):
+        """ Constructor. """
+        self.lock = threading.Lock()
+        """ Lock serializing updates from different threads. """
+        self.bounds = tuple(bounds)
+        """ Upper bound (in seconds) of each bucket, but the last. """
+        self.counts = [0] * (len(self.bounds) + 1)
+        """ Number of intervals counted in each bucket. """
+        self.last = None
+        """ Time (in seconds) of the latest event, or ``None``. """
+
+    def __str__(self):
+        lower = ('0',) + tuple(str(b) for b in self.bounds)
+        upper = tuple(str(b) for b in self.bounds) + ('inf',)
+        return '\n'.join(['[' + lo + ', ' + hi + '): ' + str(count)
+                          for lo, hi, count in zip(lower, upper,
+                                                   self.counts)])
+
+    def record(self, now=None):
+        """ Count the interval since the previous event.
+
+        :param now: Time (in seconds) of this event, or ``None`` for
+            the current time.
+        :type now: float
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            if self.last is not None:
+                interval = now - self.last
+                self.counts[bisect.bisect_right(self.bounds, interval)] += 1
+            self.last = now
+
+    def reset(self):
+        """ Clear all counts. """
+        with self.lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.last = None
+
+
 class Scheduler:
     """
     This class is used by a ROCON scheduler to manage all the resource
@@ -146,12 +538,41 @@ class Scheduler:
     :type frequency: float
     :param topic: Topic name for resource allocation requests.
     :type topic: str
+    :param concurrent: ``True`` to decode and answer messages from
+        different requesters in parallel, see
+        :ref:`Concurrent_Scheduler`.
+    :type concurrent: bool
+    :param workers: Number of worker threads handling messages from
+        the :py:attr:`mailbox`.  If zero, messages are handled by the
+        subscriber thread.
+    :type workers: int
+    :param coalesce: ``True`` to send at most one feedback message to
+        each requester after the *callback* returns, no matter how
+        many times it was notified.
+    :type coalesce: bool
+    :param shared_feedback: ``True`` to send feedback for every
+        requester on a single shared topic, instead of a separate
+        topic for each one.  Every requester must then be created
+        with the same option, or hosted by a :class:`.RequesterPool`.
+    :type shared_feedback: bool
+    :param transport: Message :mod:`.transport`, or ``None`` for the
+        usual ROS topics.  Every requester must use the same one.
+    :param alarm: Callback function invoked when a request's time
+        comes, or ``None``.
 
     .. describe:: callback(rset)
 
        :param rset: (:class:`.RequestSet`) The current status of all
            requests for some active requester.
 
+    .. describe:: alarm(rset, rq)
+
+       :param rset: (:class:`.RequestSet`) The current status of all
+           requests for the requester of *rq*.
+       :param rq: (:class:`.ActiveRequest`) A GRANTED request whose
+           ``hold_time`` has elapsed since it was granted, or a
+           RESERVED request whose ``availability`` time has arrived.
+
     The *callback* function is called when new or updated requests are
     received, already holding the :ref:`Big Scheduler Lock
     <Big_Scheduler_Lock>`.  It is expected to iterate over its
@@ -160,6 +581,52 @@ class Scheduler:
     then return without waiting.  The results will be sent to the
     requester after this callback returns.
 
+    .. _Concurrent_Scheduler:
+
+    In *concurrent* mode, each requester also has its own lock, which
+    serializes decoding, comparing and answering the messages of that
+    requester.  Only decoding messages, skipping unchanged heartbeats
+    and publishing feedback are done without the Big Scheduler Lock,
+    so they may overlap for different requesters.  That lock is still
+    held for comparing and merging updates, invoking the *callback*,
+    constructing feedback and managing the requesters.  Callbacks for
+    different requesters never run at the same time, so the *callback*
+    may modify the requests of any requester, and the lock protects
+    any resources shared between requesters.  Under the Python global
+    interpreter lock, little more than waiting for I/O really proceeds
+    in parallel.  In this mode, :py:meth:`.notify` defers sending
+    feedback until the *callback* returns, so messages are not
+    published while holding the Big Scheduler Lock.
+
+    When there are *workers*, incoming messages go to a
+    :class:`.Mailbox`, holding only the newest message from each
+    requester.  Busy requesters then cannot cause the loss of messages
+    from other ones.  With more than one worker, *concurrent* mode is
+    needed for handling different requesters in parallel.  Any
+    exception raised while handling a message is logged, and the
+    worker goes on to the next one.
+
+    .. _Adaptive_Heartbeats:
+
+    Requesters supporting adaptive heartbeats announce their current
+    heartbeat frequency with every message, and each one's time limit
+    is derived from it.  They send heartbeats at their full frequency
+    while any requests are pending, and less often once everything
+    has been granted.  Every feedback message advertises the maximum
+    :py:attr:`heartbeat_hz` the scheduler currently allows.  Any
+    requester sending faster than that gets feedback right away, so
+    it can slow down.
+
+    The *alarm* function is also called holding the Big Scheduler
+    Lock.  Alarm times are kept in a :class:`.TimingWheel`, updated
+    whenever a request is granted or reconciled, so no periodic scan
+    of every request is needed.  Like the *callback*, it may modify
+    the requests, which will then be sent to the requester.
+
+    For global decisions, such as granting the highest-priority
+    WAITING request of any requester, the *callback* can query the
+    :py:attr:`index` instead of examining every :class:`.RequestSet`.
+
     Usage example:
 
     .. literalinclude:: ../tests/example_scheduler.py
@@ -168,10 +635,25 @@ class Scheduler:
 
     def __init__(self, callback,
                  frequency=common.HEARTBEAT_HZ,
-                 topic=common.SCHEDULER_TOPIC):
+                 topic=common.SCHEDULER_TOPIC,
+                 concurrent=False,
+                 workers=0,
+                 coalesce=False,
+                 shared_feedback=False,
+                 transport=None,
+                 alarm=None):
         """ Constructor. """
         self.callback = callback
         """ Callback function for request updates. """
+        self.alarm = alarm
+        """ Callback function for request alarms, or ``None``. """
+        self.concurrent = concurrent
+        """ ``True`` if each requester has its own lock. """
+        self.coalesce = coalesce
+        """ ``True`` if feedback notifications are coalesced. """
+        self.feedback_saved = 0
+        """ Number of feedback messages saved by coalescing. """
+        self._flush_timer = None
         self.lock = threading.RLock()
         """
         .. _Big_Scheduler_Lock:
@@ -185,37 +667,241 @@ class Scheduler:
 
         In any other thread, acquire it when updating shared request
         set objects.  Never hold it when sleeping or waiting for I/O.
+
+        In *concurrent* mode, never acquire a requester's lock while
+        holding this one.
         """
+        self._dispatching = threading.local()
+        self._notify_pending = set()
+        """ IDs of requesters with deferred notifications. """
         self.requesters = {}
         """ Dictionary of active requesters and their requests. """
+        self.index = RequestIndex()
+        """ :class:`.RequestIndex` of the requests of every active
+        requester, only for use while holding the Big Scheduler Lock. """
+        self.wheel = None
+        """ :class:`.TimingWheel` of pending *alarm* times, or ``None``
+        if there is no *alarm* callback. """
+        self._observer = self.index
+        if alarm is not None:
+            self.wheel = TimingWheel(ALARM_RESOLUTION,
+                                     rospy.Time.now().to_sec())
+            self._observer = _Alarms(self.index, self.wheel)
         self.topic = topic
         """ Scheduler request topic name. """
+        if transport is None:
+            transport = RosTransport()
+        self.transport = transport
+        """ :mod:`.transport` for scheduler messages. """
         rospy.loginfo('scheduler request topic: ' + self.topic)
-        self.sub = rospy.Subscriber(self.topic, SchedulerRequests,
-                                    self._allocate_resources,
-                                    queue_size=1, tcp_nodelay=True)
+        self.feedback_pub = None
+        """ Shared feedback topic publisher, or ``None``. """
+        if shared_feedback:
+            feedback_topic = common.shared_feedback_topic(self.topic)
+            rospy.loginfo('shared feedback topic: ' + feedback_topic)
+            self.feedback_pub = self.transport.publisher(feedback_topic,
+                                                         SchedulerRequests)
+        self.mailbox = None
+        """ :class:`.Mailbox` for incoming messages, or ``None`` if
+        there are no *workers*. """
+        self.arrivals = IntervalHistogram()
+        """ :class:`.IntervalHistogram` of the intervals between
+        messages arriving from all requesters. """
+        self._handler = self._allocate_resources
+        if workers > 0:
+            self.mailbox = Mailbox()
+            self._handler = self._post
+            for i in range(workers):
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+        # Subscribe to serialized messages, so the handler can
+        # recognize repeated ones without decoding them.  Shared
+        # feedback requesters may be multiplexed by a RequesterPool
+        # over one connection, so do not limit the queue size then.
+        # The mailbox drops stale messages itself.
+        queue_size = 1
+        if shared_feedback or self.mailbox is not None:
+            queue_size = None
+        self.sub = self.transport.subscriber(self.topic, rospy.AnyMsg,
+                                             self._arrive,
+                                             queue_size=queue_size)
         self.duration = rospy.Duration(1.0 / frequency)
-        self.time_limit = self.duration * 4.0
+        self.time_limit = self.duration * common.MISSED_HEARTBEATS
+        """ Time limit (:class:`rospy.Duration`) for requesters not
+        announcing their heartbeat frequency. """
+        self.heartbeat_hz = frequency
+        """ Maximum heartbeat frequency (Hz) advertised to requesters
+        supporting :ref:`Adaptive_Heartbeats`.  Lower it when the
+        scheduler is overloaded. """
+        self._deadlines = []
+        """ Heap of (deadline, requester ID) pairs.  Deadlines are not
+        updated when messages arrive, so some are earlier than the
+        requester's actual deadline.  Those are replaced when they
+        expire.  When a requester's time limit shrinks, an earlier
+        deadline is pushed, and the requester's previous entry is
+        ignored when it expires. """
         self.timer = rospy.Timer(self.duration, self._watchdog)
-
-    def _allocate_resources(self, msg):
-        """ Scheduler resource allocation message handler. """
+        self.alarm_timer = None
+        """ Timer for checking *alarm* times, or ``None``. """
+        if alarm is not None:
+            self.alarm_timer = rospy.Timer(rospy.Duration(ALARM_RESOLUTION),
+                                           self._ring)
+
+    def _allocate_resources(self, msg, rqr_id=None):
+        """ Scheduler resource allocation message handler.
+
+        :param msg: Resource allocation request, usually serialized.
+        :type msg: :class:`rospy.AnyMsg` or
+            scheduler_msgs/SchedulerRequests
+        """
+        if rqr_id is None:
+            rqr_id = _requester_id(msg)
+        self._dispatching.active = True
+        try:
+            while True:
+                new = False
+                with self.lock:
+                    rqr = self.requesters.get(rqr_id)
+                    if rqr is None:     # new requester
+                        rqr = _RequesterStatus(self, _decode(msg))
+                        self.requesters[rqr_id] = rqr
+                        rqr._schedule()
+                        new = True
+                with rqr.lock:
+                    # make sure it did not time out in the meantime
+                    if self.requesters.get(rqr_id) is rqr:
+                        if new:         # answer its initial message
+                            self._request_feedback(rqr)
+                        else:
+                            rqr.update(msg)
+                        break
+                    if new:
+                        break
+        finally:
+            self._dispatching.active = False
+        self._flush_notifications()
+
+    def _flush_notifications(self, blocking=True):
+        """ Send any deferred requester notifications.
+
+        :param blocking: ``False`` to leave any requester currently
+            locked by another thread for that thread to notify.
+
+        Must be called without holding the Big Scheduler Lock, unless
+        *blocking* is ``False``.
+        """
+        while True:
+            with self.lock:
+                if not self._notify_pending:
+                    return
+                rqr_id = self._notify_pending.pop()
+                rqr = self.requesters.get(rqr_id)
+            if rqr is None:             # requester already gone?
+                continue
+            if not rqr.lock.acquire(blocking):
+                # Another thread is handling this requester, and will
+                # flush the notifications when done.
+                with self.lock:
+                    self._notify_pending.add(rqr_id)
+                return
+            try:
+                # make sure it did not time out in the meantime
+                if self.requesters.get(rqr_id) is rqr:
+                    rqr.send_feedback()
+            finally:
+                rqr.lock.release()
+
+    def _arrive(self, msg):
+        """ Scheduler topic message handler. """
+        if _wrong_type(msg):
+            header = msg._connection_header
+            rospy.logerr('scheduler ignoring ' + str(header.get('type'))
+                         + ' message from ' + str(header.get('callerid')))
+            return
+        self.arrivals.record()
+        self._handler(msg)
+
+    def _post(self, msg):
+        """ Scheduler message handler, when using workers. """
+        self.mailbox.put(_requester_id(msg), msg)
+
+    def _work(self):
+        """ Worker thread, handling messages from the mailbox. """
+        while not rospy.is_shutdown():
+            item = self.mailbox.get(timeout=1.0)
+            if item is None:            # nothing received lately
+                continue
+            rqr_id, msg = item
+            try:
+                self._allocate_resources(msg, rqr_id)
+            except Exception as e:      # keep serving other requesters
+                rospy.logerr('scheduler failed handling requester '
+                             + str(rqr_id) + ': ' + str(e))
+            finally:
+                self.mailbox.done(rqr_id)
+
+    def _ring(self, event):
+        """ Alarm timer handler, invoking the *alarm* callback for
+        every request whose time has come. """
+        due = []
         with self.lock:
-            rqr_id = unique_id.fromMsg(msg.requester)
-            rqr = self.requesters.get(rqr_id)
-            if rqr:                     # known requester?
-                rqr.update(msg)
-            else:                       # new requester
-                self.requesters[rqr_id] = _RequesterStatus(self, msg)
+            for rq in self.wheel.advance(event.current_real.to_sec()):
+                status = self._observer.timers.pop(rq.uuid)[0]
+                rqr = self.requesters.get(rq.owner.requester_id)
+                if rqr is not None:     # requester still known?
+                    due.append((rqr, rq, status))
+        self._dispatching.active = True
+        try:
+            for rqr, rq, status in due:
+                with rqr.lock:
+                    with self.lock:
+                        # make sure nothing changed in the meantime
+                        if (rq.owner is rqr.rset
+                                and rq.msg.status == status):
+                            generation = rqr.rset.generation
+                            self.alarm(rqr.rset, rq)
+                            if rqr.rset.generation != generation:
+                                self._defer_feedback(rqr.requester_id)
+        finally:
+            self._dispatching.active = False
+        self._flush_notifications()
 
     def _watchdog(self, event):
-        """ Scheduler request watchdog timer handler. """
-        # Must iterate over a copy of the dictionary items, because
-        # some may be deleted inside the loop.
+        """ Scheduler request watchdog timer handler.
+
+        Only examines requesters whose deadlines have passed.  Those
+        heard from since their deadline was recorded get a new one.
+        Entries replaced by an earlier deadline are discarded.
+        """
+        expired = []
         with self.lock:
-            for rqr_id, rqr in self.requesters.items():
-                if rqr.timeout(self.time_limit, event):
-                    del self.requesters[rqr_id]
+            while (self._deadlines
+                   and self._deadlines[0][0] < event.current_real):
+                deadline, rqr_id = heapq.heappop(self._deadlines)
+                rqr = self.requesters.get(rqr_id)
+                # skip requesters no longer known, and stale deadlines
+                if rqr is not None and rqr.deadline == deadline:
+                    expired.append(rqr)
+        self._dispatching.active = True
+        try:
+            for rqr in expired:
+                with rqr.lock:
+                    with self.lock:
+                        if rqr.timeout(rqr.time_limit, event):
+                            del self.requesters[rqr.requester_id]
+                            rqr.close()
+                        else:           # still active
+                            rqr._schedule()
+        finally:
+            self._dispatching.active = False
+        self._flush_notifications()
+
+    def _flush_event(self, event):
+        """ Coalesced notification timer handler. """
+        with self.lock:
+            self._flush_timer = None
+        self._flush_notifications()
 
     def notify(self, requester_id):
         """ Notify requester of status updates.
@@ -225,6 +911,50 @@ class Scheduler:
 
         :raises: :exc:`KeyError` if unknown requester identifier.
 
+        In *concurrent* mode, the feedback is sent after the current
+        *callback* returns.  When invoked from some other thread, it
+        is sent immediately, unless that requester's messages are
+        being handled by another thread, which will send it instead.
+
+        With *coalesce*, the feedback is also sent after the current
+        *callback* returns.  When invoked from some other thread, it
+        is sent after :py:const:`COALESCE_DELAY` seconds.
+
         """
         with self.lock:
-            self.requesters[requester_id].send_feedback()
+            rqr = self.requesters[requester_id]
+            if not self.concurrent and not self.coalesce:
+                rqr.send_feedback()
+                return
+            self._defer_feedback(requester_id)
+            if getattr(self._dispatching, 'active', False):
+                return                  # sent after callback returns
+            if self.coalesce:
+                if self._flush_timer is None:
+                    self._flush_timer = rospy.Timer(
+                        rospy.Duration(COALESCE_DELAY),
+                        self._flush_event, oneshot=True)
+                return
+        self._flush_notifications(blocking=False)
+
+    def _defer_feedback(self, requester_id):
+        """ Mark requester for feedback, when notifications are flushed.
+
+        Invoked holding the Big Scheduler Lock.
+        """
+        if requester_id in self._notify_pending:
+            self.feedback_saved += 1
+        else:
+            self._notify_pending.add(requester_id)
+
+    def _request_feedback(self, rqr):
+        """ Send feedback to a requester, unless coalescing.
+
+        :param rqr: Requester needing feedback.
+        :type rqr: :class:`._RequesterStatus`
+        """
+        if self.coalesce:
+            with self.lock:
+                self._defer_feedback(rqr.requester_id)
+        else:
+            rqr.send_feedback()
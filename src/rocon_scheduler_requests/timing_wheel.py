@@ -0,0 +1,208 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (C) 2014, Jack O'Quin
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the author nor of other contributors may be
+#    used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+.. module:: timing_wheel
+
+This module provides a hierarchical timing wheel, which tracks many
+pending deadlines, such as request hold times and reservations,
+without scanning all of them.
+
+Time is divided into ticks of a fixed *resolution*.  The first level
+of the wheel has one slot for each of the next few ticks.  Each
+higher level has slots covering a whole turn of the level below it.
+As time advances, the entries in each higher-level slot are moved
+down, once they are near enough for the lower level to hold them.
+
+Adding or cancelling an entry takes O(1) time.  Advancing the wheel
+takes O(1) time per tick, plus the cost of moving each entry down at
+most once per level, and returning the items due.
+
+"""
+
+# enable some python3 compatibility options:
+from __future__ import absolute_import, print_function, unicode_literals
+
+import math
+
+
+class WheelTimer:
+    """
+    An entry scheduled in a :class:`.TimingWheel`.
+
+    *Not for general use.*
+    """
+    __slots__ = ('tick', 'item', 'slot')
+
+    def __init__(self, tick, item):
+        self.tick = tick
+        """ Tick when this entry is due. """
+        self.item = item
+        """ Caller-provided item, returned when due. """
+        self.slot = None
+        """ Set holding this entry, ``None`` once due or cancelled. """
+
+
+class TimingWheel:
+    """
+    This class holds items until their deadlines arrive.
+
+    :param resolution: Length (in seconds) of each tick.  Deadlines
+        are rounded up to the next tick.
+    :type resolution: float
+    :param start: Current time (in seconds).
+    :type start: float
+    :param slots: Number of slots in each level.
+    :type slots: int
+    :param levels: Number of levels.  Deadlines more than
+        *slots* ** *levels* ticks away are held in the highest level
+        until they come within range.
+    :type levels: int
+
+    .. describe:: len(wheel)
+
+       :returns: The number of items scheduled.
+
+    """
+
+    def __init__(self, resolution, start, slots=64, levels=4):
+        """ Constructor. """
+        self.resolution = resolution
+        """ Length (in seconds) of each tick. """
+        self.slots = slots
+        """ Number of slots in each level. """
+        self.tick = int(math.floor(start / resolution))
+        """ Latest tick reached. """
+        self._wheels = [[set() for i in range(slots)]
+                        for level in range(levels)]
+        self._spans = [slots ** level for level in range(levels + 1)]
+        self._ready = set()             # entries already due
+        self._count = 0
+
+    def __len__(self):
+        """ Number of items scheduled. """
+        return self._count
+
+    def _place(self, entry):
+        """ Put an entry in the slot for its deadline. """
+        delta = entry.tick - self.tick
+        if delta <= 0:
+            slot = self._ready
+        else:
+            tick = entry.tick
+            if delta >= self._spans[-1]:        # beyond the top level?
+                # Hold it in the last slot reached, and place it again
+                # once that slot's entries are moved down.
+                tick = self.tick + self._spans[-1] - 1
+                delta = self._spans[-1] - 1
+            level = 0
+            while delta >= self._spans[level + 1]:
+                level += 1
+            slot = self._wheels[level][(tick // self._spans[level])
+                                       % self.slots]
+        slot.add(entry)
+        entry.slot = slot
+
+    def advance(self, now):
+        """ Advance the wheel to the current time.
+
+        :param now: Current time (in seconds).
+        :type now: float
+        :returns: list of items now due.
+        """
+        target = int(math.floor(now / self.resolution))
+        due = []
+        self._expire(self._ready, due)
+        if not self._count:             # nothing scheduled?
+            self.tick = max(self.tick, target)
+        while self.tick < target:
+            self.tick += 1
+            if self.tick % self.slots == 0:
+                # Move entries down from each higher level starting a
+                # new slot, beginning with the highest.
+                for level in range(len(self._wheels) - 1, 0, -1):
+                    if self.tick % self._spans[level] == 0:
+                        index = ((self.tick // self._spans[level])
+                                 % self.slots)
+                        slot = self._wheels[level][index]
+                        self._wheels[level][index] = set()
+                        for entry in slot:
+                            self._place(entry)
+            index = self.tick % self.slots
+            slot = self._wheels[0][index]
+            self._wheels[0][index] = set()
+            self._expire(slot, due)
+            self._expire(self._ready, due)
+            if not self._count:
+                self.tick = target
+        return due
+
+    def cancel(self, entry):
+        """ Cancel a scheduled item.
+
+        :param entry: Entry returned by :py:meth:`.schedule`.
+        :type entry: :class:`.WheelTimer`
+
+        Cancelling an item already due, or already cancelled, does
+        nothing.
+        """
+        if entry.slot is not None:
+            entry.slot.discard(entry)
+            entry.slot = None
+            self._count -= 1
+
+    def schedule(self, when, item):
+        """ Schedule an item.
+
+        :param when: Deadline (in seconds).
+        :type when: float
+        :param item: Any object, returned by :py:meth:`.advance` once
+            its deadline arrives.
+        :returns: :class:`.WheelTimer` entry, for cancelling it.
+        """
+        entry = WheelTimer(int(math.ceil(when / self.resolution)), item)
+        self._place(entry)
+        self._count += 1
+        return entry
+
+    def _expire(self, slot, due):
+        """ Remove every entry from a slot, appending the items due to
+        a list.  Entries held for a later turn are placed again. """
+        entries = list(slot)
+        slot.clear()
+        for entry in entries:
+            if entry.tick > self.tick:  # beyond the top level?
+                self._place(entry)
+            else:
+                entry.slot = None
+                due.append(entry.item)
+                self._count -= 1
@@ -61,6 +61,7 @@ import unique_id
 
 from scheduler_msgs.msg import Request, SchedulerRequests
 from . import TransitionError
+from . import interning
 
 # Starting and terminal request states:
 STARTING_STATES = frozenset([Request.NEW, Request.RESERVED])
@@ -103,6 +104,15 @@ TRANS_TABLE = frozenset([
     (Request.WAITING, Request.PREEMPTING),
     (Request.WAITING, Request.WAITING)])
 
+## Compiled merge table.
+#
+#  A tuple indexed by old status, giving a bit mask of the new status
+#  values allowed by TRANS_TABLE, which remains the definitive source.
+#
+_TRANS_MASKS = tuple(
+    sum([1 << new for old, new in TRANS_TABLE if old == status])
+    for status in range(1 + max([max(pair) for pair in TRANS_TABLE])))
+
 
 class _EventTranitions:
     """
@@ -113,12 +123,27 @@ class _EventTranitions:
     :param trans: Dictionary of valid status transitions.
     :type trans: dict
 
+    The *trans* dictionary is compiled into a tuple indexed by old
+    status, and a bit mask of the old status values it accepts.
+
     """
     def __init__(self, name, trans):
         self.name = name
         """ Name of this event type. """
         self.trans = trans
         """ Dictionary of valid status transitions. """
+        self.table = tuple(trans.get(status)
+                           for status in range(1 + max(trans.keys())))
+        """ New status for each old status, or ``None`` if invalid. """
+        self.mask = sum([1 << status for status in trans.keys()])
+        """ Bit mask of valid old status values. """
+
+    def next_status(self, status):
+        """ :returns: new status after this event in the old *status*,
+            or ``None`` if not valid. """
+        if 0 <= status < len(self.table):
+            return self.table[status]
+        return None
 
 ##  Requester or scheduler transitions:
 #
@@ -181,13 +206,35 @@ class RequestBase(object):
 
        :returns: String representation of this resource request.
 
+    Request objects define ``__slots__``, so they have no per-instance
+    ``__dict__``, and no other attributes may be added to them.  On
+    recent Python versions, whose instance dicts are already compact,
+    that saves only about 40 bytes per request; most of the memory
+    belongs to the message itself and its canonical UUID.
+
+    The *msg* is kept, not copied, and its ``resources`` list is
+    replaced with shared :mod:`.interning` resource messages, which
+    many other requests may also contain.  Callers must not modify
+    *msg* after passing it in, and nobody may modify any of those
+    resource messages in place: assign a new ``resources`` list
+    instead.
+
     """
+    __slots__ = ('msg', 'uuid', 'generation', 'owner')
+
     def __init__(self, msg):
         """ Constructor. """
+        # Share the resources, modifying the caller's msg (see above).
+        msg.resources = interning.resources(msg.resources)
         self.msg = msg
         """ Corresponding *scheduler_msgs/Request* message. """
-        self.uuid = unique_id.fromMsg(msg.id)
+        self.uuid = interning.uuid_from_msg(msg.id)
         """ The :class:`uuid.UUID` of this request. """
+        self.generation = 0
+        """ Change counter, incremented whenever this request is
+        modified by a state transition or a merge operation. """
+        self.owner = None
+        """ The :class:`.RequestSet` containing this request, or ``None``. """
 
     def cancel(self, reason=None):
         """ Cancel a previously-requested resource.
@@ -205,6 +252,17 @@ class RequestBase(object):
             + '\n    resources: ' + self._str_resources() \
             + '\n    status: ' + str(self.msg.status)
 
+    def touch(self):
+        """ Record a change to this request.
+
+        Transitions and merges update the :py:attr:`generation`
+        counter automatically.  Call this method after modifying any
+        :py:attr:`msg` fields directly.
+        """
+        self.generation += 1
+        if self.owner is not None:
+            self.owner._touched(self)
+
     def _str_resources(self):
         """ Format requested resource into a human-readable string. """
         retval = ''
@@ -212,22 +270,40 @@ class RequestBase(object):
             retval += '\n      ' + res.platform_info + '#' + res.name
         return retval
 
-    def _transition(self, event, reason=None):
+    def _transition(self, event, reason=None, resources=None):
         """
         Update status for this resource request.
 
         :param event: Transition table for this type of *event*.
         :type event: :class:`._EventTranitions`
         :param reason: Reason code for transition, or ``None``.
+        :param resources: New resource list, or ``None``.
         :raises: :exc:`.TransitionError` if not a valid transition.
         """
-        new_status = event.trans.get(self.msg.status)
+        new_status = event.next_status(self.msg.status)
         if new_status is None:
             raise TransitionError('invalid event ' + event.name
                                   + ' in state ' + str(self.msg.status))
-        self.msg.status = new_status
-        if reason is not None:
+        self._update(new_status, reason, resources)
+
+    def _update(self, new_status, reason=None, resources=None):
+        """
+        Apply a valid status transition to this resource request.
+
+        :param new_status: New status for this request.
+        :param reason: Reason code for transition, or ``None``.
+        :param resources: New resource list, or ``None``.
+        """
+        if reason is None:
+            reason = self.msg.reason
+        if resources is None:
+            resources = self.msg.resources
+        if (new_status != self.msg.status or reason != self.msg.reason
+                or resources != self.msg.resources):
+            self.msg.status = new_status
             self.msg.reason = reason
+            self.msg.resources = resources
+            self.touch()
 
     def _validate(self, new_status):
         """
@@ -236,7 +312,10 @@ class RequestBase(object):
         :param new_status: Proposed new status for this request.
         :returns: ``True`` if this is a valid state transition.
         """
-        return (self.msg.status, new_status) in TRANS_TABLE
+        try:
+            return bool(_TRANS_MASKS[self.msg.status] & (1 << new_status))
+        except (IndexError, ValueError):    # status out of range
+            return False
 
 
 class ResourceRequest(RequestBase):
@@ -244,11 +323,15 @@ class ResourceRequest(RequestBase):
     This represents a single resource request created by and for its
     original requester.
 
-    :param msg: ROCON scheduler request message.
+    :param msg: ROCON scheduler request message, kept as
+        :py:attr:`msg` without copying it.
     :type msg: scheduler_msgs/Request
 
-    Provides all attributes defined for :class:`.RequestBase`.
+    Provides all attributes defined for :class:`.RequestBase`, which
+    describes the restrictions on modifying *msg* and its resources.
     """
+    __slots__ = ()
+
     def reconcile(self, update):
         """
         Reconcile scheduler updates with requester status for a merge
@@ -265,28 +348,51 @@ class ResourceRequest(RequestBase):
         if update is None:      # this request not yet known to scheduler?
             return              # leave it alone
         if self._validate(update.msg.status):
-            self.msg.status = update.msg.status
-            self.msg.priority = update.msg.priority
-            self.msg.resources = update.msg.resources
-            if update.msg.availability != rospy.Time():
-                self.msg.availability = update.msg.availability  # test gap
+            msg = update.msg
+            availability = self.msg.availability
+            if msg.availability != rospy.Time():
+                availability = msg.availability     # test gap
+            if (msg.status != self.msg.status
+                    or msg.priority != self.msg.priority
+                    or availability != self.msg.availability
+                    or msg.resources != self.msg.resources):
+                self.msg.status = msg.status
+                self.msg.priority = msg.priority
+                self.msg.resources = msg.resources
+                self.msg.availability = availability
+                self.touch()
 
 
 class ActiveRequest(RequestBase):
     """
     This represents a single active resource known to the scheduler.
 
-    :param msg: ROCON scheduler request message.
+    :param msg: ROCON scheduler request message, kept as
+        :py:attr:`msg` without copying it.
     :type msg: scheduler_msgs/Request
 
-    Provides all attributes defined for :class:`.RequestBase`.
+    Provides all attributes defined for :class:`.RequestBase`, which
+    describes the restrictions on modifying *msg* and its resources.
     """
+    __slots__ = ('_allocations',)
+
     def __init__(self, msg):
         """ Constructor """
         super(ActiveRequest, self).__init__(msg)
-        self.allocations = []
+        self._allocations = None
+
+    @property
+    def allocations(self):
         """ List of resources actually allocated for this request (not
-        just those requested). """
+        just those requested).  Empty until the request is granted,
+        then the same list as ``msg.resources``, unless assigned. """
+        if self._allocations is None:
+            return []
+        return self._allocations
+
+    @allocations.setter
+    def allocations(self, resources):
+        self._allocations = resources
 
     def close(self):
         """ Close resource request.
@@ -306,9 +412,9 @@ class ActiveRequest(RequestBase):
         resources really do fully satisfy this request.
 
         """
-        self._transition(EVENT_GRANT, reason=Request.NONE)
-        self.msg.resources = resources
-        self.allocations = resources
+        self._transition(EVENT_GRANT, reason=Request.NONE,
+                         resources=resources)
+        self._allocations = self.msg.resources
 
     def reconcile(self, update):
         """
@@ -325,14 +431,23 @@ class ActiveRequest(RequestBase):
             # update is present, the requester has either deleted this
             # request, or a new requester instance no longer knows
             # about it.  So, consider it closed.
-            update = ResourceRequest(self.msg)
-            update.msg.status = Request.CLOSED
-        if self._validate(update.msg.status):
-            self.msg.status = update.msg.status
-            self.msg.hold_time = update.msg.hold_time
-            if (update.msg.status == Request.RESERVED
-                    and update.msg.availability != rospy.Time()):
-                self.msg.availability = update.msg.availability
+            if self.msg.status != Request.CLOSED:
+                self.msg.status = Request.CLOSED
+                self.touch()
+            return
+        msg = update.msg
+        if self._validate(msg.status):
+            availability = self.msg.availability
+            if (msg.status == Request.RESERVED
+                    and msg.availability != rospy.Time()):
+                availability = msg.availability
+            if (msg.status != self.msg.status
+                    or msg.hold_time != self.msg.hold_time
+                    or availability != self.msg.availability):
+                self.msg.status = msg.status
+                self.msg.hold_time = msg.hold_time
+                self.msg.availability = availability
+                self.touch()
 
     def preempt(self, reason=Request.NONE):
         """ Preempt a previously granted request.
@@ -359,6 +474,74 @@ class ActiveRequest(RequestBase):
         self._transition(EVENT_WAIT, reason)
 
 
+def transition_all(requests, event, reason=None):
+    """ Apply the same event to many requests.
+
+    :param requests: Requests to update.
+    :type requests: iterable of :class:`.RequestBase`
+    :param event: Transition table for this type of *event*, like
+        :py:const:`EVENT_CANCEL`.
+    :type event: :class:`._EventTranitions`
+    :param reason: Reason code for transition, or ``None``.
+
+    :returns: list of requests for which *event* was not valid,
+        which were left unchanged.  No :exc:`.TransitionError` is
+        raised.
+    """
+    rejected = []
+    for rq in requests:
+        new_status = event.next_status(rq.msg.status)
+        if new_status is None:
+            rejected.append(rq)
+        else:
+            rq._update(new_status, reason)
+    return rejected
+
+
+def validate_all(requests, event):
+    """ Check many requests for the same event.
+
+    :param requests: Requests to check.
+    :type requests: iterable of :class:`.RequestBase`
+    :param event: Transition table for this type of *event*.
+    :type event: :class:`._EventTranitions`
+
+    :returns: list of the *requests* for which *event* is valid.
+    """
+    mask = event.mask
+    return [rq for rq in requests
+            if rq.msg.status >= 0 and (mask >> rq.msg.status) & 1]
+
+
+def _same_request(msg, other_msg):
+    """ Compare the contents of two *scheduler_msgs/Request* messages.
+
+    :returns: ``True`` if they have the same contents, ignoring the
+        difference between request and reply messages.
+    """
+    return (msg.status == other_msg.status
+            and msg.priority == other_msg.priority
+            and msg.availability == other_msg.availability
+            and msg.hold_time == other_msg.hold_time
+            and msg.resources == other_msg.resources)
+
+
+def _request_digest(rq):
+    """ Compute a hash of the contents compared by :func:`._same_request`.
+
+    :param rq: Request to hash.
+    :type rq: :class:`.RequestBase`
+    :returns: integer digest, equal for requests with the same UUID
+        and contents.
+    """
+    msg = rq.msg
+    return hash((rq.uuid, msg.status, msg.priority,
+                 msg.availability.secs, msg.availability.nsecs,
+                 msg.hold_time.secs, msg.hold_time.nsecs,
+                 tuple([(res.platform_info, res.name)
+                        for res in msg.resources])))
+
+
 class RequestSet:
     """
     This class is a container for all the resource requests or
@@ -393,11 +576,19 @@ class RequestSet:
        :param uuid: (:class:`uuid.UUID`) UUID of the request.
        :param msg: (*scheduler_msgs/Request*) message to add.
 
+    .. describe:: del rset[uuid]
+
+       Remove the request for this *uuid*.
+
+       :raises: :exc:`KeyError` if no such request.
+
     .. describe:: rset == other
 
        :returns: ``True`` if *rset* and *other* have the same contents.
 
         Ignores the difference between request and reply messages.
+        Sets with different :py:meth:`.digest` values are known to
+        differ without comparing their contents.
 
     .. describe:: rset != other
 
@@ -434,39 +625,51 @@ class RequestSet:
         # Request messages.
         if isinstance(reqs, SchedulerRequests):
             self.stamp = reqs.header.stamp
-            self.requester_id = unique_id.fromMsg(reqs.requester)
+            self.requester_id = interning.uuid_from_msg(reqs.requester)
             # Reset *reqs* to list of requests from the message.
             reqs = reqs.requests
         if self.requester_id is None:
             raise TypeError('Requester ID missing.')
 
+        self.generation = 0
+        """ Change counter, incremented whenever any request in this
+        set is added, removed or modified. """
+
+        self.observer = None
+        """ Object notified of every change to this set, or ``None``
+        (see :py:meth:`.attach`). """
+
         self.requests = {}
         """ Dictionary of active requests. """
+        self._by_status = {}
+        self._digest = None
+        self._digests = {}
         for msg in reqs:
             rq = self.contents(msg)
-            self.requests[rq.uuid] = rq
+            if rq.uuid in self.requests:    # repeated ID: last one wins
+                self._remove(rq.uuid)
+            self._add(rq)
 
     def __contains__(self, uuid):
         """ Request set membership. """
         return uuid in self.requests
 
+    def __delitem__(self, uuid):
+        """ Remove the request for this *uuid*. """
+        self._remove(uuid)
+
     def __eq__(self, other):
         """ RequestSet equality operator. """
         if self.requester_id != other.requester_id:
             return False        # different requester
+        if len(self.requests) != len(other.requests):
+            return False        # different number of requests
+        if self.digest() != other.digest():
+            return False        # different contents
         if set(self.requests.keys()) != set(other.requests.keys()):
             return False        # different request IDs
         for rqid, rq in self.requests.items():
-            other_msg = other[rqid].msg
-            if rq.msg.status != other_msg.status:
-                return False
-            if rq.msg.priority != other_msg.priority:
-                return False
-            if rq.msg.availability != other_msg.availability:
-                return False
-            if rq.msg.hold_time != other_msg.hold_time:
-                return False
-            if rq.msg.resources != other_msg.resources:
+            if not _same_request(rq.msg, other[rqid].msg):
                 return False
         return True
 
@@ -490,7 +693,9 @@ class RequestSet:
 
     def __setitem__(self, uuid, msg):
         """ Assign a Request message for this *uuid*. """
-        self.requests[uuid] = self.contents(msg)  # test gap
+        if uuid in self.requests:
+            self._remove(uuid)          # test gap
+        self._add(self.contents(msg))   # test gap
 
     def __str__(self):
         rval = 'requester_id: ' + str(self.requester_id) + '\nrequests:'
@@ -498,14 +703,100 @@ class RequestSet:
             rval += '\n  ' + str(rq)
         return rval
 
+    def _add(self, rq):
+        """ Add a request object to this set and its indexes. """
+        rq.owner = self
+        self.requests[rq.uuid] = rq
+        self._by_status.setdefault(rq.msg.status, {})[rq.uuid] = rq
+        self.generation += 1
+        if self._digest is not None:
+            digest = _request_digest(rq)
+            self._digests[rq.uuid] = digest
+            self._digest ^= digest
+        if self.observer is not None:
+            self.observer.added(rq)
+
+    def _remove(self, uuid):
+        """ Remove a request from this set and its indexes. """
+        rq = self.requests.pop(uuid)
+        self._unindex(uuid)
+        self.generation += 1
+        if self._digest is not None:
+            self._digest ^= self._digests.pop(uuid)
+        if self.observer is not None:
+            self.observer.removed(rq)
+        rq.owner = None
+
+    def _touched(self, rq):
+        """ Update indexes after a change to request *rq*. """
+        bucket = self._by_status.get(rq.msg.status)
+        if bucket is None or rq.uuid not in bucket:     # status changed?
+            self._unindex(rq.uuid)
+            self._by_status.setdefault(rq.msg.status, {})[rq.uuid] = rq
+        self.generation += 1
+        if self._digest is not None:
+            digest = _request_digest(rq)
+            self._digest ^= self._digests[rq.uuid] ^ digest
+            self._digests[rq.uuid] = digest
+        if self.observer is not None:
+            self.observer.changed(rq)
+
+    def _unindex(self, uuid):
+        """ Remove a request from its status bucket.
+
+        Its previous status is not recorded, so look in each bucket.
+        There are only a few, and empty ones are deleted.
+        """
+        for status, bucket in self._by_status.items():
+            if bucket.pop(uuid, None) is not None:
+                if not bucket:
+                    del self._by_status[status]
+                return
+
+    def attach(self, observer):
+        """ Report all changes to this set to an *observer*.
+
+        :param observer: Object with ``added(rq)``, ``changed(rq)`` and
+            ``removed(rq)`` methods, like a :class:`.RequestIndex`; or
+            ``None`` to stop reporting.
+
+        The previous observer, if any, is told every request was
+        removed, and the new one is told every request was added.
+        """
+        if self.observer is not None:
+            for rq in self.requests.values():
+                self.observer.removed(rq)
+        self.observer = observer
+        if observer is not None:
+            for rq in self.requests.values():
+                observer.added(rq)
+
+    def by_status(self, status):
+        """ Find requests with a given status.
+
+        :param status: Desired *scheduler_msgs/Request* status.
+        :type status: int
+
+        :returns: list of requests currently in *status*, taken from
+            an index, without examining the rest of the set.
+
+        The index is updated by every state transition and merge.
+        After modifying some request's ``msg.status`` directly, call
+        its :py:meth:`.touch` method to keep the index current.
+
+        """
+        bucket = self._by_status.get(status)
+        if not bucket:
+            return []
+        return list(bucket.values())
+
     def cancel_all(self, reason=None):
         """ Cancel every active request in this set.
 
         :param reason: Reason code for mass cancellation, or ``None``.
         """
         # test gap:
-        for rq in self.requests.values():
-            rq.cancel(reason=reason)
+        transition_all(self.requests.values(), EVENT_CANCEL, reason)
 
     def cancel_out_of_date(self, reason=None):
         """ Cancel every out-of-date request in this set.
@@ -518,9 +809,90 @@ class RequestSet:
         :param reason: Reason code for mass cancellation, or ``None``.
         """
         # test gap:
-        for rq in self.requests.values():
-            if rq.msg.status not in STARTING_STATES:
-                rq.cancel(reason=reason)
+        for status in list(self._by_status.keys()):
+            if status not in STARTING_STATES:
+                for rq in self.by_status(status):
+                    rq.cancel(reason=reason)
+
+    def diff(self, reqs):
+        """ Compare with a complete list of request messages.
+
+        :param reqs: List of ``Request`` messages, like the
+            ``requests`` component of a ``SchedulerRequests`` message.
+
+        :returns: tuple of *(updates, removed)*, suitable for
+            :py:meth:`.merge`.  The *updates* :class:`.RequestSet`
+            contains only the messages for requests missing from this
+            set or with different contents.  *removed* lists the UUIDs
+            of requests in this set but not in *reqs*.
+
+        Requests are matched using the raw bytes of their IDs, looked
+        up in the :mod:`.interning` table, and only the differing
+        messages are converted to request objects, so unchanged
+        requests cost very little.
+
+        """
+        changed = []
+        seen = set()
+        matched = 0                     # requests also in this set
+        for msg in reqs:
+            raw = bytes(bytearray(msg.id.uuid))
+            if raw in seen:
+                continue
+            seen.add(raw)
+            # Every request in this set has a canonical UUID.
+            rq = self.requests.get(interning.known_uuid(raw))
+            if rq is None:
+                changed.append(msg)
+            else:
+                matched += 1
+                if not _same_request(rq.msg, msg):
+                    changed.append(msg)
+        removed = []
+        if matched < len(self.requests):
+            removed = [rid for rid in self.requests
+                       if rid.bytes not in seen]
+        updates = RequestSet(changed, self.requester_id,
+                             contents=self.contents)
+        return updates, removed
+
+    def digest(self):
+        """ Content digest of this set.
+
+        :returns: integer combining the UUID and contents of every
+            request, as compared by the ``==`` operator.  Equal sets
+            always have equal digests, so different digests mean the
+            sets differ.
+
+        The digest is only computed when first needed.  After that,
+        it is updated incrementally whenever a request is added,
+        removed or :py:meth:`touched <.RequestBase.touch>`.
+        """
+        if self._digest is None:
+            self._digests = {}
+            self._digest = 0
+            for rid, rq in self.requests.items():
+                digest = _request_digest(rq)
+                self._digests[rid] = digest
+                self._digest ^= digest
+        return self._digest
+
+    def differences(self, updates):
+        """ Find requests with different contents in some updates.
+
+        :param updates: Request set containing updated information.
+        :type updates: :class:`.RequestSet`
+
+        :returns: list of UUIDs for every request in *updates* which
+            is either missing from this set or has different contents.
+
+        """
+        diffs = []
+        for rid, new_rq in updates.items():
+            rq = self.requests.get(rid)
+            if rq is None or not _same_request(rq.msg, new_rq.msg):
+                diffs.append(rid)
+        return diffs
 
     def get(self, uuid, default=None):
         """ Get request, if known.
@@ -560,12 +932,16 @@ class RequestSet:
         """
         return [rq.msg for rq in self.requests.values()]
 
-    def merge(self, updates):
+    def merge(self, updates, removed=None):
         """
         Merge new request information into this RequestSet.
 
         :param updates: Request set containing updated information.
         :type updates: :class:`.RequestSet`
+        :param removed: UUIDs of requests no longer present, if
+            *updates* only contains the requests that changed;
+            ``None`` if *updates* is a complete request set.
+        :type removed: list of :class:`uuid.UUID` or ``None``
 
         This is *not* a :py:meth:`set.update` or :py:meth:`set.union`
         operation:
@@ -579,24 +955,51 @@ class RequestSet:
         * Any element reaching a terminal status known by both sides
           of the protocol will be deleted.
 
+        When *removed* is provided, elements missing from the
+        *updates* are left unchanged, unless their UUIDs appear in
+        *removed*.
+
+        :returns: list of UUIDs for every request added, deleted or
+            modified by this merge, empty if nothing changed.
+
+        Since each request's :py:attr:`.generation` counter is only
+        incremented when something actually changes, the caller can
+        check the result instead of comparing against a copy of the
+        previous contents.
+
         """
+        changed = []
+
         # Add any new requests not previously known.
         for rid, new_rq in updates.items():
             if (rid not in self.requests and
                     new_rq.msg.status in STARTING_STATES):
-                self.requests[rid] = self.contents(new_rq.msg)  # test gap
-
-        # Reconcile each existing request with the updates.  Make a
-        # copy of the dictionary items, so it can be altered in the loop.
-        for rid, rq in self.requests.items():
+                self._add(self.contents(new_rq.msg))    # test gap
+                changed.append(rid)
+
+        # Reconcile each affected request with the updates.  Make a
+        # list of their IDs, so the dictionary can be altered in the loop.
+        if removed is None:             # complete request set?
+            rids = list(self.requests.keys())
+        else:                           # only changes
+            rids = [rid for rid in updates.keys() if rid in self.requests]
+            rids.extend([rid for rid in removed if rid in self.requests])
+        for rid in rids:
+            rq = self.requests[rid]
             new_rq = updates.get(rid)
             if ((rq.msg.status == Request.CANCELING and
+                    new_rq is not None and
                     new_rq.msg.status == Request.CLOSED)
                     or (rq.msg.status == Request.CLOSED and
                         new_rq is None)):
-                del self.requests[rid]  # no longer needed
+                self._remove(rid)       # no longer needed
+                changed.append(rid)
             else:
+                generation = rq.generation
                 rq.reconcile(new_rq)
+                if rq.generation != generation:
+                    changed.append(rid)
+        return changed
 
     def to_msg(self, stamp=None):
         """ Convert to ROS ``scheduler_msgs/SchedulerRequest`` message.
@@ -0,0 +1,433 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (C) 2014, Jack O'Quin
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the author nor of other contributors may be
+#    used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+.. module:: transport
+
+This module defines how :class:`.Requester` and :class:`.Scheduler`
+objects exchange `scheduler_msgs/SchedulerRequests`_ messages.
+
+A transport object provides two methods:
+
+.. describe:: publisher(topic, msg_class, latch=False)
+
+   :returns: a new publisher for *topic*, with ``publish(msg)`` and
+       ``unregister()`` methods.
+
+.. describe:: subscriber(topic, msg_class, callback, queue_size=None)
+
+   :returns: a new subscriber for *topic*, with an ``unregister()``
+       method.  The *callback* is invoked with each message received,
+       in some other thread.
+
+Normally, :class:`.RosTransport` uses ROS topics.  When a requester
+and its scheduler are in the same process, they can share a
+:class:`.LocalTransport` instead, which passes message objects
+directly, without serializing them or opening any connections.
+Processes on the same host can use a :class:`.ShmTransport`, which
+exchanges serialized messages through shared memory.
+
+.. _`scheduler_msgs/SchedulerRequests`:
+    http://docs.ros.org/api/scheduler_msgs/html/msg/SchedulerRequests.html
+
+"""
+
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+import copy
+import fcntl
+import io
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import rospy
+
+
+def copy_message(msg):
+    """ Copy a ``SchedulerRequests`` message for another receiver.
+
+    :param msg: Message to copy.
+    :type msg: scheduler_msgs/SchedulerRequests
+    :returns: copy with its own header and ``Request`` messages.
+
+    The copy is shallow.  Request IDs and resource lists are shared
+    with the original.  They are copied on write, because this package
+    always replaces those fields instead of modifying them.
+    """
+    new = copy.copy(msg)
+    new.header = copy.copy(msg.header)
+    new.requests = [copy.copy(rq) for rq in msg.requests]
+    return new
+
+
+class RosTransport:
+    """ Transport using ROS topics. """
+
+    def publisher(self, topic, msg_class, latch=False):
+        """ :returns: new :class:`rospy.Publisher` for *topic*. """
+        return rospy.Publisher(topic, msg_class, latch=latch)
+
+    def subscriber(self, topic, msg_class, callback, queue_size=None):
+        """ :returns: new :class:`rospy.Subscriber` for *topic*. """
+        return rospy.Subscriber(topic, msg_class, callback,
+                                queue_size=queue_size, tcp_nodelay=True)
+
+
+class LocalTransport:
+    """
+    Transport for requesters and schedulers within a single process.
+
+    All of them must use the same instance.  Each message published is
+    copied using :py:func:`copy_message` for every subscriber, so the
+    publisher and subscribers can modify their own messages safely.
+
+    Like ROS, each subscriber has its own thread, so callbacks never
+    run in the thread publishing the message.  Its *queue_size* limits
+    the messages queued from each publisher, not from all of them
+    together, as ROS does for each connection.  A subscriber requesting
+    a serialized ``rospy.AnyMsg`` gets the message object instead; the
+    :class:`.Scheduler` handles both.
+    """
+
+    def __init__(self):
+        """ Constructor. """
+        self.lock = threading.Lock()
+        """ Lock serializing access to the topic tables. """
+        self.subscribers = {}
+        """ List of subscribers for each topic. """
+        self.latched = {}
+        """ (publisher, last message) of each latched topic. """
+
+    def publisher(self, topic, msg_class, latch=False):
+        """ :returns: new publisher for *topic*. """
+        return _LocalPublisher(self, topic, latch)
+
+    def subscriber(self, topic, msg_class, callback, queue_size=None):
+        """ :returns: new subscriber for *topic*. """
+        sub = _LocalSubscriber(self, topic, callback, queue_size)
+        with self.lock:
+            self.subscribers.setdefault(topic, []).append(sub)
+            latched = self.latched.get(topic)
+        if latched is not None:
+            pub, msg = latched
+            sub.put(copy_message(msg), pub)
+        return sub
+
+
+class _LocalPublisher:
+    """ Publisher for a :class:`.LocalTransport` topic. """
+
+    def __init__(self, transport, topic, latch):
+        self.transport = transport
+        self.topic = topic
+        self.latch = latch
+
+    def publish(self, msg):
+        """ Deliver a copy of *msg* to every subscriber. """
+        with self.transport.lock:
+            if self.latch:
+                self.transport.latched[self.topic] = (self,
+                                                      copy_message(msg))
+            subs = list(self.transport.subscribers.get(self.topic, []))
+        for sub in subs:
+            sub.put(copy_message(msg), self)
+
+    def unregister(self):
+        """ Stop publishing; new subscribers get no latched message. """
+        if self.latch:
+            with self.transport.lock:
+                latched = self.transport.latched.get(self.topic)
+                if latched is not None and latched[0] is self:
+                    del self.transport.latched[self.topic]
+
+
+class _LocalSubscriber:
+    """ Subscriber for a :class:`.LocalTransport` topic.
+
+    Like a ROS subscriber, which has a connection for each publisher,
+    it queues up to *queue_size* messages from each source, dropping
+    the oldest ones from that source when full.  Sources with queued
+    messages take turns, so a busy publisher cannot crowd out the
+    others.
+    """
+
+    def __init__(self, transport, topic, callback, queue_size):
+        self.transport = transport
+        self.topic = topic
+        self.callback = callback
+        self.queue_size = queue_size
+        self.cond = threading.Condition(threading.Lock())
+        self.queues = {}
+        """ Queue of undelivered messages from each source. """
+        self.ready = deque()
+        """ Sources with undelivered messages, in delivery order. """
+        self.active = True
+        self.thread = threading.Thread(target=self._deliver)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, msg, source=None):
+        """ Queue a message from *source*, dropping the oldest one
+        from that source if full. """
+        with self.cond:
+            queue = self.queues.get(source)
+            if queue is None:
+                queue = deque(maxlen=self.queue_size)
+                self.queues[source] = queue
+                self.ready.append(source)
+                self.cond.notify()
+            queue.append(msg)
+
+    def unregister(self):
+        """ Stop receiving messages. """
+        with self.transport.lock:
+            subs = self.transport.subscribers.get(self.topic, [])
+            if self in subs:
+                subs.remove(self)
+        with self.cond:
+            self.active = False
+            self.cond.notify()
+
+    def _deliver(self):
+        """ Subscriber thread, invoking the callback for each message. """
+        while True:
+            with self.cond:
+                while self.active and not self.ready:
+                    self.cond.wait()
+                if not self.active:
+                    return
+                source = self.ready.popleft()
+                queue = self.queues[source]
+                msg = queue.popleft()
+                if queue:               # more from this source?
+                    self.ready.append(source)
+                else:
+                    del self.queues[source]
+            try:
+                self.callback(msg)
+            except Exception as e:
+                rospy.logerr('transport callback failed for '
+                             + self.topic + ': ' + str(e))
+
+
+class ShmTransport:
+    """
+    Transport for requesters and schedulers on the same host, using a
+    memory-mapped file.
+
+    :param path: Name of the shared file, normally in ``/dev/shm``.
+    :type path: str
+    :param slots: Number of slots, if creating the file.
+    :type slots: int
+    :param slot_size: Size of each slot in bytes, if creating the file.
+    :type slot_size: int
+    :param poll_interval: Seconds between checks for new messages.
+    :type poll_interval: float
+
+    Every process must use the same *path*, with one instance per
+    process.  The file is divided into slots, one for each publisher.
+    A slot holds the topic name and the latest message serialized,
+    protected by a sequence lock: the publisher makes its sequence
+    number odd while writing.  Readers discard any copy made while
+    the number was odd or changed.  A publisher claims its slot with
+    an ``fcntl`` record lock, which is released automatically if its
+    process dies.
+
+    Each slot only holds the latest message, like a latched topic, so
+    a subscriber may miss intermediate messages.  That suits the
+    scheduler protocol, where each message supersedes the previous
+    ones, except with *shared_feedback*, where feedback for one
+    requester may be overwritten by the next one.  The heartbeat
+    recovers those, but sending feedback on separate topics works
+    better.
+    """
+
+    _HEADER = struct.Struct('<8sII')    # magic, slots, slot size
+    _SLOT_HEADER = struct.Struct('<QH254sI')    # seq, name, length
+    _MAGIC = b'ROCONSHM'
+
+    def __init__(self, path='/dev/shm/rocon_scheduler_requests',
+                 slots=64, slot_size=65536, poll_interval=0.001):
+        """ Constructor. """
+        self.lock = threading.Lock()
+        """ Lock serializing access to the topic tables. """
+        self.subscribers = {}
+        """ List of subscribers for each topic. """
+        self.path = path
+        """ Name of the shared file. """
+        self.poll_interval = poll_interval
+        self._claimed = set()
+        self._seen = {}
+        self._poller = None
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, self._HEADER.size, 0)
+        try:
+            header = os.read(self.fd, self._HEADER.size)
+            if len(header) == self._HEADER.size:
+                magic, slots, slot_size = self._HEADER.unpack(header)
+            else:
+                magic = None
+            if magic != self._MAGIC:    # new file?
+                os.ftruncate(self.fd, self._HEADER.size + slots * slot_size)
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                os.write(self.fd,
+                         self._HEADER.pack(self._MAGIC, slots, slot_size))
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, self._HEADER.size, 0)
+        self.slots = slots
+        """ Number of slots in the file. """
+        self.slot_size = slot_size
+        """ Size of each slot in bytes. """
+        self.map = mmap.mmap(self.fd, self._HEADER.size + slots * slot_size)
+        """ Memory map of the shared file. """
+
+    def publisher(self, topic, msg_class, latch=False):
+        """ :returns: new publisher for *topic*, claiming a free slot.
+        :raises: :exc:`RuntimeError` if no slot is free.
+        :raises: :exc:`ValueError` if the *topic* name is too long.
+        """
+        if len(topic.encode('utf-8')) > 254:
+            raise ValueError('topic name too long: ' + topic)
+        with self.lock:
+            for slot in range(self.slots):
+                if slot in self._claimed:
+                    continue
+                try:
+                    fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB,
+                                1, self._offset(slot))
+                except (IOError, OSError):      # owned by another process
+                    continue
+                self._claimed.add(slot)
+                pub = _ShmPublisher(self, topic, slot)
+                pub.write(b'')
+                return pub
+        raise RuntimeError('no free slot in ' + self.path)
+
+    def subscriber(self, topic, msg_class, callback, queue_size=None):
+        """ :returns: new subscriber for *topic*. """
+        sub = _LocalSubscriber(self, topic, callback, queue_size)
+        sub.msg_class = msg_class
+        with self.lock:
+            self.subscribers.setdefault(topic, []).append(sub)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll)
+                self._poller.daemon = True
+                self._poller.start()
+        return sub
+
+    def _offset(self, slot):
+        """ :returns: file offset of *slot*. """
+        return self._HEADER.size + slot * self.slot_size
+
+    def _poll(self):
+        """ Polling thread, delivering new messages to subscribers. """
+        while not rospy.is_shutdown():
+            for slot in range(self.slots):
+                try:
+                    self._check(slot)
+                except Exception as e:  # keep polling the other slots
+                    rospy.logerr('failed reading ' + self.path + ' slot '
+                                 + str(slot) + ': ' + str(e))
+            time.sleep(self.poll_interval)
+
+    def _check(self, slot):
+        """ Deliver any new message in *slot*. """
+        offset = self._offset(slot)
+        seq = struct.unpack_from('<Q', self.map, offset)[0]
+        if seq & 1 or seq == self._seen.get(slot):
+            return              # being written, or already seen
+        (header_seq, name_length, name,
+         length) = self._SLOT_HEADER.unpack_from(self.map, offset)
+        if header_seq != seq:
+            return              # writer started, try again
+        start = offset + self._SLOT_HEADER.size
+        data = self.map[start:start + length]
+        if struct.unpack_from('<Q', self.map, offset)[0] != seq:
+            return              # changed while copying, try again
+        self._seen[slot] = seq
+        if length == 0:
+            return              # no message yet
+        topic = name[:name_length].decode('utf-8')
+        with self.lock:
+            subs = list(self.subscribers.get(topic, []))
+        for sub in subs:
+            sub.put(sub.msg_class().deserialize(data), slot)
+
+
+class _ShmPublisher:
+    """ Publisher for a :class:`.ShmTransport` slot. """
+
+    def __init__(self, transport, topic, slot):
+        self.transport = transport
+        self.topic = topic
+        self.name = topic.encode('utf-8')
+        self.slot = slot
+        self.offset = transport._offset(slot)
+
+    def publish(self, msg):
+        """ Write *msg* into this publisher's slot. """
+        buff = io.BytesIO()
+        msg.serialize(buff)
+        self.write(buff.getvalue())
+
+    def write(self, data):
+        """ Write serialized *data* into this publisher's slot.
+
+        :raises: :exc:`ValueError` if *data* does not fit.
+        """
+        header = ShmTransport._SLOT_HEADER
+        if len(data) > self.transport.slot_size - header.size:
+            raise ValueError('message too large for ' + self.transport.path)
+        shm = self.transport.map
+        seq = struct.unpack_from('<Q', shm, self.offset)[0]
+        seq += 1 + (seq & 1)            # odd while writing
+        struct.pack_into('<Q', shm, self.offset, seq)
+        start = self.offset + header.size
+        shm[start:start + len(data)] = data
+        header.pack_into(shm, self.offset, seq, len(self.name), self.name,
+                         len(data))
+        struct.pack_into('<Q', shm, self.offset, seq + 1)
+
+    def unregister(self):
+        """ Release this publisher's slot. """
+        transport = self.transport
+        with transport.lock:
+            if self.slot in transport._claimed:
+                self.name = b''
+                self.write(b'')
+                fcntl.lockf(transport.fd, fcntl.LOCK_UN, 1, self.offset)
+                transport._claimed.discard(self.slot)
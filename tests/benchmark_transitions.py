@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+""" Benchmark compiled request state transition tables.
+
+Compares the TRANS_TABLE and event dictionary lookups with the
+compiled tables, and per-request transitions with the bulk API.
+Does not require a running ROS core, and is not run as a unit test.
+
+Usage: benchmark_transitions.py [number_of_requests]
+"""
+from __future__ import absolute_import, print_function
+
+import sys
+import timeit
+import uuid
+
+import unique_id
+from scheduler_msgs.msg import Request, Resource
+
+from rocon_scheduler_requests.transitions import *
+from rocon_scheduler_requests.transitions import _TRANS_MASKS
+
+STATUSES = [Request.NEW, Request.RESERVED, Request.WAITING,
+            Request.GRANTED, Request.PREEMPTING, Request.CANCELING,
+            Request.CLOSED]
+
+
+def make_requests(count):
+    """ Make *count* requests, cycling through every status. """
+    return [ActiveRequest(Request(id=unique_id.toMsg(uuid.uuid4()),
+                                  resources=[Resource(name='rapp')],
+                                  status=STATUSES[i % len(STATUSES)]))
+            for i in range(count)]
+
+
+def validate_frozenset(rqs):
+    """ Validate every request against TRANS_TABLE directly. """
+    return [rq for rq in rqs
+            if (rq.msg.status, Request.GRANTED) in TRANS_TABLE]
+
+
+def validate_compiled(rqs):
+    """ Validate every request using the compiled table. """
+    bit = 1 << Request.GRANTED
+    return [rq for rq in rqs if _TRANS_MASKS[rq.msg.status] & bit]
+
+
+def lookup_dict(rqs):
+    """ Look up every request's new status in the event dictionary. """
+    return [EVENT_PREEMPT.trans.get(rq.msg.status) for rq in rqs]
+
+
+def lookup_compiled(rqs):
+    """ Look up every request's new status in the compiled table. """
+    table = EVENT_PREEMPT.table
+    return [table[rq.msg.status] for rq in rqs]
+
+
+def bulk_validate(rqs):
+    """ Validate an event for all requests in one pass. """
+    return validate_all(rqs, EVENT_PREEMPT)
+
+
+def each_transition(rqs):
+    """ Apply an event to each request, one at a time. """
+    for rq in rqs:
+        rq._transition(EVENT_PREEMPT)
+
+
+def bulk_transition(rqs):
+    """ Apply an event to all requests in one pass. """
+    transition_all(rqs, EVENT_PREEMPT)
+
+
+def main(argv):
+    count = 10000
+    if len(argv) > 1:
+        count = int(argv[1])
+    rqs = make_requests(count)
+    for name in ['validate_frozenset', 'validate_compiled',
+                 'lookup_dict', 'lookup_compiled', 'bulk_validate',
+                 'each_transition', 'bulk_transition']:
+        func = globals()[name]
+        best = min(timeit.repeat(lambda: func(rqs), number=10, repeat=3))
+        print('%-20s %8.3f usec/request'
+              % (name, best * 1e6 / (10 * count)))
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -25,13 +25,11 @@ class ExampleScheduler:
 
     def callback(self, rset):
         """ Scheduler request callback. """
-        rospy.logdebug('scheduler callback:')
-        for rq in rset.values():
-            rospy.logdebug('  ' + str(rq))
-            if rq.msg.status == Request.NEW:
-                self.queue(rset.requester_id, rq)
-            elif rq.msg.status == Request.CANCELING:
-                self.free(rset.requester_id, rq)
+        rospy.logdebug('scheduler callback: ' + str(rset.requester_id))
+        for rq in rset.by_status(Request.NEW):
+            self.queue(rset.requester_id, rq)
+        for rq in rset.by_status(Request.CANCELING):
+            self.free(rset.requester_id, rq)
 
     def dispatch(self):
         """ Grant any available resources to waiting requests. """
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+import threading
+import unittest
+
+# ROS dependencies
+import rospy
+from scheduler_msgs.msg import Request, Resource
+
+# module being tested:
+try:
+    from rocon_scheduler_requests.async_requester import (AsyncRequester,
+                                                          asyncio)
+except ImportError:                     # neither asyncio nor trollius
+    AsyncRequester = None
+from rocon_scheduler_requests import RequestLostError, Scheduler
+from rocon_scheduler_requests.transport import LocalTransport
+
+TEST_RESOURCE = Resource(
+    name='test_rapp',
+    platform_info='rocon:///linux/precise/ros/segbot/roberto')
+WAIT_TIME = 5.0
+
+
+@unittest.skipIf(AsyncRequester is None, 'asyncio not available')
+class TestAsyncRequester(unittest.TestCase):
+    """End-to-end tests for the asyncio requester interface, with a
+    scheduler sharing a LocalTransport.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        rospy.rostime.set_rostime_initialized(True)     # use wall time
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.transport = LocalTransport()
+        self.preempt = False
+        self.hold = False               # leave new requests waiting?
+
+        def callback(rset):
+            for rq in rset.values():
+                if rq.msg.status == Request.NEW and not self.hold:
+                    rq.grant(rq.msg.resources)
+                    if self.preempt:
+                        rq.preempt()
+                elif rq.msg.status == Request.CANCELING:
+                    rq.close()
+
+        self.sched = Scheduler(callback, transport=self.transport)
+        self.arqr = None
+
+    def tearDown(self):
+        if self.arqr is not None:
+            self.arqr.close()
+        self.sched.timer.shutdown()
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def wait(self, future):
+        return self.loop.run_until_complete(
+            asyncio.wait_for(future, WAIT_TIME))
+
+    def status(self, rid):
+        with self.arqr.lock:
+            return self.arqr.requester.rset[rid].msg.status
+
+    def test_granted(self):
+        self.arqr = AsyncRequester(loop=self.loop, transport=self.transport)
+        rid = self.wait(self.arqr.request([TEST_RESOURCE]))
+        self.assertEqual(self.status(rid), Request.GRANTED)
+        self.arqr.release(rid)
+        self.assertEqual(self.status(rid), Request.CANCELING)
+
+    def test_preempted(self):
+        self.preempt = True
+        self.arqr = AsyncRequester(loop=self.loop, transport=self.transport)
+        future = self.arqr.request([TEST_RESOURCE])
+        self.assertRaises(RequestLostError, self.wait, future)
+        with self.arqr.lock:            # canceled, or already closed
+            rq = list(self.arqr.requester.rset.values())[0]
+            self.assertIn(rq.msg.status, [Request.CANCELING, Request.CLOSED])
+
+    def test_future_cancelled(self):
+        self.arqr = AsyncRequester(loop=self.loop, transport=self.transport)
+        future = self.arqr.request([TEST_RESOURCE])
+        with self.arqr.lock:
+            rid = list(self.arqr.requester.rset.keys())[0]
+        future.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0.0))
+        self.assertNotIn(rid, self.arqr._futures)
+        self.assertIn(self.status(rid), [Request.CANCELING, Request.CLOSED])
+
+    def test_running_loop(self):
+        self.arqr = AsyncRequester(transport=self.transport)
+        self.assertIsNone(self.arqr.loop)
+        futures = []
+
+        def start():
+            futures.append(self.arqr.request([TEST_RESOURCE]))
+            self.loop.stop()
+
+        self.loop.call_soon(start)
+        self.loop.run_forever()
+        self.assertIs(self.arqr.loop, self.loop)
+        rid = self.wait(futures[0])
+        self.assertEqual(self.status(rid), Request.GRANTED)
+
+    def test_close_pending(self):
+        self.hold = True
+        self.arqr = AsyncRequester(loop=self.loop, transport=self.transport)
+        future = self.arqr.request([TEST_RESOURCE])
+        sender = self.arqr.requester._sender._thread
+        threads = set(threading.enumerate())
+        self.arqr.close()
+        self.loop.run_until_complete(asyncio.sleep(0.0))
+        self.assertTrue(future.cancelled())
+        self.assertIsNone(self.arqr.requester._sender)
+        sender.join(WAIT_TIME)
+        self.assertFalse(sender.is_alive())
+        started = set(threading.enumerate()) - threads
+        self.assertEqual(started, set())        # no new sender thread
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_async_requester',
+                    TestAsyncRequester)
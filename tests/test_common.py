@@ -27,6 +27,22 @@ class TestCommonModule(unittest.TestCase):
         topic = common.feedback_topic(TEST_UUID, scheduler_topic='xxx')
         self.assertEqual(topic, 'xxx_' + TEST_UUID_HEX)
 
+    def test_shared_feedback_topic(self):
+        self.assertEqual(common.shared_feedback_topic(),
+                         common.SCHEDULER_TOPIC + '_feedback')
+        self.assertEqual(common.shared_feedback_topic('xxx'),
+                         'xxx_feedback')
+
+    def test_decode_plain_frame(self):
+        self.assertEqual(common.decode_frame(''), {})
+
+    def test_encode_frame(self):
+        frame = common.encode_frame({'seq': '7', 'mode': 'delta'})
+        self.assertEqual(frame, 'mode=delta seq=7')
+        self.assertEqual(common.decode_frame(frame),
+                         {'seq': '7', 'mode': 'delta'})
+        self.assertEqual(common.encode_frame({}), '')
+
 if __name__ == '__main__':
     import rosunit
     rosunit.unitrun('rocon_scheduler_requests_common',
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+import uuid
+import unittest
+
+# ROS dependencies
+import rospy
+import unique_id
+from scheduler_msgs.msg import Request, Resource
+
+# module being tested:
+from rocon_scheduler_requests.delta import *
+from rocon_scheduler_requests.transitions import ActiveRequest, RequestSet
+
+RQR_UUID = uuid.UUID('01234567-89ab-cdef-0123-456789abcdef')
+TEST_UUID = uuid.UUID('01234567-89ab-cdef-fedc-ba9876543210')
+DIFF_UUID = uuid.UUID('01234567-cdef-fedc-89ab-ba9876543210')
+TEST_RESOURCE = Resource(
+    name='test_rapp',
+    platform_info='rocon:///linux/precise/ros/segbot/roberto')
+
+
+def make_rset(*uuids):
+    return RequestSet([Request(id=unique_id.toMsg(rid),
+                               resources=[TEST_RESOURCE],
+                               status=Request.NEW)
+                       for rid in uuids], RQR_UUID)
+
+
+class TestDeltaChannel(unittest.TestCase):
+    """Unit tests for the scheduler request delta protocol.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_disabled(self):
+        rset = make_rset(TEST_UUID)
+        chan = DeltaChannel(enabled=False)
+        msg = chan.outgoing(rset, stamp=rospy.Time())
+        self.assertEqual(msg, rset.to_msg(stamp=rospy.Time()))
+        self.assertEqual(msg.header.frame_id, '')
+        self.assertFalse(chan.urgent())
+
+    def test_other_options(self):
+        rset = make_rset(TEST_UUID)
+        chan = DeltaChannel(enabled=False)
+        msg = chan.outgoing(rset, stamp=rospy.Time(), options={'hz': '4'})
+        self.assertEqual(msg.header.frame_id, 'hz=4')
+        updates, removed = chan.receive(msg)
+        self.assertEqual(updates, rset)
+
+        chan = DeltaChannel()
+        msg = chan.outgoing(rset, stamp=rospy.Time(), options={'hz': '4'})
+        self.assertEqual(msg.header.frame_id, 'hz=4 mode=full seq=1')
+
+    def test_plain_peer(self):
+        rset = make_rset(TEST_UUID)
+        chan = DeltaChannel()
+        updates, removed = chan.receive(rset.to_msg(stamp=rospy.Time()))
+        self.assertEqual(updates, rset)
+        self.assertIsNone(removed)
+        self.assertFalse(chan.peer)
+
+        # only complete snapshots go to a peer not using deltas
+        for i in range(2):
+            msg = chan.outgoing(rset, stamp=rospy.Time())
+            self.assertEqual(len(msg.requests), 1)
+            self.assertEqual(msg.header.frame_id,
+                             'mode=full seq=' + str(i + 1))
+
+    def test_snapshot_differences(self):
+        rset = make_rset(TEST_UUID, DIFF_UUID)
+        chan = DeltaChannel()
+        chan.outgoing(rset, stamp=rospy.Time())
+        self.assertFalse(chan.pending(rset))
+
+        # peer sends an unchanged snapshot
+        msg = rset.to_msg(stamp=rospy.Time())
+        updates, removed = chan.receive(msg, current=rset)
+        self.assertEqual(len(updates), 0)
+        self.assertEqual(removed, [])
+        self.assertFalse(chan.pending(rset))
+
+        # peer no longer has DIFF_UUID
+        msg = make_rset(TEST_UUID).to_msg(stamp=rospy.Time())
+        updates, removed = chan.receive(msg, current=rset)
+        self.assertEqual(len(updates), 0)
+        self.assertEqual(removed, [DIFF_UUID])
+        self.assertTrue(chan.pending(rset))
+
+    def test_changes_only(self):
+        sender = DeltaChannel()
+        sender.peer = True
+        receiver = DeltaChannel()
+        rset = make_rset(TEST_UUID, DIFF_UUID)
+
+        msg = sender.outgoing(rset, stamp=rospy.Time())
+        self.assertEqual(msg.header.frame_id, 'mode=full seq=1')
+        updates, removed = receiver.receive(msg, contents=ActiveRequest)
+        self.assertEqual(updates, rset)
+        self.assertIsNone(removed)
+        self.assertTrue(receiver.peer)
+
+        # nothing changed:
+        self.assertFalse(sender.pending(rset))
+        msg = sender.outgoing(rset, stamp=rospy.Time())
+        self.assertEqual(msg.header.frame_id, 'mode=delta seq=2')
+        self.assertEqual(len(msg.requests), 0)
+        updates, removed = receiver.receive(msg)
+        self.assertEqual(len(updates), 0)
+        self.assertEqual(removed, [])
+
+        # one request changed, the other removed:
+        rset[TEST_UUID].cancel()
+        del rset.requests[DIFF_UUID]
+        self.assertTrue(sender.pending(rset))
+        msg = sender.outgoing(rset, stamp=rospy.Time())
+        self.assertEqual(msg.header.frame_id,
+                         'mode=delta removed=' + DIFF_UUID.hex + ' seq=3')
+        updates, removed = receiver.receive(msg)
+        self.assertEqual(list(updates.keys()), [TEST_UUID])
+        self.assertEqual(updates[TEST_UUID].msg.status, Request.CANCELING)
+        self.assertEqual(removed, [DIFF_UUID])
+        self.assertFalse(sender.pending(rset))
+
+        # duplicate message ignored:
+        self.assertEqual(receiver.receive(msg), (None, None))
+        self.assertFalse(receiver.resync_wanted)
+
+    def test_resync(self):
+        sender = DeltaChannel()
+        sender.peer = True
+        receiver = DeltaChannel()
+        rset = make_rset(TEST_UUID)
+        receiver.receive(sender.outgoing(rset, stamp=rospy.Time()))
+        sender.outgoing(rset, stamp=rospy.Time())       # lost
+
+        # gap detected: ask for a complete snapshot
+        msg = sender.outgoing(rset, stamp=rospy.Time())
+        self.assertEqual(receiver.receive(msg), (None, None))
+        self.assertTrue(receiver.urgent())
+        reply = receiver.outgoing(make_rset(), stamp=rospy.Time())
+        self.assertEqual(reply.header.frame_id,
+                         'mode=full resync=1 seq=1')
+        self.assertFalse(receiver.urgent())
+
+        sender.receive(reply)
+        self.assertTrue(sender.urgent())
+        msg = sender.outgoing(rset, stamp=rospy.Time())
+        self.assertEqual(msg.header.frame_id, 'mode=full seq=4')
+        updates, removed = receiver.receive(msg)
+        self.assertEqual(updates, rset)
+        self.assertIsNone(removed)
+
+    def test_sync(self):
+        chan = DeltaChannel()
+        chan.peer = True
+        rset = make_rset(TEST_UUID, DIFF_UUID)
+        chan.outgoing(rset, stamp=rospy.Time())
+        updates = make_rset(TEST_UUID, DIFF_UUID)
+        updates[TEST_UUID].msg.priority = 10
+        chan.sync(rset, updates)
+
+        # only the request that differs gets sent again
+        msg = chan.outgoing(rset, stamp=rospy.Time())
+        self.assertEqual(len(msg.requests), 1)
+        self.assertEqual(msg.requests[0].id, unique_id.toMsg(TEST_UUID))
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_delta_channel',
+                    TestDeltaChannel)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+import copy
+import gc
+import uuid
+import unittest
+
+# ROS dependencies
+import unique_id
+from scheduler_msgs.msg import Resource
+
+# module being tested:
+from rocon_scheduler_requests import interning
+
+TEST_UUID = uuid.UUID('01234567-89ab-cdef-fedc-ba9876543210')
+TEST_RESOURCE = Resource(
+    name='test_rapp',
+    platform_info='rocon:///linux/precise/ros/segbot/roberto')
+
+
+class TestInterning(unittest.TestCase):
+    """Unit tests for shared UUID and resource instances.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_uuid_from_msg(self):
+        uid = interning.uuid_from_msg(unique_id.toMsg(TEST_UUID))
+        self.assertEqual(uid, TEST_UUID)
+        self.assertIs(interning.uuid_from_msg(unique_id.toMsg(TEST_UUID)),
+                      uid)
+        self.assertIs(interning.uuid_from_bytes(TEST_UUID.bytes), uid)
+
+    def test_uuid_released(self):
+        raw = uuid.uuid4().bytes
+        interning.uuid_from_bytes(raw)
+        gc.collect()
+        self.assertNotIn(raw, interning._uuids)
+
+    def test_resource(self):
+        res = interning.resource(copy.deepcopy(TEST_RESOURCE))
+        self.assertEqual(res, TEST_RESOURCE)
+        other = copy.deepcopy(TEST_RESOURCE)
+        self.assertIsNot(other, res)
+        self.assertIs(interning.resource(other), res)
+        self.assertEqual(interning.resources([other, other]), [res, res])
+        diff = Resource(name='test_rapp', platform_info='other')
+        self.assertIs(interning.resource(diff), diff)
+
+    def test_resource_cache_limit(self):
+        for i in range(interning.RESOURCE_CACHE_SIZE + 10):
+            interning.resource(Resource(name=str(i), platform_info='x'))
+        self.assertEqual(len(interning._resources),
+                         interning.RESOURCE_CACHE_SIZE)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_interning',
+                    TestInterning)
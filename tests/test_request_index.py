@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+import random
+import uuid
+import unittest
+
+# ROS dependencies
+import unique_id
+from scheduler_msgs.msg import Request, Resource
+
+# module being tested:
+from rocon_scheduler_requests.request_index import *
+from rocon_scheduler_requests.transitions import ActiveRequest, RequestSet
+
+RQR_UUID = uuid.UUID('01234567-89ab-cdef-0123-456789abcdef')
+OTHER_RQR = uuid.UUID('01234567-89ab-cdef-3210-456789abcdef')
+TEST_UUID = uuid.UUID('01234567-89ab-cdef-fedc-ba9876543210')
+DIFF_UUID = uuid.UUID('01234567-cdef-fedc-89ab-ba9876543210')
+THIRD_UUID = uuid.UUID('89abcdef-cdef-fedc-89ab-ba9876543210')
+TEST_RESOURCE = Resource(
+    name='test_rapp',
+    platform_info='rocon:///linux/precise/ros/segbot/roberto')
+TEST_WILDCARD = Resource(
+    name='test_rapp',
+    platform_info='rocon:///linux/precise/ros/segbot/\.*')
+
+
+def make_request(rid, priority=0, status=Request.NEW):
+    return Request(id=unique_id.toMsg(rid), resources=[TEST_WILDCARD],
+                   priority=priority, status=status)
+
+
+class TestRequestIndex(unittest.TestCase):
+    """Unit tests for the scheduler request index.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_empty_index(self):
+        index = RequestIndex()
+        self.assertEqual(len(index), 0)
+        self.assertNotIn(TEST_UUID, index)
+        self.assertEqual(index.by_status(Request.NEW), [])
+        self.assertEqual(index.holders(TEST_RESOURCE), [])
+        self.assertEqual(index.top(Request.WAITING, 3), [])
+
+    def test_attach(self):
+        index = RequestIndex()
+        rset = RequestSet([make_request(TEST_UUID)], RQR_UUID,
+                          contents=ActiveRequest)
+        rset.attach(index)
+        self.assertEqual(len(index), 1)
+        self.assertIn(TEST_UUID, index)
+        self.assertEqual(index.by_status(Request.NEW), [rset[TEST_UUID]])
+        rset.attach(None)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.by_status(Request.NEW), [])
+
+    def test_top_priority(self):
+        index = RequestIndex()
+        rset1 = RequestSet([make_request(TEST_UUID, priority=1),
+                            make_request(DIFF_UUID, priority=5)],
+                           RQR_UUID, contents=ActiveRequest)
+        rset2 = RequestSet([make_request(THIRD_UUID, priority=5)],
+                           OTHER_RQR, contents=ActiveRequest)
+        rset1.attach(index)
+        rset2.attach(index)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.top(Request.WAITING), [])
+        for rq in index.by_status(Request.NEW):
+            rq.wait()
+        self.assertEqual(index.by_status(Request.NEW), [])
+        top = index.top(Request.WAITING, 2)
+        self.assertEqual(len(top), 2)
+        self.assertEqual(set([rq.msg.priority for rq in top]), set([5]))
+        self.assertEqual(index.top(Request.WAITING, 3)[2].uuid, TEST_UUID)
+        self.assertEqual(index.top(Request.WAITING)[0].owner.requester_id,
+                         top[0].owner.requester_id)
+
+    def test_holders(self):
+        index = RequestIndex()
+        rset = RequestSet([make_request(TEST_UUID),
+                           make_request(DIFF_UUID)],
+                          RQR_UUID, contents=ActiveRequest)
+        rset.attach(index)
+        self.assertEqual(index.holders(TEST_RESOURCE), [])
+        rset[TEST_UUID].grant([TEST_RESOURCE])
+        self.assertEqual(index.holders(TEST_RESOURCE), [rset[TEST_UUID]])
+        self.assertEqual(index.by_status(Request.GRANTED),
+                         [rset[TEST_UUID]])
+        rset[TEST_UUID].preempt()
+        self.assertEqual(index.holders(TEST_RESOURCE), [rset[TEST_UUID]])
+        rset[TEST_UUID].cancel()
+        self.assertEqual(index.holders(TEST_RESOURCE), [])
+
+        # merge deletes closed requests from the index
+        rset[TEST_UUID].close()
+        rset.merge(RequestSet([make_request(DIFF_UUID)], RQR_UUID))
+        self.assertNotIn(TEST_UUID, index)
+        self.assertEqual(len(index), 1)
+
+    def test_stale_entries(self):
+        index = RequestIndex()
+        rset = RequestSet([], RQR_UUID, contents=ActiveRequest)
+        rset.attach(index)
+        order = [uuid.UUID(int=i) for i in range(100)]
+        for rid in order:
+            rset[rid] = make_request(rid, priority=rid.int % 7)
+        rng = random.Random(4)
+        for i in range(1000):
+            rq = rset[uuid.UUID(int=rng.randrange(100))]
+            action = rng.randrange(3)
+            if action == 0:             # change priority
+                rq.msg.priority = rng.randrange(7)
+                rq.touch()
+            elif action == 1:           # change status
+                rq.msg.status = rng.choice([Request.NEW, Request.WAITING])
+                rq.touch()
+            else:                       # remove, then add again
+                del rset[rq.uuid]
+                rset[rq.uuid] = rq.msg
+                order.remove(rq.uuid)
+                order.append(rq.uuid)
+            # ties keep their original order, unless added again
+            for status in (Request.NEW, Request.WAITING):
+                expected = sorted(rset.by_status(status),
+                                  key=lambda rq: (-rq.msg.priority,
+                                                  order.index(rq.uuid)))
+                k = rng.randrange(1, 10)
+                top = index.top(status, k)
+                self.assertEqual([rq.uuid for rq in top],
+                                 [rq.uuid for rq in expected[:k]])
+                heap = index._by_priority.get(status, [])
+                self.assertLessEqual(len(heap), 2 * len(expected) + 1)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_request_index',
+                    TestRequestIndex)
@@ -0,0 +1,491 @@
+#!/usr/bin/env python
+
+# enable some python3 compatibility options:
+from __future__ import absolute_import, print_function
+
+import threading
+import time
+import uuid
+import unittest
+
+# ROS dependencies
+import rospy
+import unique_id
+from scheduler_msgs.msg import Request, Resource, SchedulerRequests
+
+# module being tested:
+from rocon_scheduler_requests.requester import _SendQueue
+from rocon_scheduler_requests import Requester, RequesterPool, Scheduler
+from rocon_scheduler_requests import WrongRequestError
+from rocon_scheduler_requests import common
+from rocon_scheduler_requests.transitions import RequestSet
+from rocon_scheduler_requests.transport import LocalTransport
+
+TEST_RESOURCE = Resource(
+    name='test_rapp',
+    platform_info='rocon:///linux/precise/ros/segbot/roberto')
+WAIT_TIME = 5.0
+
+
+class _FakeRequester:
+    """ Records the messages a requester would publish. """
+    def __init__(self):
+        self.published = 0
+        self.sent = threading.Event()
+
+    def _publish(self):
+        self.published += 1
+        self.sent.set()
+
+
+class _ClockSetBack:
+    """ Context manager setting the wall clock back to 1970 and
+    stopping it there, as :func:`time.time` sees it. """
+    def __enter__(self):
+        self.time = time.time
+        time.time = lambda: 0.0
+
+    def __exit__(self, *args):
+        time.time = self.time
+
+
+class TestSendQueue(unittest.TestCase):
+    """Unit tests for merging requester send operations.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_merged_sends(self):
+        sender = _SendQueue(0.05)
+        rqr = _FakeRequester()
+        for i in range(10):
+            sender.put(rqr)
+        self.assertEqual(rqr.published, 0)
+        self.assertTrue(rqr.sent.wait(1.0))
+        time.sleep(0.1)
+        self.assertEqual(rqr.published, 1)
+        sender.put(rqr)                 # later request sent again
+        sender.shutdown()
+        self.assertEqual(rqr.published, 2)
+
+    def test_several_requesters(self):
+        sender = _SendQueue(0.0)
+        rqrs = [_FakeRequester() for i in range(4)]
+        for rqr in rqrs:
+            sender.put(rqr)
+        sender.shutdown()
+        self.assertEqual([rqr.published for rqr in rqrs], [1, 1, 1, 1])
+
+    def test_clock_set_back(self):
+        sender = _SendQueue(0.05)
+        rqr = _FakeRequester()
+        with _ClockSetBack():
+            sender.put(rqr)
+            sent = rqr.sent.wait(WAIT_TIME)
+        sender.shutdown()
+        self.assertTrue(sent)
+
+    def test_shutdown_flushes(self):
+        sender = _SendQueue(10.0)
+        rqr = _FakeRequester()
+        sender.put(rqr)
+        sender.shutdown()               # does not wait for the delay
+        self.assertEqual(rqr.published, 1)
+
+
+class TestWaitFor(unittest.TestCase):
+    """Unit tests for waiting on requester feedback.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        rospy.rostime.set_rostime_initialized(True)     # use wall time
+        # no heartbeats during the test
+        self.rqr = Requester(lambda rset: None, frequency=0.01,
+                             transport=LocalTransport())
+        self.rid = self.rqr.new_request([TEST_RESOURCE])
+
+    def tearDown(self):
+        self.rqr._unregister()
+
+    def feedback(self, status):
+        """ Pass scheduler feedback with *status* to the requester. """
+        rq = Request(id=unique_id.toMsg(self.rid),
+                     resources=[TEST_RESOURCE], status=status)
+        self.rqr._feedback(RequestSet([rq], self.rqr.requester_id).to_msg())
+
+    def test_wake_on_change(self):
+        watchers = []
+
+        def scheduler():
+            deadline = time.time() + WAIT_TIME
+            while self.rid not in self.rqr._watched:
+                if time.time() > deadline:
+                    return
+                time.sleep(0.01)
+            watchers.append(self.rqr._watched[self.rid])
+            self.feedback(Request.WAITING)  # not what it waits for
+            self.feedback(Request.GRANTED)
+
+        thread = threading.Thread(target=scheduler)
+        thread.start()
+        start = time.time()
+        status = self.rqr.wait_for(self.rid, [Request.GRANTED], WAIT_TIME)
+        thread.join()
+        self.assertEqual(status, Request.GRANTED)
+        self.assertLess(time.time() - start, WAIT_TIME)
+        self.assertEqual(watchers, [1])
+        self.assertEqual(self.rqr._watched, {})
+
+    def test_timeout(self):
+        start = time.time()
+        self.assertIsNone(self.rqr.wait_for(self.rid, [Request.GRANTED],
+                                            0.05))
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        self.assertEqual(self.rqr._watched, {})
+
+    def test_clock_set_back(self):
+        results = []
+
+        def waiter():
+            results.append(self.rqr.wait_for(self.rid, [Request.GRANTED],
+                                             0.05))
+
+        thread = threading.Thread(target=waiter)
+        thread.daemon = True
+        with _ClockSetBack():
+            thread.start()
+            thread.join(WAIT_TIME)
+        self.assertEqual(results, [None])       # timed out anyway
+
+    def test_already_there(self):
+        self.assertEqual(self.rqr.wait_for(self.rid, [Request.NEW], 0.0),
+                         Request.NEW)
+        self.assertEqual(self.rqr._watched, {})
+
+    def test_closed(self):
+        with self.rqr.lock:
+            self.rqr.rset[self.rid].cancel()
+        self.feedback(Request.CLOSED)   # scheduler closed it
+        self.assertNotIn(self.rid, self.rqr.rset)
+        self.assertEqual(self.rqr.wait_for(self.rid, [Request.GRANTED],
+                                           WAIT_TIME),
+                         Request.CLOSED)
+        self.assertEqual(self.rqr._watched, {})
+
+
+class _SchedulerTopicTest(unittest.TestCase):
+    """ Base class for tests recording requester messages sent to the
+    scheduler topic. """
+    options = {}                        # other Requester arguments
+
+    def setUp(self):
+        rospy.rostime.set_rostime_initialized(True)     # use wall time
+        self.transport = LocalTransport()
+        self.sent = []
+        self.cond = threading.Condition()
+        self.sub = self.transport.subscriber(common.SCHEDULER_TOPIC,
+                                             SchedulerRequests,
+                                             self.receive)
+        # no heartbeats during the test
+        self.rqr = Requester(lambda rset: None, frequency=0.01,
+                             transport=self.transport, **self.options)
+        self.unregistered = False
+
+    def tearDown(self):
+        if not self.unregistered:
+            self.rqr._unregister()
+        self.sub.unregister()
+
+    def receive(self, msg):
+        with self.cond:
+            self.sent.append(msg)
+            self.cond.notify_all()
+
+    def wait_sent(self, count):
+        """ Wait for *count* messages, failing after WAIT_TIME. """
+        deadline = time.time() + WAIT_TIME
+        with self.cond:
+            while len(self.sent) < count:
+                remaining = deadline - time.time()
+                if remaining <= 0.0:
+                    raise AssertionError('sent ' + str(len(self.sent))
+                                         + ' of ' + str(count)
+                                         + ' messages')
+                self.cond.wait(remaining)
+            return list(self.sent)
+
+
+class TestNewRequests(_SchedulerTopicTest):
+    """Unit tests for adding batches of requests.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_batch(self):
+        rid = unique_id.fromRandom()
+        specs = [{'resources': [TEST_RESOURCE]},
+                 {'resources': [TEST_RESOURCE], 'priority': 10},
+                 {'resources': [TEST_RESOURCE], 'uuid': rid}]
+        uuids = self.rqr.new_requests(specs)
+        self.assertEqual(len(uuids), 3)
+        self.assertEqual(uuids[2], rid)
+        self.assertEqual(sorted(self.rqr.rset.keys()), sorted(uuids))
+        self.assertEqual([self.rqr.rset[u].msg.priority for u in uuids],
+                         [0, 10, 0])
+        for u in uuids:
+            self.assertEqual(self.rqr.rset[u].msg.status, Request.NEW)
+        self.assertEqual(self.sent, [])         # not sent yet
+
+    def test_duplicate_in_batch(self):
+        rid = unique_id.fromRandom()
+        specs = [{'resources': [TEST_RESOURCE]},
+                 {'resources': [TEST_RESOURCE], 'uuid': rid},
+                 {'resources': [TEST_RESOURCE], 'uuid': rid}]
+        self.assertRaises(WrongRequestError, self.rqr.new_requests, specs)
+        self.assertEqual(len(self.rqr.rset), 0)     # none were added
+
+    def test_duplicate_existing(self):
+        rid = self.rqr.new_request([TEST_RESOURCE])
+        specs = [{'resources': [TEST_RESOURCE]},
+                 {'resources': [TEST_RESOURCE], 'uuid': rid}]
+        self.assertRaises(WrongRequestError, self.rqr.new_requests, specs)
+        self.assertEqual(list(self.rqr.rset.keys()), [rid])
+
+    def test_send(self):
+        specs = [{'resources': [TEST_RESOURCE]} for i in range(3)]
+        uuids = self.rqr.new_requests(specs, send=True)
+        msg = self.wait_sent(1)[0]
+        self.assertEqual(
+            sorted([unique_id.fromMsg(rq.id) for rq in msg.requests]),
+            sorted(uuids))
+
+
+class TestSendRequests(_SchedulerTopicTest):
+    """Unit tests for sending requests from the requester I/O thread.
+
+    These tests do not require a running ROS core.
+    """
+    options = {'send_delay': 0.05}
+
+    def unregister(self):
+        sender = self.rqr._sender
+        self.rqr._unregister()
+        self.unregistered = True
+        return sender
+
+    def test_merged(self):
+        for i in range(3):
+            self.rqr.new_request([TEST_RESOURCE])
+            self.rqr.send_requests()
+        msgs = self.wait_sent(1)
+        time.sleep(0.1)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(len(msgs[0].requests), 3)
+
+    def test_unregister(self):
+        self.rqr.new_request([TEST_RESOURCE])
+        self.rqr.send_requests()
+        sender = self.unregister()
+        self.assertIsNone(self.rqr._sender)
+        self.assertEqual(len(self.wait_sent(1)[0].requests), 1)
+        sender._thread.join(WAIT_TIME)  # I/O thread stopped
+        self.assertFalse(sender._thread.is_alive())
+
+    def test_unregister_holding_lock(self):
+        with self.rqr.lock:             # as in the feedback function
+            self.rqr.new_request([TEST_RESOURCE])
+            self.rqr.send_requests()
+            sender = self.unregister()
+        self.wait_sent(1)
+        sender._thread.join(WAIT_TIME)
+        self.assertFalse(sender._thread.is_alive())
+
+    def test_reconnect(self):
+        sender = self.unregister()
+        sender._thread.join(WAIT_TIME)
+        self.rqr.new_request([TEST_RESOURCE])
+        self.rqr.send_requests()        # starts a new I/O thread
+        self.assertIsNot(self.rqr._sender, sender)
+        self.assertEqual(len(self.wait_sent(1)[0].requests), 1)
+
+
+class TestAdaptiveHeartbeat(_SchedulerTopicTest):
+    """Unit tests for choosing the requester heartbeat frequency.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_no_scheduler_hz(self):
+        self.rqr._beat()
+        self.rqr._beat()                # idle, but not supported
+        self.assertEqual(self.rqr.heartbeat_hz, 0.01)
+
+    def test_scheduler_cap(self):
+        self.rqr.scheduler_hz = 0.005
+        self.rqr.new_request([TEST_RESOURCE])
+        self.rqr._beat()
+        self.assertEqual(self.rqr.heartbeat_hz, 0.005)
+        self.assertEqual(self.rqr.time_delay, rospy.Duration(200.0))
+        self.rqr._beat()                # still pending
+        self.assertEqual(self.rqr.heartbeat_hz, 0.005)
+        # the cap never raises the frequency
+        self.rqr.scheduler_hz = 1.0
+        self.rqr._beat()
+        self.assertEqual(self.rqr.heartbeat_hz, 0.01)
+
+    def test_idle_slowdown(self):
+        self.rqr.scheduler_hz = 1.0
+        self.rqr._beat()                # nothing pending, but changed
+        self.assertEqual(self.rqr.heartbeat_hz, 0.01)
+        self.rqr._beat()
+        idle_hz = 0.01 * common.IDLE_HEARTBEAT_FACTOR
+        self.assertEqual(self.rqr.heartbeat_hz, idle_hz)
+        self.assertEqual(self.rqr.time_delay,
+                         rospy.Duration(1.0 / idle_hz))
+        self.rqr._beat()                # stays slow
+        self.assertEqual(self.rqr.heartbeat_hz, idle_hz)
+
+    def test_full_speed(self):
+        self.rqr.scheduler_hz = 1.0
+        self.rqr._beat()
+        self.rqr._beat()
+        self.assertLess(self.rqr.heartbeat_hz, 0.01)
+        self.rqr.new_request([TEST_RESOURCE])
+        self.rqr._beat()
+        self.assertEqual(self.rqr.heartbeat_hz, 0.01)
+
+    def test_new_request_rearms(self):
+        self.rqr.scheduler_hz = 1.0
+        self.rqr._beat()
+        self.rqr._beat()
+        timer = self.rqr.timer
+        self.rqr.new_request([TEST_RESOURCE])   # before the next beat
+        self.assertEqual(self.rqr.heartbeat_hz, 0.01)
+        self.assertEqual(self.rqr.time_delay, rospy.Duration(100.0))
+        self.assertIsNot(self.rqr.timer, timer)
+
+    def test_send_requests_rearms(self):
+        self.rqr.scheduler_hz = 1.0
+        rid = self.rqr.new_request([TEST_RESOURCE])
+        self.rqr.rset[rid].msg.status = Request.GRANTED
+        self.rqr.rset[rid].touch()
+        self.rqr._beat()
+        self.rqr._beat()
+        self.assertLess(self.rqr.heartbeat_hz, 0.01)
+        timer = self.rqr.timer
+        self.rqr.send_requests()        # unchanged: stays slow
+        self.assertLess(self.rqr.heartbeat_hz, 0.01)
+        self.assertIs(self.rqr.timer, timer)
+        self.rqr.rset[rid].cancel()
+        self.rqr.send_requests()
+        self.assertEqual(self.rqr.heartbeat_hz, 0.01)
+        self.assertIsNot(self.rqr.timer, timer)
+
+
+class _Event:
+    """ Fake rospy.TimerEvent, for invoking timer handlers directly. """
+    def __init__(self, now):
+        self.current_real = now
+
+
+class TestRequesterPool(unittest.TestCase):
+    """Unit tests for requesters hosted by a pool.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        rospy.rostime.set_rostime_initialized(True)     # use wall time
+        self.transport = LocalTransport()
+        self.pool = RequesterPool(frequency=1.0, transport=self.transport)
+        self.pool.timer.shutdown()      # the tests invoke it
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_phases(self):
+        t0 = rospy.Time.now()
+        # UUIDs with phases of 1.0, 0.9, 0.8 ... 0.1 of the period
+        rqrs = [self.pool.requester(lambda rset: None,
+                                    uuid=uuid.UUID(int=i * 429496729))
+                for i in range(10)]
+        self.assertEqual(len(self.pool), 10)
+        first_beats = []
+        seen = set()
+        for tick in range(1, 11):
+            before = [rqr._next_beat for rqr in rqrs]
+            self.pool._heartbeat(_Event(t0 + rospy.Duration(tick * 0.1)))
+            beats = [i for i, rqr in enumerate(rqrs)
+                     if rqr._next_beat != before[i] and i not in seen]
+            seen.update(beats)
+            first_beats.append(beats)
+        # one requester on each tick, the shortest phase first
+        self.assertEqual(first_beats, [[i] for i in range(9, -1, -1)])
+
+    def test_jitter(self):
+        rqrs = [self.pool.requester(lambda rset: None) for i in range(20)]
+        now = rospy.Time.now() + rospy.Duration(1.0)    # all due
+        self.pool._heartbeat(_Event(now))
+        shortest = rospy.Duration(1.0 - common.HEARTBEAT_JITTER)
+        for rqr in rqrs:
+            self.assertGreaterEqual(rqr._next_beat, now + shortest)
+            self.assertLessEqual(rqr._next_beat, now + rospy.Duration(1.0))
+        # no longer all in step
+        self.assertGreater(len(set([rqr._next_beat for rqr in rqrs])), 1)
+
+    def test_shared_feedback(self):
+        def callback(rset):
+            for rq in rset.values():
+                if rq.msg.status == Request.NEW:
+                    rq.grant(rq.msg.resources)
+
+        sched = Scheduler(callback, shared_feedback=True,
+                          transport=self.transport)
+        rqrs = [self.pool.requester(lambda rset: None) for i in range(3)]
+        rq_ids = [rqr.new_requests([{'resources': [TEST_RESOURCE]}],
+                                   send=True)[0]
+                  for rqr in rqrs]
+        for rqr, rq_id in zip(rqrs, rq_ids):
+            self.assertEqual(rqr.wait_for(rq_id, [Request.GRANTED],
+                                          WAIT_TIME),
+                             Request.GRANTED)
+            # feedback for the other requesters went elsewhere
+            self.assertEqual(list(rqr.rset.keys()), [rq_id])
+        rqrs[0]._unregister()
+        self.assertEqual(len(self.pool), 2)
+        sched.timer.shutdown()
+
+    def test_speed_up(self):
+        rqr = self.pool.requester(lambda rset: None)
+        rqr.scheduler_hz = 1.0
+        rqr._beat()
+        rqr._beat()
+        rqr._next_beat = rospy.Time.now() + rqr.time_delay
+        self.assertEqual(rqr.time_delay, rospy.Duration(4.0))
+        rqr.new_request([TEST_RESOURCE])
+        self.assertEqual(rqr.time_delay, rospy.Duration(1.0))
+        self.assertLessEqual(rqr._next_beat,
+                             rospy.Time.now() + rqr.time_delay)
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_requester',
+                    TestSendQueue)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_wait_for',
+                    TestWaitFor)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_new_requests',
+                    TestNewRequests)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_send_requests',
+                    TestSendRequests)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_adaptive_heartbeat',
+                    TestAdaptiveHeartbeat)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_requester_pool',
+                    TestRequesterPool)
@@ -0,0 +1,771 @@
+#!/usr/bin/env python
+
+# enable some python3 compatibility options:
+from __future__ import absolute_import, print_function
+
+import io
+import threading
+import time
+import uuid
+import unittest
+
+# ROS dependencies
+import rospy
+import unique_id
+from scheduler_msgs.msg import Request, Resource
+
+# module being tested:
+from rocon_scheduler_requests.scheduler import *
+from rocon_scheduler_requests.scheduler import _peek, _requester_id
+from rocon_scheduler_requests import common
+from rocon_scheduler_requests.transitions import RequestSet
+
+RQR_UUID = uuid.UUID('01234567-89ab-cdef-0123-456789abcdef')
+TEST_UUID = uuid.UUID('01234567-89ab-cdef-fedc-ba9876543210')
+DIFF_UUID = uuid.UUID('01234567-cdef-fedc-89ab-ba9876543210')
+OTHER_UUID = uuid.UUID('fedcba98-7654-3210-0123-456789abcdef')
+TEST_RESOURCE = Resource(
+    name='test_rapp',
+    platform_info='rocon:///linux/precise/ros/segbot/roberto')
+WAIT_TIME = 5.0
+
+
+def make_msg(uuids, status=Request.NEW, stamp=None, frame_id='',
+             rqr_id=RQR_UUID):
+    """ :returns: SchedulerRequests message from requester *rqr_id*. """
+    msg = RequestSet([Request(id=unique_id.toMsg(rid),
+                              resources=[TEST_RESOURCE],
+                              status=status)
+                      for rid in uuids], rqr_id).to_msg(stamp)
+    msg.header.frame_id = frame_id
+    return msg
+
+
+def serialize(msg):
+    """ :returns: *msg* as received by a rospy.AnyMsg subscriber. """
+    buff = io.BytesIO()
+    msg.serialize(buff)
+    return rospy.AnyMsg().deserialize(buff.getvalue())
+
+
+class _Publisher:
+    """ Publisher recording messages in its transport. """
+    def __init__(self, transport, topic):
+        self.transport = transport
+        self.topic = topic
+        self.active = True
+
+    def publish(self, msg):
+        if not self.active:
+            raise ValueError('publish() to an unregistered() handle')
+        if self.transport.on_publish is not None:
+            self.transport.on_publish(self.topic, msg)
+        with self.transport.cond:
+            self.transport.published.append((self.topic, msg))
+            self.transport.cond.notify_all()
+
+    def unregister(self):
+        self.active = False
+        self.transport.unregistered.append(self.topic)
+
+
+class _Subscriber:
+    """ Subscriber receiving nothing; tests invoke its callback. """
+    def unregister(self):
+        pass
+
+
+class _Transport:
+    """ Transport recording every message published. """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.published = []             # (topic, msg) pairs
+        self.unregistered = []          # topics
+        self.queue_size = None          # of the last subscriber
+        self.on_publish = None          # function(topic, msg)
+
+    def publisher(self, topic, msg_class, latch=False):
+        return _Publisher(self, topic)
+
+    def subscriber(self, topic, msg_class, callback, queue_size=None):
+        self.queue_size = queue_size
+        return _Subscriber()
+
+    def wait(self, count):
+        """ Wait for *count* messages, failing after WAIT_TIME. """
+        deadline = time.time() + WAIT_TIME
+        with self.cond:
+            while len(self.published) < count:
+                remaining = deadline - time.time()
+                if remaining <= 0.0:
+                    raise AssertionError('published '
+                                         + str(len(self.published))
+                                         + ' of ' + str(count)
+                                         + ' messages')
+                self.cond.wait(remaining)
+            return self.published
+
+
+class _Event:
+    """ Fake rospy.TimerEvent, for invoking timer handlers directly. """
+    def __init__(self, now):
+        self.current_real = now
+
+
+def make_scheduler(callback, **kwargs):
+    """ :returns: new scheduler with a recording transport, whose
+        watchdog is only invoked by the test. """
+    rospy.rostime.set_rostime_initialized(True)     # use wall time
+    sched = Scheduler(callback, transport=_Transport(), **kwargs)
+    sched.timer.shutdown()
+    return sched
+
+
+class TestCoalesce(unittest.TestCase):
+    """Unit tests for coalesced scheduler notifications.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_callback_notifications(self):
+        def callback(rset):
+            for rq in rset.values():
+                if rq.msg.status == Request.NEW:
+                    rq.grant([TEST_RESOURCE])
+            if rset.requester_id in sched.requesters:
+                sched.notify(rset.requester_id)
+                sched.notify(rset.requester_id)
+
+        sched = make_scheduler(callback, coalesce=True)
+        sched._arrive(make_msg([TEST_UUID]))
+        self.assertEqual(len(sched.transport.published), 1)
+        self.assertEqual(sched.feedback_saved, 0)
+        sched._arrive(make_msg([TEST_UUID, DIFF_UUID]))
+        published = sched.transport.published
+        self.assertEqual(len(published), 2)     # sent only once
+        self.assertEqual(sched.feedback_saved, 2)
+        self.assertEqual(len(published[1][1].requests), 2)
+        for rq in published[1][1].requests:
+            self.assertEqual(rq.status, Request.GRANTED)
+
+    def test_flush_timer(self):
+        sched = make_scheduler(lambda rset: None, coalesce=True)
+        sched._arrive(make_msg([TEST_UUID]))
+        self.assertEqual(len(sched.transport.published), 1)
+        sched.notify(RQR_UUID)          # outside the callback
+        sched.notify(RQR_UUID)
+        sched.transport.wait(2)
+        time.sleep(0.1)
+        self.assertEqual(len(sched.transport.published), 2)
+        self.assertEqual(sched.feedback_saved, 1)
+        self.assertIsNone(sched._flush_timer)
+
+
+class TestConcurrent(unittest.TestCase):
+    """Unit tests for the concurrent scheduler mode.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        self.during = []        # (messages published, dispatching)
+        self.sched = make_scheduler(self.callback, concurrent=True)
+
+    def callback(self, rset):
+        for rq in rset.values():
+            if rq.msg.status == Request.NEW:
+                rq.grant([TEST_RESOURCE])
+        if rset.requester_id in self.sched.requesters:
+            self.sched.notify(rset.requester_id)
+            self.during.append((len(self.sched.transport.published),
+                                self.sched._dispatching.active))
+            if rset.requester_id == OTHER_UUID:
+                # preempt the other requester's grant
+                self.sched.requesters[RQR_UUID].rset[TEST_UUID].preempt()
+                self.sched.notify(RQR_UUID)
+
+    def test_own_locks(self):
+        self.sched._arrive(make_msg([TEST_UUID]))
+        rqr = self.sched.requesters[RQR_UUID]
+        self.assertIsNot(rqr.lock, self.sched.lock)
+        self.assertEqual(len(self.sched.transport.published), 1)
+
+    def test_publish_unlocked(self):
+        locked = []
+
+        def publish(topic, msg):
+            # another thread can take the Big Lock, unless held here
+            def probe():
+                if self.sched.lock.acquire(False):
+                    self.sched.lock.release()
+                    locked.append(False)
+                else:
+                    locked.append(True)
+            thread = threading.Thread(target=probe)
+            thread.start()
+            thread.join()
+
+        self.sched.transport.on_publish = publish
+        self.sched._arrive(make_msg([TEST_UUID]))       # new requester
+        self.sched._arrive(make_msg([TEST_UUID, DIFF_UUID]))
+        self.assertEqual(locked, [False, False, False])
+
+    def test_deferred_notify(self):
+        self.sched._arrive(make_msg([TEST_UUID]))
+        self.sched._arrive(make_msg([TEST_UUID, DIFF_UUID]))
+        # notified during the callback, sent after it returned
+        self.assertEqual(self.during, [(1, True)])
+        self.assertFalse(self.sched._dispatching.active)
+        published = self.sched.transport.published
+        self.assertEqual(len(published), 3)     # not coalesced
+        for topic, msg in published[1:]:
+            self.assertEqual([rq.status for rq in msg.requests],
+                             [Request.GRANTED, Request.GRANTED])
+
+    def test_notify_other_requester(self):
+        self.sched._arrive(make_msg([TEST_UUID]))
+        self.sched._arrive(make_msg([DIFF_UUID], rqr_id=OTHER_UUID))
+        self.sched._arrive(make_msg([DIFF_UUID, TEST_UUID],
+                                    rqr_id=OTHER_UUID))
+        feedback = [msg for topic, msg in self.sched.transport.published
+                    if topic == common.feedback_topic(RQR_UUID,
+                                                      self.sched.topic)]
+        self.assertEqual(len(feedback), 2)
+        self.assertEqual(feedback[1].requests[0].status,
+                         Request.PREEMPTING)
+
+    def test_notify_outside_callback(self):
+        self.sched._arrive(make_msg([TEST_UUID]))
+        self.sched.notify(RQR_UUID)     # sent immediately
+        self.assertEqual(len(self.sched.transport.published), 2)
+
+    def test_notify_while_busy(self):
+        self.sched._arrive(make_msg([TEST_UUID]))
+        rqr = self.sched.requesters[RQR_UUID]
+        locked = threading.Event()
+        notified = threading.Event()
+
+        def handler():
+            with rqr.lock:              # like handling a message
+                locked.set()
+                notified.wait(WAIT_TIME)
+            self.sched._flush_notifications()
+
+        thread = threading.Thread(target=handler)
+        thread.start()
+        self.assertTrue(locked.wait(WAIT_TIME))
+        self.sched.notify(RQR_UUID)     # left for the other thread
+        self.assertEqual(len(self.sched.transport.published), 1)
+        notified.set()
+        thread.join()
+        self.assertEqual(len(self.sched.transport.published), 2)
+
+
+class TestSharedFeedback(unittest.TestCase):
+    """Unit tests for scheduler feedback on a shared topic.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_shared_topic(self):
+        sched = make_scheduler(lambda rset: None, shared_feedback=True)
+        self.assertIsNone(sched.transport.queue_size)
+        sched._arrive(make_msg([TEST_UUID]))
+        sched._arrive(make_msg([DIFF_UUID], rqr_id=OTHER_UUID))
+        topic = common.shared_feedback_topic(sched.topic)
+        published = sched.transport.published
+        self.assertEqual([(t, unique_id.fromMsg(msg.requester))
+                          for t, msg in published],
+                         [(topic, RQR_UUID), (topic, OTHER_UUID)])
+        # the shared publisher stays, after a requester times out
+        sched._watchdog(_Event(rospy.Time.now() + sched.time_limit * 2))
+        self.assertEqual(sched.requesters, {})
+        self.assertEqual(sched.transport.unregistered, [])
+
+    def test_timeout_while_notifying(self):
+        sched = make_scheduler(lambda rset: None, concurrent=True)
+        sched._arrive(make_msg([TEST_UUID]))
+        rqr = sched.requesters[RQR_UUID]
+        errors = []
+
+        def flush():
+            try:
+                sched._flush_notifications()
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=flush)
+        with rqr.lock:
+            with sched.lock:
+                sched._notify_pending.add(RQR_UUID)
+            thread.start()
+            deadline = time.time() + WAIT_TIME
+            while sched._notify_pending:    # until the thread takes it
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.01)
+            # the requester times out before the thread gets its lock
+            sched._watchdog(_Event(rospy.Time.now()
+                                   + sched.time_limit * 2))
+            self.assertNotIn(RQR_UUID, sched.requesters)
+        thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(sched.transport.published), 1)
+
+
+class TestMailbox(unittest.TestCase):
+    """Unit tests for the scheduler worker mailbox.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_get(self):
+        mailbox = Mailbox()
+        self.assertIsNone(mailbox.get(timeout=0.01))
+        mailbox.put(RQR_UUID, 'msg1')
+        self.assertEqual(mailbox.get(), (RQR_UUID, 'msg1'))
+        mailbox.done(RQR_UUID)
+        self.assertIsNone(mailbox.get(timeout=0.01))
+        self.assertEqual(mailbox.dropped, 0)
+
+    def test_newest_message(self):
+        mailbox = Mailbox()
+        mailbox.put(RQR_UUID, 'msg1')
+        mailbox.put(OTHER_UUID, 'other1')
+        mailbox.put(RQR_UUID, 'msg2')   # replaces msg1
+        self.assertEqual(mailbox.dropped, 1)
+        self.assertEqual(mailbox.get(), (RQR_UUID, 'msg2'))
+        self.assertEqual(mailbox.get(), (OTHER_UUID, 'other1'))
+        self.assertIsNone(mailbox.get(timeout=0.01))
+
+    def test_busy_requester(self):
+        mailbox = Mailbox()
+        mailbox.put(RQR_UUID, 'msg1')
+        self.assertEqual(mailbox.get(), (RQR_UUID, 'msg1'))
+        mailbox.put(RQR_UUID, 'msg2')
+        mailbox.put(OTHER_UUID, 'other1')
+        # msg2 waits until msg1 is done
+        self.assertEqual(mailbox.get(), (OTHER_UUID, 'other1'))
+        self.assertIsNone(mailbox.get(timeout=0.01))
+        mailbox.done(RQR_UUID)
+        self.assertEqual(mailbox.get(), (RQR_UUID, 'msg2'))
+        mailbox.done(OTHER_UUID)
+        mailbox.done(RQR_UUID)
+        self.assertIsNone(mailbox.get(timeout=0.01))
+
+    def test_worker_exception(self):
+        handled = threading.Event()
+        calls = []
+
+        def callback(rset):
+            calls.append(rset.requester_id)
+            if len(calls) == 1:
+                raise RuntimeError('callback failed')
+            handled.set()
+
+        sched = make_scheduler(callback, workers=1)
+        self.assertIsNone(sched.transport.queue_size)
+        sched._arrive(make_msg([TEST_UUID]))
+        sched._arrive(make_msg([TEST_UUID], rqr_id=OTHER_UUID))
+        self.assertTrue(handled.wait(WAIT_TIME))
+        self.assertEqual(calls, [RQR_UUID, OTHER_UUID])
+        deadline = time.time() + WAIT_TIME
+        while OTHER_UUID not in sched.requesters:   # being added
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+        self.assertNotIn(RQR_UUID, sched.requesters)
+
+
+class TestIntervalHistogram(unittest.TestCase):
+    """Unit tests for the message arrival histogram.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_empty(self):
+        hist = IntervalHistogram()
+        self.assertEqual(len(hist.counts), len(hist.bounds) + 1)
+        self.assertEqual(sum(hist.counts), 0)
+        hist.record(10.0)               # first event: no interval yet
+        self.assertEqual(sum(hist.counts), 0)
+        self.assertEqual(hist.last, 10.0)
+
+    def test_buckets(self):
+        hist = IntervalHistogram(bounds=(0.1, 1.0))
+        for now in (0.0, 0.05, 0.25, 0.75, 2.0, 12.0):
+            hist.record(now)
+        self.assertEqual(hist.counts, [1, 2, 2])
+        self.assertEqual(str(hist).split('\n'),
+                         ['[0, 0.1): 1', '[0.1, 1.0): 2', '[1.0, inf): 2'])
+
+    def test_reset(self):
+        hist = IntervalHistogram()
+        hist.record(1.0)
+        hist.record(2.0)
+        hist.reset()
+        self.assertEqual(sum(hist.counts), 0)
+        self.assertIsNone(hist.last)
+
+
+class TestWatchdog(unittest.TestCase):
+    """Unit tests for the scheduler requester watchdog.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        self.canceled = []              # requester IDs, when timed out
+        self.sched = make_scheduler(self.callback)
+        self.limit = self.sched.time_limit
+        self.t0 = rospy.Time.now()
+
+    def callback(self, rset):
+        for rq in rset.values():
+            if (rq.msg.status == Request.CANCELING
+                    and rq.msg.reason == Request.TIMEOUT):
+                self.canceled.append(rset.requester_id)
+
+    def after(self, fraction):
+        """ :returns: time *fraction* of the time limit after t0. """
+        return self.t0 + self.limit * fraction
+
+    def test_expiry(self):
+        self.sched._arrive(make_msg([TEST_UUID], stamp=self.t0))
+        self.sched._watchdog(_Event(self.after(0.5)))   # nothing due
+        self.assertIn(RQR_UUID, self.sched.requesters)
+        self.assertEqual(len(self.sched._deadlines), 1)
+        self.sched._watchdog(_Event(self.after(1.1)))
+        self.assertNotIn(RQR_UUID, self.sched.requesters)
+        self.assertEqual(self.canceled, [RQR_UUID])
+        self.assertEqual(self.sched._deadlines, [])
+        self.assertEqual(self.sched.transport.unregistered,
+                         [common.feedback_topic(RQR_UUID,
+                                                self.sched.topic)])
+
+    def test_still_active(self):
+        self.sched._arrive(make_msg([TEST_UUID], stamp=self.t0))
+        self.sched._arrive(make_msg([TEST_UUID], stamp=self.t0,
+                                    rqr_id=OTHER_UUID))
+        self.sched._arrive(make_msg([TEST_UUID], stamp=self.after(0.75),
+                                    rqr_id=OTHER_UUID))
+        self.sched._watchdog(_Event(self.after(1.1)))
+        self.assertEqual(self.canceled, [RQR_UUID])
+        self.assertIn(OTHER_UUID, self.sched.requesters)
+        # the active requester got a new deadline
+        self.assertEqual(self.sched._deadlines,
+                         [(self.after(1.75), OTHER_UUID)])
+        self.sched._watchdog(_Event(self.after(1.5)))
+        self.assertIn(OTHER_UUID, self.sched.requesters)
+        self.sched._watchdog(_Event(self.after(1.8)))
+        self.assertEqual(self.canceled, [RQR_UUID, OTHER_UUID])
+        self.assertEqual(self.sched.requesters, {})
+
+    def test_reconnect(self):
+        self.sched._arrive(make_msg([TEST_UUID], stamp=self.t0))
+        self.sched._watchdog(_Event(self.after(1.1)))
+        self.assertNotIn(RQR_UUID, self.sched.requesters)
+        # the same requester comes back
+        self.sched._arrive(make_msg([DIFF_UUID], stamp=self.after(1.2)))
+        rqr = self.sched.requesters[RQR_UUID]
+        self.assertEqual(list(rqr.rset.keys()), [DIFF_UUID])
+        self.assertEqual(self.sched._deadlines,
+                         [(self.after(2.2), RQR_UUID)])
+        self.sched._watchdog(_Event(self.after(2.1)))
+        self.assertIs(self.sched.requesters[RQR_UUID], rqr)
+        self.sched._watchdog(_Event(self.after(2.3)))
+        self.assertNotIn(RQR_UUID, self.sched.requesters)
+        self.assertEqual(self.canceled, [RQR_UUID, RQR_UUID])
+
+
+class TestSerialized(unittest.TestCase):
+    """Unit tests for handling serialized request messages.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        self.calls = 0
+
+        def callback(rset):
+            self.calls += 1
+
+        self.sched = make_scheduler(callback)
+        self.now = rospy.Time.now()
+
+    def stamp(self, secs):
+        return self.now + rospy.Duration(secs)
+
+    def test_peek(self):
+        msg = make_msg([TEST_UUID], stamp=rospy.Time(1234, 5678),
+                       frame_id='hz=4')
+        buff = serialize(msg)._buff
+        self.assertEqual(_peek(buff), (rospy.Time(1234, 5678), 4, 20))
+
+    def test_requester_id(self):
+        msg = make_msg([TEST_UUID], frame_id='hz=4', rqr_id=OTHER_UUID)
+        self.assertEqual(_requester_id(msg), OTHER_UUID)
+        self.assertEqual(_requester_id(serialize(msg)), OTHER_UUID)
+
+    def test_skip_heartbeat(self):
+        self.sched._arrive(serialize(make_msg([TEST_UUID],
+                                              stamp=self.stamp(0))))
+        rqr = self.sched.requesters[RQR_UUID]
+        self.assertEqual(self.calls, 1)
+        self.sched._arrive(serialize(make_msg([TEST_UUID],
+                                              stamp=self.stamp(1))))
+        self.assertEqual(rqr.skipped, 0)
+        self.assertIsNotNone(rqr.body)  # requester is up to date
+        self.sched._arrive(serialize(make_msg([TEST_UUID],
+                                              stamp=self.stamp(2))))
+        self.assertEqual(rqr.skipped, 1)
+        self.assertEqual(rqr.last_msg_time, self.stamp(2))
+        self.assertEqual(self.calls, 1)
+
+    def test_no_skip_after_change(self):
+        self.sched._arrive(serialize(make_msg([TEST_UUID],
+                                              stamp=self.stamp(0))))
+        self.sched._arrive(serialize(make_msg([TEST_UUID],
+                                              stamp=self.stamp(1))))
+        rqr = self.sched.requesters[RQR_UUID]
+        with self.sched.lock:           # scheduler grants the request
+            rqr.rset[TEST_UUID].grant([TEST_RESOURCE])
+        self.sched._arrive(serialize(make_msg([TEST_UUID],
+                                              stamp=self.stamp(2))))
+        self.assertEqual(rqr.skipped, 0)
+        self.assertEqual(rqr.last_msg_time, self.stamp(2))
+        self.assertEqual(rqr.rset[TEST_UUID].msg.status, Request.GRANTED)
+
+    def test_no_skip_delta_frames(self):
+        for seq in range(1, 4):
+            frame = common.encode_frame({'seq': str(seq), 'mode': 'full'})
+            self.sched._arrive(serialize(make_msg([TEST_UUID],
+                                                  stamp=self.stamp(seq),
+                                                  frame_id=frame)))
+        rqr = self.sched.requesters[RQR_UUID]
+        self.assertEqual(rqr.skipped, 0)
+        self.assertEqual(rqr.delta.in_seq, 3)
+
+    def test_wrong_type(self):
+        msg = serialize(make_msg([TEST_UUID]))
+        msg._connection_header = {'callerid': '/talker',
+                                  'md5sum': '992ce8a1687cec8c8bd883ec73ca41d1',
+                                  'type': 'std_msgs/String'}
+        self.sched._arrive(msg)
+        self.assertNotIn(RQR_UUID, self.sched.requesters)
+        self.assertEqual(self.calls, 0)
+        msg._connection_header['md5sum'] = SchedulerRequests._md5sum
+        msg._connection_header['type'] = SchedulerRequests._type
+        self.sched._arrive(msg)
+        self.assertIn(RQR_UUID, self.sched.requesters)
+
+
+class TestAdaptiveHeartbeats(unittest.TestCase):
+    """Unit tests for heartbeat frequencies announced by requesters.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        self.sched = make_scheduler(lambda rset: None, frequency=1.0)
+        self.t0 = rospy.Time.now()
+
+    def after(self, secs):
+        return self.t0 + rospy.Duration(secs)
+
+    def arrive(self, secs, hz=None, serialized=False):
+        frame_id = ''
+        if hz is not None:
+            frame_id = common.encode_frame({'hz': str(hz)})
+        msg = make_msg([TEST_UUID], stamp=self.after(secs),
+                       frame_id=frame_id)
+        if serialized:
+            msg = serialize(msg)
+        self.sched._arrive(msg)
+        return self.sched.requesters[RQR_UUID]
+
+    def test_negotiate(self):
+        rqr = self.arrive(0.0, hz=2.0)
+        self.assertEqual(rqr.heartbeat_hz, 2.0)
+        self.assertEqual(rqr.time_limit,
+                         rospy.Duration(common.MISSED_HEARTBEATS / 2.0))
+        rqr = self.arrive(1.0)          # no longer adaptive
+        self.assertIsNone(rqr.heartbeat_hz)
+        self.assertEqual(rqr.time_limit, self.sched.time_limit)
+
+    def test_negotiate_slowest(self):
+        rqr = self.arrive(0.0, hz=0.001)
+        slowest = self.sched.heartbeat_hz * common.IDLE_HEARTBEAT_FACTOR
+        self.assertEqual(rqr.heartbeat_hz, slowest)
+        self.assertEqual(rqr.time_limit,
+                         rospy.Duration(common.MISSED_HEARTBEATS / slowest))
+
+    def test_feedback_hz(self):
+        self.arrive(0.0, hz=1.0)
+        msg = self.sched.transport.published[-1][1]
+        options = common.decode_frame(msg.header.frame_id)
+        self.assertEqual(float(options['hz']), self.sched.heartbeat_hz)
+
+    def test_throttle(self):
+        published = self.sched.transport.published
+        self.arrive(0.0, hz=1.0, serialized=True)
+        self.arrive(1.0, hz=1.0, serialized=True)
+        self.assertEqual(len(published), 1)     # nothing to tell
+        self.sched.heartbeat_hz = 0.5           # overloaded
+        rqr = self.arrive(2.0, hz=1.0, serialized=True)
+        self.assertEqual(rqr.skipped, 1)
+        self.assertEqual(len(published), 2)     # slow down, please
+        self.assertEqual(common.decode_frame(
+            published[-1][1].header.frame_id)['hz'], '0.5')
+        self.arrive(3.0, hz=1.0, serialized=True)
+        self.assertEqual(rqr.skipped, 2)
+        self.assertEqual(len(published), 3)
+
+    def test_shorter_limit(self):
+        self.arrive(0.0, hz=0.25)       # time limit: 16 seconds
+        rqr = self.arrive(1.0, hz=4.0)  # time limit: 1 second
+        self.assertEqual(rqr.deadline, self.after(2.0))
+        self.assertEqual(sorted(self.sched._deadlines),
+                         [(self.after(2.0), RQR_UUID),
+                          (self.after(16.0), RQR_UUID)])
+        self.arrive(1.5, hz=4.0)
+        self.sched._watchdog(_Event(self.after(2.1)))
+        self.assertIs(self.sched.requesters[RQR_UUID], rqr)
+        self.assertEqual(rqr.deadline, self.after(2.5))
+        self.arrive(16.2, hz=4.0)
+        self.sched._watchdog(_Event(self.after(16.5)))
+        self.assertIs(self.sched.requesters[RQR_UUID], rqr)
+        # the stale deadline was discarded
+        self.assertEqual(self.sched._deadlines,
+                         [(self.after(17.2), RQR_UUID)])
+        self.sched._watchdog(_Event(self.after(17.3)))
+        self.assertNotIn(RQR_UUID, self.sched.requesters)
+
+    def test_lost_sooner(self):
+        self.arrive(0.0, hz=0.25)
+        self.arrive(1.0, hz=4.0)
+        self.sched._watchdog(_Event(self.after(2.5)))
+        self.assertNotIn(RQR_UUID, self.sched.requesters)
+
+
+class TestAlarms(unittest.TestCase):
+    """Integration tests for scheduler alarms.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        self.alarms = []                # request IDs, when due
+        self.sched = make_scheduler(self.callback, alarm=self.alarm)
+        self.sched.alarm_timer.shutdown()   # the tests invoke it
+        self.timers = self.sched._observer.timers
+        self.t0 = rospy.Time.now()
+
+    def callback(self, rset):
+        for rq in rset.values():
+            if rq.msg.status == Request.NEW:
+                rq.grant(rq.msg.resources)
+            elif rq.msg.status == Request.CANCELING:
+                rq.close()
+
+    def alarm(self, rset, rq):
+        self.alarms.append(rq.uuid)
+        if rq.msg.status == Request.GRANTED:
+            rq.preempt()                # held long enough
+        else:
+            rq.grant(rq.msg.resources)  # reservation now available
+
+    def after(self, secs):
+        return self.t0 + rospy.Duration(secs)
+
+    def arrive(self, status, secs=0.0, hold_time=rospy.Duration(),
+               availability=rospy.Time()):
+        msg = make_msg([TEST_UUID], status=status, stamp=self.after(secs))
+        msg.requests[0].hold_time = hold_time
+        msg.requests[0].availability = availability
+        self.sched._arrive(msg)
+
+    def feedback_status(self):
+        """ :returns: status of last feedback message published. """
+        return self.sched.transport.published[-1][1].requests[0].status
+
+    def test_hold_time(self):
+        self.arrive(Request.NEW, hold_time=rospy.Duration(2.0))
+        self.assertEqual(self.timers[TEST_UUID][0], Request.GRANTED)
+        timer = self.timers[TEST_UUID][1]
+        # the requester acknowledging the grant keeps the same alarm
+        self.arrive(Request.GRANTED, secs=0.5,
+                    hold_time=rospy.Duration(2.0))
+        self.assertIs(self.timers[TEST_UUID][1], timer)
+        self.sched._ring(_Event(self.after(1.0)))
+        self.assertEqual(self.alarms, [])
+        published = len(self.sched.transport.published)
+        self.sched._ring(_Event(self.after(2.5)))
+        self.assertEqual(self.alarms, [TEST_UUID])
+        self.assertNotIn(TEST_UUID, self.timers)
+        self.assertEqual(len(self.sched.transport.published), published + 1)
+        self.assertEqual(self.feedback_status(), Request.PREEMPTING)
+        self.sched._ring(_Event(self.after(5.0)))
+        self.assertEqual(self.alarms, [TEST_UUID])      # only once
+
+    def test_no_hold_time(self):
+        self.arrive(Request.NEW)
+        self.assertEqual(self.timers, {})
+        self.assertEqual(len(self.sched.wheel), 0)
+
+    def test_canceled(self):
+        self.arrive(Request.NEW, hold_time=rospy.Duration(2.0))
+        self.assertIn(TEST_UUID, self.timers)
+        self.arrive(Request.CANCELING, secs=0.5,
+                    hold_time=rospy.Duration(2.0))
+        self.assertEqual(self.timers, {})
+        self.assertEqual(len(self.sched.wheel), 0)
+        self.sched._ring(_Event(self.after(2.5)))
+        self.assertEqual(self.alarms, [])
+
+    def test_reservation(self):
+        self.arrive(Request.RESERVED, availability=self.after(1.0))
+        self.assertEqual(self.timers[TEST_UUID][0], Request.RESERVED)
+        self.sched._ring(_Event(self.after(0.5)))
+        self.assertEqual(self.alarms, [])
+        self.sched._ring(_Event(self.after(1.5)))
+        self.assertEqual(self.alarms, [TEST_UUID])
+        self.assertEqual(self.feedback_status(), Request.GRANTED)
+
+    def test_requester_timeout(self):
+        self.arrive(Request.NEW, hold_time=rospy.Duration(100.0))
+        self.assertIn(TEST_UUID, self.timers)
+        self.sched._watchdog(_Event(self.t0 + self.sched.time_limit * 1.1))
+        self.assertNotIn(RQR_UUID, self.sched.requesters)
+        self.assertEqual(self.timers, {})
+        self.assertEqual(len(self.sched.wheel), 0)
+        self.sched._ring(_Event(self.after(101.0)))
+        self.assertEqual(self.alarms, [])
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_scheduler',
+                    TestIntervalHistogram)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_adaptive_heartbeats',
+                    TestAdaptiveHeartbeats)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_alarms',
+                    TestAlarms)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_coalesce',
+                    TestCoalesce)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_concurrent',
+                    TestConcurrent)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_mailbox',
+                    TestMailbox)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_shared_feedback',
+                    TestSharedFeedback)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_serialized',
+                    TestSerialized)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_watchdog',
+                    TestWatchdog)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# enable some python3 compatibility options:
+from __future__ import absolute_import, print_function
+
+import unittest
+
+# module being tested:
+from rocon_scheduler_requests.timing_wheel import TimingWheel
+
+
+class TestTimingWheel(unittest.TestCase):
+    """Unit tests for the hierarchical timing wheel.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_empty(self):
+        wheel = TimingWheel(0.1, 100.0)
+        self.assertEqual(len(wheel), 0)
+        self.assertEqual(wheel.advance(1000.0), [])
+        self.assertEqual(wheel.tick, 10000)
+
+    def test_due(self):
+        wheel = TimingWheel(0.25, 100.0)
+        wheel.schedule(100.3, 'a')
+        wheel.schedule(100.9, 'b')
+        wheel.schedule(99.0, 'late')
+        self.assertEqual(len(wheel), 3)
+        self.assertEqual(wheel.advance(100.0), ['late'])
+        self.assertEqual(wheel.advance(100.3), [])      # rounded up
+        self.assertEqual(wheel.advance(100.5), ['a'])
+        self.assertEqual(wheel.advance(101.0), ['b'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_cancel(self):
+        wheel = TimingWheel(0.1, 0.0)
+        entry = wheel.schedule(1.0, 'a')
+        wheel.schedule(1.0, 'b')
+        wheel.cancel(entry)
+        wheel.cancel(entry)             # cancelling again does nothing
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.advance(2.0), ['b'])
+        wheel.cancel(entry)
+        self.assertEqual(len(wheel), 0)
+
+    def test_levels(self):
+        wheel = TimingWheel(1.0, 0.0, slots=4, levels=2)
+        deadlines = [1, 3, 4, 5, 9, 15, 16, 17, 30, 100]
+        for when in deadlines:
+            wheel.schedule(when, when)
+        fired = []
+        for now in range(1, 101):
+            for when in wheel.advance(now):
+                self.assertEqual(when, now)     # never early or late
+                fired.append(when)
+        self.assertEqual(fired, deadlines)
+        self.assertEqual(len(wheel), 0)
+
+    def test_large_steps(self):
+        wheel = TimingWheel(1.0, 0.0, slots=4, levels=2)
+        for when in range(1, 50):
+            wheel.schedule(when, when)
+        self.assertEqual(sorted(wheel.advance(20.5)), list(range(1, 21)))
+        self.assertEqual(sorted(wheel.advance(60.0)), list(range(21, 50)))
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_timing_wheel',
+                    TestTimingWheel)
@@ -5,12 +5,18 @@
 from __future__ import absolute_import, print_function
 
 import copy
+import gc
 import uuid
 import unittest
 
+try:
+    import tracemalloc
+except ImportError:                     # Python 2
+    tracemalloc = None
+
 # ROS dependencies
 import unique_id
-from scheduler_msgs.msg import Request, Resource
+from scheduler_msgs.msg import Request, Resource, SchedulerRequests
 
 # module being tested:
 from rocon_scheduler_requests.transitions import *
@@ -168,6 +174,79 @@ class TestTransitions(unittest.TestCase):
         self.assert_valid(ActiveRequest, Request.WAITING,
                           'preempt', Request.WAITING)
 
+    def test_generation(self):
+        rq = ActiveRequest(Request(id=unique_id.toMsg(TEST_UUID),
+                                   resources=[TEST_WILDCARD],
+                                   status=Request.NEW))
+        self.assertEqual(rq.generation, 0)
+        rq.wait(reason=Request.BUSY)
+        self.assertEqual(rq.generation, 1)
+        rq.wait(reason=Request.BUSY)    # no change
+        self.assertEqual(rq.generation, 1)
+        rq.grant([TEST_RESOURCE])
+        self.assertEqual(rq.generation, 2)
+        rq.preempt()                    # reason changes
+        self.assertEqual(rq.generation, 3)
+        rq.touch()
+        self.assertEqual(rq.generation, 4)
+
+    def test_memory(self):
+
+        class DictRequest(ActiveRequest):
+            """ The same request class, with a ``__dict__``. """
+
+        def measure(build):
+            """ :returns: bytes per request retained by *build*,
+            including the request messages it was given. """
+            ids = [unique_id.toMsg(uuid.uuid4()) for i in range(1000)]
+            gc.collect()
+            tracemalloc.start()
+            try:
+                before = tracemalloc.get_traced_memory()[0]
+                reqs = [Request(id=rid, resources=[TEST_WILDCARD],
+                                status=Request.NEW)
+                        for rid in ids]
+                rset = build(reqs)
+                for rq in rset.values():
+                    rq.grant([TEST_RESOURCE])
+                gc.collect()
+                size = tracemalloc.get_traced_memory()[0] - before
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(len(rset), 1000)
+            return size / 1000.0
+
+        def whole_set(contents):
+            return lambda reqs: RequestSet(reqs, RQR_UUID,
+                                           contents=contents)
+
+        def plain_dict(reqs):
+            return dict((rq.uuid, rq) for rq in map(ActiveRequest, reqs))
+
+        rset = RequestSet([Request(id=unique_id.toMsg(TEST_UUID),
+                                   resources=[TEST_WILDCARD],
+                                   status=Request.NEW)],
+                          RQR_UUID, contents=ActiveRequest)
+        for rq in [ResourceRequest(rset[TEST_UUID].msg), rset[TEST_UUID]]:
+            self.assertFalse(hasattr(rq, '__dict__'))
+            self.assertRaises(AttributeError, setattr, rq, 'extra', 0)
+        if tracemalloc is not None:     # Python 3.4 or later?
+            slots = measure(whole_set(ActiveRequest))
+            self.assertLess(slots, measure(whole_set(DictRequest)))
+            # the status index costs little beyond a plain dict
+            self.assertLess(slots, 1.25 * measure(plain_dict))
+
+        # allocations share the granted resource list
+        rq = rset[TEST_UUID]
+        self.assertEqual(rq.allocations, [])
+        rq.grant([TEST_RESOURCE])
+        self.assertIs(rq.allocations, rq.msg.resources)
+        self.assertEqual(rq.allocations, [TEST_RESOURCE])
+        # ... unless assigned
+        rq.allocations = []
+        self.assertEqual(rq.allocations, [])
+        self.assertEqual(rq.msg.resources, [TEST_RESOURCE])
+
     def test_validate(self):
         rq1 = ResourceRequest(Request(id=unique_id.toMsg(TEST_UUID),
                                       resources=[TEST_RESOURCE],
@@ -176,6 +255,39 @@ class TestTransitions(unittest.TestCase):
         self.assertTrue(rq1._validate(Request.PREEMPTING))
         self.assertFalse(rq1._validate(Request.CLOSED))
 
+    def test_compiled_tables(self):
+        statuses = range(Request.CLOSED + 2)
+        rq = ResourceRequest(Request(id=unique_id.toMsg(TEST_UUID),
+                                     resources=[TEST_RESOURCE]))
+        for old in statuses:
+            rq.msg.status = old
+            for new in statuses:
+                self.assertEqual(rq._validate(new),
+                                 (old, new) in TRANS_TABLE)
+        for event in [EVENT_CANCEL, EVENT_CLOSE, EVENT_GRANT,
+                      EVENT_PREEMPT, EVENT_WAIT]:
+            for old in statuses:
+                rq.msg.status = old
+                self.assertEqual(validate_all([rq], event) == [rq],
+                                 old in event.trans)
+
+    def test_transition_all(self):
+        rqs = [ActiveRequest(Request(id=unique_id.toMsg(TEST_UUID),
+                                     resources=[TEST_RESOURCE],
+                                     status=status))
+               for status in [Request.NEW, Request.GRANTED,
+                              Request.WAITING, Request.CANCELING]]
+        self.assertEqual(validate_all(rqs, EVENT_WAIT), [rqs[0], rqs[2]])
+        rejected = transition_all(rqs, EVENT_WAIT, Request.BUSY)
+        self.assertEqual(rejected, [rqs[1], rqs[3]])
+        self.assertEqual([rq.msg.status for rq in rqs],
+                         [Request.WAITING, Request.GRANTED,
+                          Request.WAITING, Request.CANCELING])
+        self.assertEqual([rq.generation for rq in rqs], [1, 0, 1, 0])
+        self.assertEqual(transition_all(rqs, EVENT_CANCEL), [])
+        self.assertEqual([rq.msg.status for rq in rqs],
+                         [Request.CANCELING] * 4)
+        self.assertEqual([rq.generation for rq in rqs], [2, 1, 2, 0])
 
     def test_wait(self):
         self.assert_invalid(ActiveRequest, Request.CANCELING,
@@ -336,7 +448,9 @@ requests:
         self.assertEqual(rset.to_msg(stamp=rospy.Time()), sch_msg)
 
         # merge an empty request set: rset should remain the same
-        rset.merge(RequestSet([], RQR_UUID, contents=ActiveRequest))
+        changed = rset.merge(RequestSet([], RQR_UUID,
+                                        contents=ActiveRequest))
+        self.assertEqual(changed, [])
         self.assertEqual(len(rset), 1)
         self.assertIn(TEST_UUID, rset)
         self.assertEqual(rset.to_msg(stamp=rospy.Time()), sch_msg)
@@ -354,7 +468,7 @@ requests:
 
         # merge an empty request set: TEST_UUID should be deleted
         empty_rset = RequestSet([], RQR_UUID)
-        rset.merge(empty_rset)
+        self.assertEqual(rset.merge(empty_rset), [TEST_UUID])
         self.assertEqual(len(rset), 0)
         self.assertNotIn(TEST_UUID, rset)
         self.assertNotEqual(rset.to_msg(stamp=rospy.Time()), sch_msg)
@@ -429,15 +543,150 @@ requests:
         msg2 = Request(id=unique_id.toMsg(TEST_UUID),
                        resources=[TEST_RESOURCE],
                        status=Request.GRANTED)
-        rset.merge(RequestSet([msg2], RQR_UUID, contents=ActiveRequest))
+        changed = rset.merge(RequestSet([msg2], RQR_UUID,
+                                        contents=ActiveRequest))
+        self.assertEqual(changed, [TEST_UUID])
         self.assertEqual(len(rset), 1)
         self.assertIn(TEST_UUID, rset)
         self.assertEqual(rset[TEST_UUID].msg.status, Request.GRANTED)
         self.assertEqual(rset[TEST_UUID].msg.resources, [TEST_RESOURCE])
+        self.assertEqual(rset[TEST_UUID].generation, 1)
         sch_msg = SchedulerRequests(requester=unique_id.toMsg(RQR_UUID),
                                     requests=[msg2])
         self.assertEqual(rset.to_msg(stamp=rospy.Time()), sch_msg)
 
+        # merging the same update again should change nothing
+        msg3 = Request(id=unique_id.toMsg(TEST_UUID),
+                       resources=[TEST_RESOURCE],
+                       status=Request.GRANTED)
+        changed = rset.merge(RequestSet([msg3], RQR_UUID,
+                                        contents=ActiveRequest))
+        self.assertEqual(changed, [])
+        self.assertEqual(rset[TEST_UUID].generation, 1)
+
+    def test_digest(self):
+        msg1 = Request(id=unique_id.toMsg(TEST_UUID),
+                       resources=[TEST_WILDCARD],
+                       status=Request.NEW)
+        msg2 = Request(id=unique_id.toMsg(DIFF_UUID),
+                       resources=[TEST_RESOURCE],
+                       status=Request.NEW)
+        rset = RequestSet([msg1, msg2], RQR_UUID, contents=ActiveRequest)
+        rs2 = RequestSet([copy.deepcopy(msg2), copy.deepcopy(msg1)],
+                         RQR_UUID)
+        self.assertEqual(rset.digest(), rs2.digest())
+
+        # the digest is updated incrementally
+        rset[TEST_UUID].grant([TEST_RESOURCE])
+        self.assertNotEqual(rset.digest(), rs2.digest())
+        self.assertNotEqual(rset, rs2)
+        rs3 = copy.deepcopy(rset)
+        rs3._digest = None              # recompute from scratch
+        self.assertEqual(rset.digest(), rs3.digest())
+        del rset[DIFF_UUID]
+        rs3 = RequestSet([rset[TEST_UUID].msg], RQR_UUID)
+        self.assertEqual(rset.digest(), rs3.digest())
+        self.assertEqual(rset, rs3)
+
+    def test_diff(self):
+        msg1 = Request(id=unique_id.toMsg(TEST_UUID),
+                       resources=[TEST_WILDCARD],
+                       status=Request.NEW)
+        msg2 = Request(id=unique_id.toMsg(DIFF_UUID),
+                       resources=[TEST_RESOURCE],
+                       status=Request.NEW)
+        rset = RequestSet([msg1, msg2], RQR_UUID, contents=ActiveRequest)
+
+        # identical messages: nothing decoded
+        updates, removed = rset.diff([copy.deepcopy(msg2),
+                                      copy.deepcopy(msg1)])
+        self.assertEqual(len(updates), 0)
+        self.assertEqual(removed, [])
+
+        # one changed, one missing
+        msg3 = copy.deepcopy(msg1)
+        msg3.status = Request.CANCELING
+        updates, removed = rset.diff([msg3])
+        self.assertEqual(list(updates.keys()), [TEST_UUID])
+        self.assertEqual(removed, [DIFF_UUID])
+
+        # merging the differences is like merging the complete set
+        rs2 = copy.deepcopy(rset)
+        rset.merge(updates, removed)
+        rs2.merge(RequestSet([msg3], RQR_UUID))
+        self.assertEqual(rset, rs2)
+
+    def test_by_status(self):
+        msg1 = Request(id=unique_id.toMsg(TEST_UUID),
+                       resources=[TEST_WILDCARD],
+                       status=Request.NEW)
+        msg2 = Request(id=unique_id.toMsg(DIFF_UUID),
+                       resources=[TEST_RESOURCE],
+                       status=Request.NEW)
+        rset = RequestSet([msg1, msg2], RQR_UUID, contents=ActiveRequest)
+        self.assertEqual(len(rset.by_status(Request.NEW)), 2)
+        self.assertEqual(rset.by_status(Request.GRANTED), [])
+        generation = rset.generation
+
+        # transitions move requests between the indexes
+        rset[TEST_UUID].grant([TEST_RESOURCE])
+        self.assertEqual(rset.by_status(Request.NEW), [rset[DIFF_UUID]])
+        self.assertEqual(rset.by_status(Request.GRANTED), [rset[TEST_UUID]])
+        self.assertNotEqual(rset.generation, generation)
+
+        # merge updates the indexes, too
+        msg3 = Request(id=unique_id.toMsg(TEST_UUID),
+                       resources=[TEST_RESOURCE],
+                       status=Request.CANCELING)
+        rset.merge(RequestSet([msg3, msg2], RQR_UUID))
+        self.assertEqual(rset.by_status(Request.GRANTED), [])
+        self.assertEqual(rset.by_status(Request.CANCELING),
+                         [rset[TEST_UUID]])
+        rset[TEST_UUID].close()
+        rset.merge(RequestSet([msg2], RQR_UUID))
+        self.assertEqual(rset.by_status(Request.CLOSED), [])
+        self.assertNotIn(TEST_UUID, rset)
+
+        # direct deletion
+        del rset[DIFF_UUID]
+        self.assertEqual(rset.by_status(Request.NEW), [])
+        self.assertEqual(len(rset), 0)
+        self.assertEqual(rset._by_status, {})   # no empty buckets left
+
+    def test_duplicate_ids(self):
+        msg1 = Request(id=unique_id.toMsg(TEST_UUID),
+                       resources=[TEST_WILDCARD],
+                       status=Request.NEW)
+        msg2 = Request(id=unique_id.toMsg(TEST_UUID),
+                       resources=[TEST_RESOURCE],
+                       status=Request.GRANTED)
+        rset = RequestSet([msg1, msg2], RQR_UUID, contents=ActiveRequest)
+        self.assertEqual(len(rset), 1)
+        self.assertIs(rset[TEST_UUID].msg, msg2)        # last one wins
+        self.assertEqual(rset.by_status(Request.NEW), [])
+        self.assertEqual(rset.by_status(Request.GRANTED),
+                         [rset[TEST_UUID]])
+
+        class Observer:
+            """ Records the requests it is told were added. """
+            def __init__(self):
+                self.requests = []
+
+            def added(self, rq):
+                self.requests.append(rq)
+
+            def changed(self, rq):
+                pass
+
+            def removed(self, rq):
+                pass
+
+        observer = Observer()
+        rset.attach(observer)
+        self.assertEqual(observer.requests, [rset[TEST_UUID]])
+        del rset[TEST_UUID]
+        self.assertEqual(rset._by_status, {})
+
 if __name__ == '__main__':
     import rosunit
     rosunit.unitrun('rocon_scheduler_requests',
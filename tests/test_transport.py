@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+
+# enable some python3 compatibility options:
+# (unicode_literals not compatible with python2 uuid module)
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import unittest
+
+# ROS dependencies
+import rospy
+import unique_id
+from scheduler_msgs.msg import Request, Resource, SchedulerRequests
+
+# module being tested:
+from rocon_scheduler_requests.transport import *
+from rocon_scheduler_requests import Requester, Scheduler
+
+RQR_UUID = uuid.UUID('01234567-89ab-cdef-0123-456789abcdef')
+TEST_UUID = uuid.UUID('01234567-89ab-cdef-fedc-ba9876543210')
+TEST_TOPIC = 'test_topic'
+TEST_RESOURCE = Resource(
+    name='test_rapp',
+    platform_info='rocon:///linux/precise/ros/segbot/roberto')
+WAIT_TIME = 5.0
+
+
+def make_msg(status=Request.NEW):
+    return SchedulerRequests(
+        requester=unique_id.toMsg(RQR_UUID),
+        requests=[Request(id=unique_id.toMsg(TEST_UUID),
+                          resources=[TEST_RESOURCE],
+                          status=status)])
+
+
+class Receiver:
+    """ Subscriber callback, saving messages received. """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.msgs = []
+
+    def __call__(self, msg):
+        with self.cond:
+            self.msgs.append(msg)
+            self.cond.notify_all()
+
+    def wait(self, count):
+        """ Wait for *count* messages, failing after WAIT_TIME. """
+        deadline = time.time() + WAIT_TIME
+        with self.cond:
+            while len(self.msgs) < count:
+                remaining = deadline - time.time()
+                if remaining <= 0.0:
+                    raise AssertionError('received ' + str(len(self.msgs))
+                                         + ' of ' + str(count)
+                                         + ' messages')
+                self.cond.wait(remaining)
+            return self.msgs
+
+
+class TestLocalTransport(unittest.TestCase):
+    """Unit tests for the in-process transport.
+
+    These tests do not require a running ROS core.
+    """
+
+    def test_copy_message(self):
+        msg = make_msg()
+        new = copy_message(msg)
+        self.assertEqual(new, msg)
+        self.assertIsNot(new.header, msg.header)
+        self.assertIsNot(new.requests[0], msg.requests[0])
+        new.requests[0].status = Request.GRANTED
+        self.assertEqual(msg.requests[0].status, Request.NEW)
+
+    def test_publish(self):
+        transport = LocalTransport()
+        receiver = Receiver()
+        sub = transport.subscriber(TEST_TOPIC, SchedulerRequests, receiver)
+        pub = transport.publisher(TEST_TOPIC, SchedulerRequests)
+        msg = make_msg()
+        pub.publish(msg)
+        msg.requests[0].status = Request.CANCELING   # after publishing
+        msgs = receiver.wait(1)
+        self.assertEqual(msgs[0], make_msg())
+        self.assertIsNot(msgs[0], msg)
+        sub.unregister()
+        self.assertEqual(transport.subscribers[TEST_TOPIC], [])
+
+    def test_latched(self):
+        transport = LocalTransport()
+        pub = transport.publisher(TEST_TOPIC, SchedulerRequests, latch=True)
+        pub.publish(make_msg(Request.GRANTED))
+        receiver = Receiver()
+        transport.subscriber(TEST_TOPIC, SchedulerRequests, receiver)
+        self.assertEqual(receiver.wait(1)[0], make_msg(Request.GRANTED))
+        pub.unregister()
+        self.assertNotIn(TEST_TOPIC, transport.latched)
+
+    def test_queue_per_publisher(self):
+        transport = LocalTransport()
+        busy = threading.Event()
+        resume = threading.Event()
+        receiver = Receiver()
+
+        def callback(msg):
+            busy.set()
+            resume.wait(WAIT_TIME)
+            receiver(msg)
+
+        transport.subscriber(TEST_TOPIC, SchedulerRequests, callback,
+                             queue_size=1)
+        pub1 = transport.publisher(TEST_TOPIC, SchedulerRequests)
+        pub2 = transport.publisher(TEST_TOPIC, SchedulerRequests)
+        pub1.publish(make_msg(Request.NEW))
+        self.assertTrue(busy.wait(WAIT_TIME))   # callback now blocked
+        pub1.publish(make_msg(Request.WAITING))
+        pub1.publish(make_msg(Request.GRANTED))     # replaces WAITING
+        pub2.publish(make_msg(Request.CANCELING))   # queued separately
+        resume.set()
+        msgs = receiver.wait(3)
+        self.assertEqual(msgs[0], make_msg(Request.NEW))
+        self.assertEqual(msgs[1], make_msg(Request.GRANTED))
+        self.assertEqual(msgs[2], make_msg(Request.CANCELING))
+        time.sleep(0.1)
+        self.assertEqual(len(receiver.msgs), 3)
+
+
+class TestLocalRequests(unittest.TestCase):
+    """End-to-end tests for requesters and a scheduler sharing a
+    LocalTransport.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        rospy.rostime.set_rostime_initialized(True)     # use wall time
+
+    def test_many_requesters(self):
+        transport = LocalTransport()
+        seen = Receiver()
+        resume = threading.Event()
+
+        def callback(rset):
+            resume.wait(WAIT_TIME)      # busy while the others send
+            if rset.requester_id not in seen.msgs:
+                seen(rset.requester_id)
+
+        sched = Scheduler(callback, transport=transport)
+        # no heartbeats during the test, only one message each
+        rqrs = [Requester(lambda rset: None, frequency=0.01,
+                          transport=transport)
+                for i in range(20)]
+        for rqr in rqrs:
+            rqr.new_request([TEST_RESOURCE])
+            rqr.send_requests()
+        time.sleep(0.1)                 # let every requester send
+        resume.set()
+        self.assertEqual(sorted(seen.wait(len(rqrs))),
+                         sorted([rqr.requester_id for rqr in rqrs]))
+        for rqr in rqrs:
+            rqr._unregister()
+        sched.timer.shutdown()
+
+    def test_shared_feedback(self):
+        transport = LocalTransport()
+
+        def callback(rset):
+            for rq in rset.values():
+                if rq.msg.status == Request.NEW:
+                    rq.grant(rq.msg.resources)
+
+        sched = Scheduler(callback, shared_feedback=True,
+                          transport=transport)
+        rqrs = [Requester(lambda rset: None, shared_feedback=True,
+                          transport=transport)
+                for i in range(3)]
+        rq_ids = [rqr.new_requests([{'resources': [TEST_RESOURCE]}],
+                                   send=True)[0]
+                  for rqr in rqrs]
+        for rqr, rq_id in zip(rqrs, rq_ids):
+            self.assertEqual(rqr.wait_for(rq_id, [Request.GRANTED],
+                                          WAIT_TIME),
+                             Request.GRANTED)
+            # feedback for the other requesters was ignored
+            self.assertEqual(list(rqr.rset.keys()), [rq_id])
+        for rqr in rqrs:
+            rqr._unregister()
+        sched.timer.shutdown()
+
+
+class _InterruptedHeader:
+    """ Slot header format for a ShmTransport reader, with a writer
+    starting just before the reader unpacks it. """
+    size = ShmTransport._SLOT_HEADER.size
+
+    def unpack_from(self, buff, offset):
+        seq = struct.unpack_from('<Q', buff, offset)[0]
+        struct.pack_into('<Q', buff, offset, seq + 1)   # odd: writing
+        return ShmTransport._SLOT_HEADER.unpack_from(buff, offset)
+
+
+class TestShmTransport(unittest.TestCase):
+    """Unit tests for the shared memory transport.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'shm')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_publish(self):
+        transport = ShmTransport(self.path, slots=4, slot_size=4096)
+        receiver = Receiver()
+        sub = transport.subscriber(TEST_TOPIC, SchedulerRequests, receiver)
+        pub = transport.publisher(TEST_TOPIC, SchedulerRequests)
+        other = transport.publisher('other_topic', SchedulerRequests)
+        other.publish(make_msg(Request.CANCELING))
+        pub.publish(make_msg())
+        self.assertEqual(receiver.wait(1)[0], make_msg())
+        pub.publish(make_msg(Request.GRANTED))
+        self.assertEqual(receiver.wait(2)[1], make_msg(Request.GRANTED))
+        sub.unregister()
+        big = make_msg()
+        big.requests *= 100
+        self.assertRaises(ValueError, pub.publish, big)
+
+    def test_slots(self):
+        transport = ShmTransport(self.path, slots=2, slot_size=4096)
+        pubs = [transport.publisher(TEST_TOPIC, SchedulerRequests)
+                for i in range(2)]
+        self.assertRaises(RuntimeError, transport.publisher,
+                          TEST_TOPIC, SchedulerRequests)
+        pubs[0].unregister()
+        transport.publisher(TEST_TOPIC, SchedulerRequests)
+
+    def test_other_process(self):
+        pid = os.fork()
+        if pid == 0:            # child process publishes, then exits
+            try:
+                pub = ShmTransport(self.path).publisher(TEST_TOPIC,
+                                                        SchedulerRequests)
+                pub.publish(make_msg(Request.GRANTED))
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        transport = ShmTransport(self.path)
+        self.assertEqual(transport.slots, 64)
+        receiver = Receiver()
+        transport.subscriber(TEST_TOPIC, SchedulerRequests, receiver)
+        self.assertEqual(receiver.wait(1)[0], make_msg(Request.GRANTED))
+        # the child's slot was released when it exited
+        self.assertEqual(transport.publisher(TEST_TOPIC,
+                                             SchedulerRequests).slot, 0)
+
+    def test_write_started(self):
+        transport = ShmTransport(self.path, slots=2, slot_size=4096)
+        pub = transport.publisher(TEST_TOPIC, SchedulerRequests)
+        pub.publish(make_msg())
+        transport._SLOT_HEADER = _InterruptedHeader()
+        transport._check(pub.slot)
+        self.assertNotIn(pub.slot, transport._seen)     # rejected
+        del transport._SLOT_HEADER
+        seq = struct.unpack_from('<Q', transport.map, pub.offset)[0]
+        struct.pack_into('<Q', transport.map, pub.offset, seq + 1)
+        transport._check(pub.slot)      # write finished
+        self.assertEqual(transport._seen[pub.slot], seq + 1)
+
+    def test_corrupt_slot(self):
+        transport = ShmTransport(self.path, slots=2, slot_size=4096)
+        receiver = Receiver()
+        transport.subscriber(TEST_TOPIC, SchedulerRequests, receiver)
+        pub = transport.publisher(TEST_TOPIC, SchedulerRequests)
+        pub.write(b'\xff' * 10)        # cannot be deserialized
+        time.sleep(0.05)
+        pub.publish(make_msg())         # still polling
+        self.assertEqual(receiver.wait(1), [make_msg()])
+
+    def test_concurrent_writer(self):
+        transport = ShmTransport(self.path, slots=2, slot_size=65536,
+                                 poll_interval=0.0)
+        msgs = [make_msg(Request.NEW), make_msg(Request.GRANTED)]
+        msgs[1].requests *= 50          # takes longer to write
+        received = []
+        transport.subscriber(TEST_TOPIC, SchedulerRequests, received.append)
+        pub = transport.publisher(TEST_TOPIC, SchedulerRequests)
+        deadline = time.time() + 0.5
+        count = 0
+        while time.time() < deadline:
+            pub.publish(msgs[count % 2])
+            count += 1
+        time.sleep(0.05)
+        self.assertGreater(len(received), 0)
+        for msg in received:            # never a torn copy
+            self.assertIn(msg, msgs)
+
+
+class TestShmRequests(unittest.TestCase):
+    """End-to-end tests for requesters and a scheduler in different
+    processes, sharing a ShmTransport file.
+
+    These tests do not require a running ROS core.
+    """
+
+    def setUp(self):
+        rospy.rostime.set_rostime_initialized(True)     # use wall time
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'shm')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_granted(self):
+        def callback(rset):
+            for rq in rset.values():
+                if rq.msg.status == Request.NEW:
+                    rq.grant(rq.msg.resources)
+
+        # Each process needs its own ShmTransport instance.
+        sched = Scheduler(callback, transport=ShmTransport(self.path,
+                                                           slots=16))
+        pid = os.fork()
+        if pid == 0:            # child process requests, then exits
+            status = 1
+            try:
+                rqr = Requester(lambda rset: None,
+                                transport=ShmTransport(self.path))
+                rq_id = rqr.new_requests([{'resources': [TEST_RESOURCE]}],
+                                         send=True)[0]
+                if (rqr.wait_for(rq_id, [Request.GRANTED], WAIT_TIME)
+                        == Request.GRANTED):
+                    status = 0
+            finally:
+                os._exit(status)
+        status = os.waitpid(pid, 0)[1]
+        self.assertEqual(status, 0)     # granted
+        sched.timer.shutdown()
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_transport',
+                    TestLocalTransport)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_local_requests',
+                    TestLocalRequests)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_shm_transport',
+                    TestShmTransport)
+    rosunit.unitrun('rocon_scheduler_requests',
+                    'test_shm_requests',
+                    TestShmRequests)